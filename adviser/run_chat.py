@@ -125,24 +125,24 @@ def load_qa_domain():
     return domain, [qa_nlu, qa_policy, qa_nlg]
 
 # test restaurant domain
-def load_restaurant_domain(backchannel: bool = False):
+def load_restaurant_domain(backchannel: bool = False, persist_changes: bool = False):
     from utils.domain.jsonlookupdomain import JSONLookupDomain
     from services.nlu.nlu import HandcraftedNLU
     from services.nlg.nlg import HandcraftedNLG
     from services.policy import HandcraftedPolicy
-    domain = JSONLookupDomain('restaurants_stuttgart', display_name="restaurants_stuttgart")
+    domain = JSONLookupDomain('restaurants_stuttgart', display_name="restaurants_stuttgart", persist_changes=persist_changes)
     restaurant_nlu = HandcraftedNLU(domain=domain)
     restaurant_bst = HandcraftedBST(domain=domain)
     restaurant_policy = HandcraftedPolicy(domain=domain)
     restaurant_nlg = load_nlg(backchannel=backchannel, domain=domain)
     return domain, [restaurant_nlu, restaurant_bst, restaurant_policy, restaurant_nlg]
 # test restaurant domain basic
-def load_restaurant_basic_domain(backchannel: bool = False):
+def load_restaurant_basic_domain(backchannel: bool = False, persist_changes: bool = False):
     from utils.domain.jsonlookupdomain import JSONLookupDomain
     from services.nlu.nlu import HandcraftedNLU
     from services.nlg.nlg import HandcraftedNLG
     from services.policy import HandcraftedPolicy
-    domain = JSONLookupDomain('restaurants_stuttgart_basic', display_name="restaurants_stuttgart_basic")
+    domain = JSONLookupDomain('restaurants_stuttgart_basic', display_name="restaurants_stuttgart_basic", persist_changes=persist_changes)
     restaurant_nlu = HandcraftedNLU(domain=domain)
     restaurant_bst = HandcraftedBST(domain=domain)
     restaurant_policy = HandcraftedPolicy(domain=domain)
@@ -160,6 +160,8 @@ if __name__ == "__main__":
     parser.add_argument('--tts', action='store_true', help="enable speech output")
     parser.add_argument('--bc', action='store_true', help="enable backchanneling (doesn't work with 'weather' domain")
     parser.add_argument('--debug', action='store_true', help="enable debug mode")
+    parser.add_argument('--persist', action='store_true',
+                        help="write ratings and reviews to the restaurant databases (otherwise they are lost on exit)")
     parser.add_argument('--log_file', choices=['dialogs', 'results', 'info', 'errors', 'none'], default="none",
                         help="specify file log level")
     parser.add_argument('--log', choices=['dialogs', 'results', 'info', 'errors', 'none'], default="results",
@@ -219,12 +221,12 @@ if __name__ == "__main__":
         
     # add restaurants
     if 'restaurants_stuttgart' in args.domains:
-        rs_domain, rs_services = load_restaurant_domain(backchannel=args.bc)
+        rs_domain, rs_services = load_restaurant_domain(backchannel=args.bc, persist_changes=args.persist)
         domains.append(rs_domain)
         services.extend(rs_services)
     # add restaurants basic
     if 'restaurants_stuttgart_basic' in args.domains:
-        rs_domain, rs_services = load_restaurant_basic_domain(backchannel=args.bc)
+        rs_domain, rs_services = load_restaurant_basic_domain(backchannel=args.bc, persist_changes=args.persist)
         domains.append(rs_domain)
         services.extend(rs_services)
 
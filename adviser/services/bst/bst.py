@@ -30,12 +30,21 @@ class HandcraftedBST(Service):
     A rule-based approach to belief state tracking.
     """
 
-    def __init__(self, domain=None, logger=None):
+    session_attributes = ('bs',)
+
+    def __init__(self, domain=None, logger=None, history_window: int = None):
+        """
+        Args:
+            domain (JSONLookupDomain): the domain
+            logger (DiasysLogger): the logger
+            history_window (int): number of turns kept in the belief state (default: all turns of the dialog)
+        """
         Service.__init__(self, domain=domain)
         self.logger = logger
-        self.bs = BeliefState(domain)
+        self.history_window = history_window
+        self.bs = BeliefState(domain, history_window)
 
-    @PublishSubscribe(sub_topics=["user_acts"], pub_topics=["beliefstate"])
+    @PublishSubscribe(sub_topics=["user_acts"], pub_topics=["beliefstate"], codecs={"beliefstate": "delta"})
     def update_bst(self, user_acts: List[UserAct] = None) \
             -> dict(beliefstate=BeliefState):
         """
@@ -79,7 +88,7 @@ class HandcraftedBST(Service):
                         the value is a new BeliefState object
         """
         # initialize belief state
-        self.bs = BeliefState(self.domain)
+        self.bs = BeliefState(self.domain, self.history_window)
 
     def _reset_informs(self, acts: List[UserAct]):
         """
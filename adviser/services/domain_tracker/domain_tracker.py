@@ -31,6 +31,8 @@ class DomainTracker(Service):
         Current implmentation uses keywords to switch domains.
     """
 
+    session_attributes = ('turn', 'current_domain')
+
     def __init__(self, domains: List[Domain], greet_on_first_turn: bool = False):
         Service.__init__(self, domain="")
         self.domains = domains
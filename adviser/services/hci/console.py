@@ -37,6 +37,8 @@ class ConsoleInput(Service):
     Waits for the built-in input function to return a non-empty text.
     """
 
+    session_attributes = ('interaction_count',)
+
     def __init__(self, domain: Domain = None, conversation_log_dir: str = None, language: Language = None):
         Service.__init__(self, domain=domain)
         # self.language = language
@@ -30,6 +30,7 @@ from utils.domain.domain import Domain
 from utils.domain.jsonlookupdomain import JSONLookupDomain
 from services.service import PublishSubscribe
 from services.service import Service
+from services.service import QueuePolicy
 
 
 class VideoFeatureExtractor(Service):
@@ -47,7 +48,8 @@ class VideoFeatureExtractor(Service):
         self.PREDICTOR = dlib.shape_predictor(predictor_file)
 
     @PublishSubscribe(queued_sub_topics=["video_input"], sub_topics=["user_acts"],
-                      pub_topics=["fl_features"])
+                      pub_topics=["fl_features"],
+                      queue_policies={"video_input": QueuePolicy(maxlen=60, every=2)})
     def extract_fl_features(self, video_input, user_acts):
         """TODO
 
@@ -59,7 +61,7 @@ class VideoFeatureExtractor(Service):
         print(f'VIDEO FEATURE ENTER, len(video_input): {len(video_input)}')
         features = []
         aggregated_feats = None
-        for frame in video_input[::2]:
+        for frame in video_input:
             frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
             frame = self.CLAHE.apply(frame)
             faces = self.DETECTOR(frame, 1)
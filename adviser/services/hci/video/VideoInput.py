@@ -81,7 +81,7 @@ class VideoInput(Service):
             print("Starting video capture...")
             self.capture_thread.start()
 
-    @PublishSubscribe(pub_topics=['video_input'])
+    @PublishSubscribe(pub_topics=['video_input'], codecs={'video_input': 'raw'})
     def publish_img(self, rgb_img) -> dict(video_input=List[object]):
         """
         Helper function to publish images from a loop.
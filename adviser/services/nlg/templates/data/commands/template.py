@@ -123,8 +123,8 @@ class Template(Command):
                     # if there is an instance search for corresponding value in database
                     if variables.variable_dict['name'] != 'none':
                         domain = variables.global_memory.domain
-                        query = f"SELECT {slot} FROM {domain.get_domain_name()} WHERE name='{variables.variable_dict['name']}' COLLATE NOCASE"
-                        val = domain.query_db(query)[0][slot]
+                        query = f"SELECT {slot} FROM {domain.get_domain_name()} WHERE name=? COLLATE NOCASE"
+                        val = domain.query_db(query, (variables.variable_dict['name'],))[0][slot]
                         slot_value_pairs.append((slot, val))
                     else:
                         # if there is no instance print all possible requested values
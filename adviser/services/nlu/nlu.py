@@ -65,6 +65,9 @@ class HandcraftedNLU(Service):
 
     """
 
+    session_attributes = ('sys_act_info', 'user_acts', 'slots_informed', 'slots_requested',
+                          'slots_negative_informed', 'req_everything')
+
     def __init__(self, domain: JSONLookupDomain, logger: DiasysLogger = DiasysLogger(),
                  language: Language = None):
         """
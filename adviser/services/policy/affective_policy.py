@@ -31,6 +31,9 @@ class EmotionPolicy(Service):
         should give
 
     """
+
+    session_attributes = ('first_turn',)
+
     def __init__(self, domain: JSONLookupDomain = None, logger: DiasysLogger = DiasysLogger()):
         """
         Initializes the policy
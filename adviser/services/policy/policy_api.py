@@ -38,6 +38,8 @@ class HandcraftedPolicy(Service):
     The classes will probably be merged in the future.
     """
 
+    session_attributes = ('first_turn', 'last_action', 'prev_sys_act', 'current_suggestions', 's_index')
+
     def __init__(self, domain: LookupDomain, logger: DiasysLogger = DiasysLogger()):
         """
         Initializes the policy
@@ -171,7 +173,7 @@ class HandcraftedPolicy(Service):
         # has given so far
         else:
             constraints, _ = self._get_constraints(beliefstate)
-            return self.domain.find_entities(constraints)
+            return beliefstate.find_entities(constraints)
 
     def _get_name(self, beliefstate: BeliefState):
         """Finds if an entity has been suggested by the system (in the form of an offer candidate)
@@ -26,7 +26,7 @@ from services.service import PublishSubscribe
 from services.service import Service
 from utils import SysAct, SysActionType
 from utils.beliefstate import BeliefState
-from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.domain.jsonlookupdomain import JSONLookupDomain, NEAR_SLOT, OPEN_AT_SLOT
 from utils.logger import DiasysLogger
 from utils.useract import UserActionType
 
@@ -50,13 +50,17 @@ class HandcraftedPolicy(Service):
 
     """
 
+    session_attributes = ('first_turn', 'turns', 'current_suggestions', 's_index')
+
     def __init__(self, domain: JSONLookupDomain, logger: DiasysLogger = DiasysLogger(),
-                 max_turns: int = 25):
+                 max_turns: int = 25, offer_open_only: bool = False):
         """
         Initializes the policy
 
         Arguments:
             domain {domain.jsonlookupdomain.JSONLookupDomain} -- Domain
+            offer_open_only {bool} -- if True, only entities which are open right now are offered
+                                      (for domains with opening hours)
 
         """
         self.first_turn = True
@@ -66,6 +70,7 @@ class HandcraftedPolicy(Service):
         self.domain_key = domain.get_primary_key()
         self.logger = logger
         self.max_turns = max_turns
+        self.offer_open_only = offer_open_only
 
     def dialog_start(self):
         """
@@ -326,9 +331,7 @@ class HandcraftedPolicy(Service):
             #print("(policy.py) given_rating:", given_rating)
             self.domain.enter_rating(given_rating, self._get_name(beliefstate))
         if beliefstate['review']:
-            review = beliefstate['review']
-            review = review.replace("'", ' ').replace("\"", ' ')
-            self.domain.enter_review(review, self._get_name(beliefstate))
+            self.domain.enter_review(beliefstate['review'], self._get_name(beliefstate))
     
     def _save_start_point(self, beliefstate: BeliefState):
         """
@@ -397,14 +400,19 @@ class HandcraftedPolicy(Service):
         name = self._get_name(beliefstate)
         # if yes and the user is asking for info about a specific entity, generate a query to get
         # that info for the slots they have specified
-        if name and beliefstate['requests']:
-            requested_slots = beliefstate['requests']
+        if name and beliefstate.requested_slots():
+            requested_slots = beliefstate.requested_slots()
             return self.domain.find_info_about_entity(name, requested_slots)
         # otherwise, issue a query to find all entities which satisfy the constraints the user
         # has given so far
         else:
-            constraints, _ = self._get_constraints(beliefstate)
-            return self.domain.find_entities(constraints)
+            constraints = dict(beliefstate.constraints())
+            if beliefstate['start_point'] and isinstance(self.domain, JSONLookupDomain):
+                # offer the entities closest to the user first
+                constraints[NEAR_SLOT] = beliefstate['start_point']
+            if self.offer_open_only:
+                constraints[OPEN_AT_SLOT] = 'now'
+            return beliefstate.find_entities(constraints)
     
     def _get_name(self, beliefstate: BeliefState):
         """Finds if an entity has been suggested by the system (in the form of an offer candidate)
@@ -419,16 +427,9 @@ class HandcraftedPolicy(Service):
 
         -LV
         """
-        name = None
-        prim_key = self.domain.get_primary_key()
-        if prim_key in beliefstate['informs']:
-            possible_names = beliefstate['informs'][prim_key]
-            if possible_names == {}:
-                name = None
-            else:
-                name = sorted(possible_names.items(), key=lambda kv: kv[1], reverse=True)[0][0]
+        name = beliefstate.top_value(self.domain.get_primary_key())
         # if the user is tyring to query by name
-        else:
+        if name is None:
             if self.s_index < len(self.current_suggestions):
                 current_suggestion = self.current_suggestions[self.s_index]
                 if current_suggestion:
@@ -444,24 +445,12 @@ class HandcraftedPolicy(Service):
 
         Return:
             (tuple): dict of user requested slot names and their values and list of slots the user
-                     doesn't care about
+                     doesn't care about (views of the belief state, which must not be modified)
 
         --LV
         """
-        slots = {}
-        # parts of the belief state which don't contain constraints
-        dontcare = [slot for slot in beliefstate['informs'] if "dontcare" in beliefstate["informs"][slot]]
-        informs = beliefstate["informs"]
-        slots = {}
         # TODO: consider threshold of belief for adding a value? --LV
-        for slot in informs:
-            if slot not in dontcare:
-                for value in informs[slot]:
-                    # save values as lists to be able to handle multiple values
-                    if slot not in slots:
-                        slots[slot] = []
-                    slots[slot].append(value)
-        return slots, dontcare
+        return beliefstate.constraints(), beliefstate.dontcare_slots()
 
     def _get_open_slot(self, beliefstate: BeliefState):
         """For a hello statement we need to be able to figure out what slots the user has not yet
@@ -499,7 +488,7 @@ class HandcraftedPolicy(Service):
         """
         sys_state = {}
         # Assuming this happens only because domain is not actually active --LV
-        if UserActionType.Bad in beliefstate['user_acts'] or beliefstate['requests'] \
+        if UserActionType.Bad in beliefstate['user_acts'] or beliefstate.requested_slots() \
                 and not self._get_name(beliefstate):
             sys_act = SysAct()
             sys_act.type = SysActionType.Bad
@@ -511,8 +500,8 @@ class HandcraftedPolicy(Service):
             sys_act.type = SysActionType.Bad
             return sys_act, {'last_act': sys_act}
 
-        elif self.domain.get_primary_key() in beliefstate['informs'] \
-                and not beliefstate['requests']:
+        elif beliefstate.top_value(self.domain.get_primary_key()) is not None \
+                and not beliefstate.requested_slots():
             sys_act = SysAct()
             sys_act.type = SysActionType.InformByName
             sys_act.add_value(self.domain.get_primary_key(), self._get_name(beliefstate))
@@ -556,7 +545,7 @@ class HandcraftedPolicy(Service):
         """
         sys_act = SysAct()
         # if there is more than one result
-        if len(q_res) > 1 and not beliefstate['requests']:
+        if len(q_res) > 1 and not beliefstate.requested_slots():
             constraints, dontcare = self._get_constraints(beliefstate)
             # Gather all the results for each column
             temp = {key: [] for key in q_res[0].keys()}
@@ -645,7 +634,7 @@ class HandcraftedPolicy(Service):
         --LV
         """
 
-        if beliefstate["requests"] or self.domain.get_primary_key() in beliefstate['informs']:
+        if beliefstate.requested_slots() or beliefstate.top_value(self.domain.get_primary_key()) is not None:
             self._convert_inform_by_primkey(q_results, sys_act, beliefstate)
 
         elif UserActionType.RequestAlternatives in beliefstate['user_acts']:
@@ -680,7 +669,6 @@ class HandcraftedPolicy(Service):
                     res = '\n'
                     res += "\n".join("{}: {}".format(k, v) for k, v in opening_hours.items())
                 if k == 'reviews' and res != 'not available':
-                    res = res.replace("'", "\"")
                     reviews = json.loads(res)
                     res = '\n'
                     res += "\n".join("{}".format(rev) for rev in reviews)
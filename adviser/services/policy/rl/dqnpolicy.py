@@ -19,6 +19,7 @@
 
 import copy
 import os
+import threading
 from typing import List, Type
 
 import torch
@@ -41,6 +42,8 @@ from utils.useract import UserActionType
 
 class DQNPolicy(RLPolicy, Service):
 
+    session_attributes = ('turns', 'last_sys_act', 'sys_state', 'episode', 'sim_goal')
+
     def __init__(self, domain: JSONLookupDomain,
                  architecture: NetArchitecture = NetArchitecture.DUELING,
                  hidden_layer_sizes: List[int] = [256, 700, 700],  # vanilla architecture
@@ -117,10 +120,12 @@ class DQNPolicy(RLPolicy, Service):
         self.epsilon = self.epsilon_start
         self.turns = 0
         self.cumulative_train_dialogs = -1
+        self._train_lock = threading.Lock()  # dialogs of concurrent sessions end in different threads
 
     def dialog_start(self, dialog_start=False):
         self.turns = 0
         self.last_sys_act = None
+        self.episode = []
         if self.is_training:
             self.cumulative_train_dialogs += 1
         self.sys_state = {
@@ -164,10 +169,11 @@ class DQNPolicy(RLPolicy, Service):
         """
             clean up needed at the end of a dialog
         """
-        self.end_dialog(self.sim_goal)
-        if self.is_training:
-            self.total_train_dialogs += 1
-        self.train_batch()
+        with self._train_lock:
+            self.end_dialog(self.sim_goal)
+            if self.is_training:
+                self.total_train_dialogs += 1
+            self.train_batch()
 
     @PublishSubscribe(sub_topics=["beliefstate"], pub_topics=["sys_act", "sys_state"])
     def choose_sys_act(self, beliefstate: BeliefState = None) -> dict(sys_act=SysAct):
@@ -130,6 +130,8 @@ class RLPolicy(object):
         self.buffer = buffer_cls(buffer_size, batch_size, self.state_dim,
                                  discount_gamma=discount_gamma, device=device)
         self.sys_state = {}
+        # transitions of the current dialog, added to the replay memory when the dialog ended
+        self.episode = []
 
         self.last_sys_act = None
 
@@ -238,7 +240,7 @@ class RLPolicy(object):
         constraints = beliefstate.get_most_probable_inf_beliefs(consider_NONE=True, threshold=0.7,
                                                                 max_results=1)
 
-        db_matches = self.domain.find_entities(constraints, requested_slots=constraints)
+        db_matches = beliefstate.find_entities(constraints, requested_slots=constraints)
         if not db_matches:
             # no matching entity found -> return inform with primary key=none
             # and other constraints
@@ -331,11 +333,8 @@ class RLPolicy(object):
         act.type = SysActionType.InformByName
 
         # get most probable entity primary key
-        if self.primary_key in beliefstate['informs']:
-            primkeyval = sorted(
-                beliefstate["informs"][self.primary_key].items(),
-                key=lambda kv: kv[1], reverse=True)[0][0]
-        else:
+        primkeyval = beliefstate.top_value(self.primary_key)
+        if primkeyval is None:
             # try to use previously informed name instead
             primkeyval = self.sys_state['lastInformedPrimKeyVal']
             # TODO change behaviour from here, because primkeyval might be "**NONE**" and this might be an entity in the database
@@ -343,13 +342,13 @@ class RLPolicy(object):
         constraints = beliefstate.get_most_probable_inf_beliefs(consider_NONE=True, threshold=0.7,
                                                                 max_results=1)
 
-        db_matches = self.domain.find_entities({**constraints, self.primary_key: primkeyval})
+        db_matches = beliefstate.find_entities({**constraints, self.primary_key: primkeyval})
         # NOTE usually not needed to give all constraints (shouldn't make a difference)
         if not db_matches:
             # select random entity if none could be found
             primkeyvals = self.domain.get_possible_values(self.primary_key)
             primkeyval = common.random.choice(primkeyvals)
-            db_matches = self.domain.find_entities(
+            db_matches = beliefstate.find_entities(
                 constraints, self.domain.get_requestable_slots())
             # use knowledge from current belief state
 
@@ -369,10 +368,8 @@ class RLPolicy(object):
             db_match[self.primary_key], requested_slots=self.domain.get_requestable_slots())[0]
 
         # get slots requested by user
-        usr_requests = beliefstate.get_requested_slots()
-        # remove primary key (to exlude from minimum number) since it is added anyway at the end
-        if self.primary_key in usr_requests:
-            usr_requests.remove(self.primary_key)
+        # without primary key (to exlude from minimum number) since it is added anyway at the end
+        usr_requests = [slot for slot in beliefstate.requested_slots() if slot != self.primary_key]
         if usr_requests:
             # add user requested values into system act using db result
             for req_slot in common.numpy.random.choice(usr_requests, min(4, len(usr_requests)),
@@ -413,7 +410,7 @@ class RLPolicy(object):
                                                                max_results=1)
         filtered_slot_values = self._remove_dontcare_slots(candidates)
         # query db by constraints
-        db_matches = self.domain.find_entities(candidates)
+        db_matches = beliefstate.find_entities(candidates)
         if not db_matches:
             # no results found
             for slot in common.numpy.random.choice(
@@ -529,7 +526,7 @@ class RLPolicy(object):
         turn_reward = self.evaluator.get_turn_reward()
 
         if self.is_training:
-            self.buffer.store(state_vector, sys_act_idx, turn_reward, terminal=False)
+            self.episode.append((state_vector, sys_act_idx, turn_reward, False))
 
     def _expand_hello(self):
         """ Call this function when a dialog begins """
@@ -543,15 +540,16 @@ class RLPolicy(object):
 
     def end_dialog(self, sim_goal: Goal):
         """ Call this function when a dialog ended """
-        if sim_goal is None:
-            # real user interaction, no simulator - don't have to evaluate
-            # anything, just reset counters
-            return
-
-        final_reward, success = self.evaluator.get_final_reward(sim_goal, logging=False)
-
-        if self.is_training:
-            self.buffer.store(None, None, final_reward, terminal=True)
+        # real user interaction (no simulator goal): don't have to evaluate anything
+        if sim_goal is not None:
+            final_reward, success = self.evaluator.get_final_reward(sim_goal, logging=False)
+            if self.is_training:
+                self.episode.append((None, None, final_reward, True))
+
+        # store the dialog's transitions at once, so those of concurrent dialogs don't interleave
+        for state_vector, sys_act_idx, reward, terminal in self.episode:
+            self.buffer.store(state_vector, sys_act_idx, reward, terminal=terminal)
+        self.episode = []
 
         # if self.writer is not None:
         #     self.writer.add_scalar('buffer/items', len(self.buffer),
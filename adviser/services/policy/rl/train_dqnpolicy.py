@@ -42,7 +42,7 @@ from services.policy import DQNPolicy
 from services.stats.evaluation import PolicyEvaluator
 from utils.domain.jsonlookupdomain import JSONLookupDomain
 from utils import DiasysLogger, LogLevel
-from services.service import DialogSystem
+from services.service import InProcessDialogSystem
 from torch.utils.tensorboard import SummaryWriter
 
 from utils import common
@@ -84,7 +84,7 @@ def train(domain_name: str, log_to_file: bool, seed: int, train_epochs: int, tra
     evaluator = PolicyEvaluator(domain=domain, use_tensorboard=use_tensorboard,
                                 experiment_name=domain_name, logger=logger,
                                 summary_writer=summary_writer)
-    ds = DialogSystem(services=[user, bst, policy, evaluator], protocol='tcp')
+    ds = InProcessDialogSystem(services=[user, bst, policy, evaluator])
     # ds.draw_system_graph()
 
     error_free = ds.is_error_free_messaging_pipeline()
@@ -20,12 +20,17 @@
 import copy
 import datetime
 import inspect
+import json
 import pickle
 import threading
 import time
+import uuid
+import zlib
+from queue import Queue
 from threading import Thread
-from typing import List, Dict, Union, Iterable, Any
+from typing import List, Dict, Union, Iterable, Any, Hashable, Tuple, NamedTuple
 
+import numpy
 import zmq
 from zmq import Context, Socket
 from zmq.devices import ThreadProxy, ProcessProxy
@@ -35,49 +40,594 @@ from utils.logger import DiasysLogger
 from utils.topics import Topic
 
 
-def _send_msg(pub_channel: Socket, topic: str, content: Any):
+_session = threading.local()
+
+
+def get_session_id():
+    """ Returns the id of the dialog session the calling thread is currently handling.
+
+    Receiver threads set this before calling a decorated function, so services running in a
+    multi-session `DialogSystem` can look up which dialog a message belongs to.
+
+    Returns:
+        The session id (`None` for the default session, i.e. single-dialog operation)
+    """
+    return getattr(_session, 'id', None)
+
+
+def _set_session_id(session_id: Hashable):
+    """ Sets the id of the dialog session handled by the calling thread """
+    _session.id = session_id
+
+
+class Codec:
+    """ Base class for message content serializers.
+
+    A codec turns message content into a list of frames and back. Frames are sent as separate parts of a
+    zmq multipart message without copying them, so a codec should return large payloads (e.g. array memory)
+    as frames of their own instead of embedding them into a single bytes object.
+    Register custom codecs with `register_codec` to make them selectable by name.
+    """
+
+    def encode(self, content: Any) -> List[Any]:
+        """ Serializes the content.
+
+        Args:
+            content (Any): message content
+
+        Returns:
+            List of objects supporting the buffer protocol (e.g. `bytes`, `memoryview`)
+        """
+        raise NotImplementedError
+
+    def decode(self, frames: List[memoryview]) -> Any:
+        """ Restores the message content from the frames created by `encode`.
+
+        Args:
+            frames (List[memoryview]): received frames
+
+        Returns:
+            The message content
+        """
+        raise NotImplementedError
+
+
+class PickleCodec(Codec):
+    """ Default codec: pickle protocol 5, sending the memory of buffer-backed objects (e.g. numpy arrays)
+        out-of-band as separate frames, so they are neither copied into the pickle stream on sending nor copied
+        out of the received frames. """
+
+    def encode(self, content: Any) -> List[Any]:
+        buffers = []
+        data = pickle.dumps(content, protocol=5, buffer_callback=buffers.append)
+        return [data] + [buffer.raw() for buffer in buffers]
+
+    def decode(self, frames: List[memoryview]) -> Any:
+        return pickle.loads(frames[0], buffers=frames[1:])
+
+
+class MsgpackCodec(Codec):
+    """ Codec for plain data (`dict`, `list`, `str`, numbers, ...), e.g. to exchange messages with non-python services.
+        Note that tuples are received as lists. Requires the `msgpack` package. """
+
+    def encode(self, content: Any) -> List[Any]:
+        import msgpack
+        return [msgpack.packb(content, use_bin_type=True)]
+
+    def decode(self, frames: List[memoryview]) -> Any:
+        import msgpack
+        return msgpack.unpackb(frames[0], raw=False)
+
+
+class RawArrayCodec(Codec):
+    """ Codec for single numpy arrays: sends dtype and shape followed by the raw array memory.
+        The received array is a view on the received frame (no copy).
+        Any other content (e.g. `None`) falls back to `PickleCodec`. """
+
+    def encode(self, content: Any) -> List[Any]:
+        if not isinstance(content, numpy.ndarray) or content.dtype.hasobject:
+            return [pickle.dumps(None)] + _codecs['pickle'].encode(content)
+        content = numpy.ascontiguousarray(content)
+        return [pickle.dumps((content.dtype.str, content.shape)), memoryview(content).cast('B')]
+
+    def decode(self, frames: List[memoryview]) -> Any:
+        header = pickle.loads(frames[0])
+        if header is None:
+            return _codecs['pickle'].decode(frames[1:])
+        dtype, shape = header
+        return numpy.frombuffer(frames[1], dtype=dtype).reshape(shape)
+
+
+class _StateMessage(NamedTuple):
+    """ Message of a stateful topic (see `DeltaCodec`) """
+    seq: int  # number of the message within its topic and dialog session
+    snapshot: bool  # `True` if `payload` is the full content, `False` if it is a delta
+    payload: Any
+    codec: Any = None  # the receiving `DeltaCodec` (set on decoding)
+
+
+class DeltaCodec(Codec):
+    """ Codec for stateful topics: instead of the full content, the publisher sends the changes (delta) since its
+    previous message of the same topic and dialog session, numbered by a sequence number.
+    Each receiving service keeps a mirror of the content per topic and session, applies the deltas to it and passes
+    the mirror to its subscriber functions, so the message size doesn't grow with the content (e.g. a long dialog).
+    A full snapshot is sent with the first message of a session and resent whenever a receiver asks for it because
+    it has no mirror yet (e.g. it joined in the middle of a dialog) or missed a message.
+
+    By default, the content implements the delta protocol itself (see `utils.beliefstate.BeliefState`):
+        * `delta_checkpoint()`: returns what the changes of the next message are computed from
+        * `delta_since(checkpoint)`: returns the changes since the checkpoint (`None` to send a snapshot instead)
+        * `apply_delta(delta)`: applies the changes to a mirror
+    Override `checkpoint`, `diff` and `patch` to support other types. Snapshots and deltas are pickled.
+
+    Notes:
+        * Subscriber functions of a service share the mirror, so changes they make to it are kept until the next
+          snapshot (like with `InProcessDialogSystem`, which passes the content itself and never sends deltas).
+    """
+
+    def encode(self, content: Any) -> List[Any]:
+        return _codecs['pickle'].encode(content)
+
+    def decode(self, frames: List[memoryview]) -> Any:
+        return _codecs['pickle'].decode(frames)._replace(codec=self)
+
+    def checkpoint(self, content: Any) -> Any:
+        """ Returns what the publisher keeps to compute the changes of its next message from
+
+        Args:
+            content (Any): the published content
+        """
+        return content.delta_checkpoint()
+
+    def diff(self, checkpoint: Any, content: Any) -> Any:
+        """ Returns the changes of the content since the checkpoint
+
+        Args:
+            checkpoint (Any): the checkpoint of the previous message (see `checkpoint`)
+            content (Any): the content to publish
+
+        Returns:
+            the delta or `None` if a snapshot has to be sent
+        """
+        return content.delta_since(checkpoint)
+
+    def patch(self, mirror: Any, delta: Any) -> Any:
+        """ Applies a delta to the mirror of a receiver
+
+        Args:
+            mirror (Any): the content reconstructed from the previous messages
+            delta (Any): the changes (see `diff`)
+
+        Returns:
+            the updated mirror
+        """
+        mirror.apply_delta(delta)
+        return mirror
+
+
+_codecs = {'pickle': PickleCodec(), 'msgpack': MsgpackCodec(), 'raw': RawArrayCodec(), 'delta': DeltaCodec()}
+
+
+def register_codec(name: str, codec: Codec):
+    """ Makes a codec selectable by name (see the `codecs` argument of `PublishSubscribe`).
+        Has to be called on the sending and on the receiving node.
+
+    Args:
+        name (str): *UNIQUE* codec name
+        codec (Codec): codec instance
+    """
+    _codecs[name] = codec
+
+
+_compressors = {'zlib': (zlib.compress, zlib.decompress)}
+try:
+    import lz4.frame
+    _compressors['lz4'] = (lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass
+
+
+def register_compressor(name: str, compress, decompress):
+    """ Makes a compression algorithm selectable by name (see the `compression` argument of `RemoteService`).
+
+    Args:
+        name (str): *UNIQUE* compression name
+        compress: function compressing a buffer to `bytes`
+        decompress: function restoring the original `bytes` from the compressed buffer
+    """
+    _compressors[name] = (compress, decompress)
+
+
+def _send_msg(pub_channel: Socket, topic: str, content: Any, session_id: Hashable = None, codec: str = 'pickle',
+              compression: Tuple[str, int] = None):
     """ Serializes message, appends current timespamp and sends it over the specified channel to the specified topic.
         Use this function for all internal message passing.
 
+        The message consists of the topic frame, a header frame (timestamp, session id, codec name, compression name)
+        and the frames produced by the codec, which are sent without copying them unless they are compressed.
+
     Args:
         pub_channel (Socket): publisher socket
         topic (str): topic to publish to
         content (Any): message content
+        session_id (Hashable): id of the dialog session the message belongs to (`None` for the default session)
+        codec (str): name of the codec used to serialize the content (see `register_codec`)
+        compression (Tuple[str, int]): if not `None`, name of the compression algorithm and the minimum size in bytes
+                                       of the serialized content to compress it (see `register_compressor`)
+
+    Returns:
+        Size of the sent content in bytes
      """
     timestamp = datetime.datetime.now().timestamp()  # current timestamp as POSIX float
-    data = pickle.dumps((timestamp, content))
-    pub_channel.send_multipart((bytes(topic, encoding="ascii"), data))
+    frames = _codecs[codec].encode(content)
+    if compression and sum(memoryview(frame).nbytes for frame in frames) >= compression[1]:
+        compress = _compressors[compression[0]][0]
+        frames = [compress(frame) for frame in frames]
+        compression = compression[0]
+    else:
+        compression = None
+    header = pickle.dumps((timestamp, session_id, codec, compression))
+    pub_channel.send_multipart([bytes(topic, encoding="ascii"), header] + frames, copy=False)
+    return sum(memoryview(frame).nbytes for frame in frames)
+
+
+def _recv_msg(sub_channel: Socket, accept=None):
+    """ Blocks until a message is received via the specified subscriber channel and deserializes it.
+        Counterpart to `_send_msg`.
+
+    Args:
+        sub_channel (Socket): subscriber socket
+        accept: if not `None`, function called with the topic and session id read from the header frame;
+                if it returns `False`, the message is dropped without decompressing and decoding its content
+
+    Returns:
+        tuple(topic, timestamp, session_id, content) or `None` if the message was dropped
+    """
+    msg = sub_channel.recv_multipart(copy=False)
+    timestamp, session_id, codec, compression = pickle.loads(msg[1].buffer)
+    topic = msg[0].bytes.decode("ascii")
+    if accept is not None and not accept(topic, session_id):
+        return None
+    frames = [frame.buffer for frame in msg[2:]]
+    if compression:
+        decompress = _compressors[compression][1]
+        frames = [memoryview(decompress(frame)) for frame in frames]
+    content = _codecs[codec].decode(frames)
+    return topic, timestamp, session_id, content
+
+
+def _encode_session_id(session_id: Hashable) -> bytes:
+    """ Encodes a session id for control frames without pickling the common cases (`None`, `str`, `int`) """
+    if session_id is None:
+        return b""
+    if isinstance(session_id, str):
+        return b"s" + session_id.encode("utf-8")
+    if type(session_id) is int:
+        return b"i" + str(session_id).encode("ascii")
+    return b"p" + pickle.dumps(session_id)
+
+
+def _decode_session_id(frame: bytes) -> Hashable:
+    """ Counterpart to `_encode_session_id` """
+    if not frame:
+        return None
+    kind, data = frame[:1], frame[1:]
+    if kind == b"s":
+        return data.decode("utf-8")
+    if kind == b"i":
+        return int(data)
+    return pickle.loads(data)
+
+
+def _send_ctrl(pub_channel: Socket, topic: str, session_id: Hashable = None, content: bool = True):
+    """ Sends a control message (START, END, TERMINATE, READY, ACK, ...) over the control plane.
+        Control messages only carry a flag, so they consist of three plain frames (topic, session id, flag)
+        instead of a pickled header and payload.
+
+    Args:
+        pub_channel (Socket): publisher socket of the control plane
+        topic (str): control topic
+        session_id (Hashable): id of the dialog session the control message refers to
+        content (bool): control flag (e.g. `True` for ACK, `False` for NACK)
+    """
+    pub_channel.send_multipart([bytes(topic, encoding="ascii"), _encode_session_id(session_id),
+                                b"\x01" if content else b"\x00"])
+
 
+def _recv_ctrl(sub_channel: Socket):
+    """ Blocks until a control message is received via the specified subscriber channel.
+        Counterpart to `_send_ctrl`.
 
-def _send_ack(pub_channel: Socket, topic: str, content: bool = True):
+    Args:
+        sub_channel (Socket): subscriber socket of the control plane
+
+    Returns:
+        tuple(topic, session_id, content)
+    """
+    topic, session_id, content = sub_channel.recv_multipart()
+    return topic.decode("ascii"), _decode_session_id(session_id), content == b"\x01"
+
+
+def _send_ack(pub_channel: Socket, topic: str, content: bool = True, session_id: Hashable = None):
     """ Sends an acknowledge-message to the specified channel (ACK).
-        Is used together with `_recv_ack` to synchronize services (waiting for ACK messages).
+        Is used together with `_broadcast_and_gather` to synchronize services (waiting for ACK messages).
     
     Args:
         pub_channel (Socket): publisher socket
         topic (str): topic to send ACK to
         content (bool): for ACK's, content is either `True` (ACK) or `False` (NACK)
+        session_id (Hashable): id of the dialog session that is acknowledged
     """
-    _send_msg(pub_channel, f"ACK/{topic}", content)
+    _send_ctrl(pub_channel, f"ACK/{topic}", session_id, content)
 
 
-def _recv_ack(sub_channel: Socket, topic: str, expected_content: bool = True):
-    """ Blocks until an acknowledge-message for the specified topic with the expected content is received via the
-        specified subscriber channel. 
-    
+def _broadcast_and_gather(pub_channel: Socket, sub_channel: Socket, topics: Iterable[str],
+                          session_id: Hashable = None, timeout: float = None):
+    """ Control barrier: sends a control message to all specified topics at once, then blocks until
+        an acknowledge-message (ACK) was received for each of them via the specified subscriber channel.
+        Use together with `_send_ack` on the receiving side.
+
     Args:
-        sub_channel (Socket): subscriber socket
-        topic (str): topic to listen for ACK's
-        expected_content (bool): are we expecting `True` (ACK) or `False` (NACK)
+        pub_channel (Socket): publisher socket
+        sub_channel (Socket): subscriber socket (subscribed to the ACK's of all `topics`)
+        topics (Iterable[str]): control topics to send to
+        session_id (Hashable): id of the dialog session the control messages refer to
+        timeout (float): maximum time to wait for all ACK's in seconds (`None`: wait forever)
+
+    Raises:
+        TimeoutError: if not all ACK's were received in time
+    """
+    pending = set()
+    for topic in topics:
+        _send_ctrl(pub_channel, topic, session_id)
+        pending.add(f"ACK/{topic}")
+    deadline = None if timeout is None else time.time() + timeout
+    while pending:
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0 or not sub_channel.poll(remaining * 1000):
+                missing = sorted(topic[len("ACK/"):] for topic in pending)
+                raise TimeoutError(f"no ACK received for control topics {missing} (session {session_id})")
+        recv_topic, recv_session_id, content = _recv_ctrl(sub_channel)
+        if recv_session_id == session_id and content:
+            pending.discard(recv_topic)
+
+
+class QueuePolicy:
+    """
+    Limits the messages collected for a queued subscription topic between two calls of the subscriber function
+    (see the `queue_policies` argument of `PublishSubscribe`).
+
+    Examples:
+        * keep the latest N messages (drop oldest): `QueuePolicy(maxlen=N)`
+        * downsample, keeping every k-th message: `QueuePolicy(every=k)` (combinable with `maxlen`)
+        * keep the first N messages (drop newest): `QueuePolicy(maxlen=N, overflow=QueuePolicy.DROP_NEWEST)`
     """
-    ack_topic = topic if topic.startswith("ACK/") else f"ACK/{topic}"
-    while True:
-        msg = sub_channel.recv_multipart(copy=True)
-        recv_topic = msg[0].decode("ascii")
-        content = pickle.loads(msg[1])[1]  # pickle.loads(msg) -> tuple(timestamp, content) -> return content
-        if recv_topic == ack_topic:
-            if content == expected_content:
+
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+
+    def __init__(self, maxlen: int = None, overflow: str = DROP_OLDEST, every: int = 1):
+        """
+        Args:
+            maxlen (int): maximum number of queued messages (`None`: unbounded)
+            overflow (str): what to drop if a message arrives while `maxlen` messages are queued
+                            (`QueuePolicy.DROP_OLDEST` or `QueuePolicy.DROP_NEWEST`)
+            every (int): only queue every k-th received message (counting from the first message after a call)
+        """
+        assert maxlen is None or maxlen > 0, "maxlen has to be positive"
+        assert overflow in (QueuePolicy.DROP_OLDEST, QueuePolicy.DROP_NEWEST), f"unknown overflow policy {overflow}"
+        assert every > 0, "every has to be positive"
+        self.maxlen = maxlen
+        self.overflow = overflow
+        self.every = every
+
+
+class _MessageQueue(list):
+    """ Messages queued for a queued subscription topic, counting all arrivals (including skipped ones) """
+    arrivals = 0
+
+
+def _store_value(subscriber: dict, values: dict, timestamps: dict, arg_name: str, content: Any, timestamp: float):
+    """ Stores a received message in the values collected for the next call of a subscriber function.
+        Messages for `sub_topics` replace the previous value, messages for `queued_sub_topics` are queued according
+        to the topic's `QueuePolicy`. Updates the subscriber's message counters.
+
+    Args:
+        subscriber (dict): subscriber entry (providing `topics`, `policies` and `stats`)
+        values (dict): values collected for the next call (argument name -> value)
+        timestamps (dict): timestamps of the collected values (argument name -> timestamp)
+        arg_name (str): argument (topic) to store the message for
+        content (Any): message content
+        timestamp (float): time the message was published
+    """
+    stats = subscriber['stats'][arg_name]
+    if arg_name in subscriber['topics']:
+        # store only latest value
+        if arg_name in values:
+            stats['coalesced'] += 1
+        values[arg_name] = content  # set value for received topic
+        timestamps[arg_name] = timestamp  # set timestamp for received value
+        return
+
+    # topic is a queued_topic - queue values and their timestamps
+    if arg_name not in values:
+        values[arg_name] = _MessageQueue()
+        timestamps[arg_name] = []
+    queue, queue_timestamps = values[arg_name], timestamps[arg_name]
+    policy = subscriber['policies'].get(arg_name)
+    if policy is not None:
+        arrival = queue.arrivals
+        queue.arrivals += 1
+        if arrival % policy.every != 0:
+            stats['skipped'] += 1
+            return
+        if policy.maxlen is not None and len(queue) >= policy.maxlen:
+            stats['dropped'] += 1
+            if policy.overflow == QueuePolicy.DROP_NEWEST:
                 return
+            del queue[0]
+            del queue_timestamps[0]
+    queue.append(content)
+    queue_timestamps.append(timestamp)
+
+
+def _new_subscriber(func_instance, topics: List[str], queued_topics: List[str], prefixes: List[str]) -> dict:
+    """ Creates the entry describing a subscriber function and collecting its received messages per dialog session """
+    return {
+        'func': func_instance,
+        'topics': topics,
+        'all_topics': topics + queued_topics,
+        'prefixes': prefixes,
+        'policies': func_instance.queue_policies,
+        'stats': {topic: {'coalesced': 0, 'skipped': 0, 'dropped': 0} for topic in topics + queued_topics},
+        'values': {},  # session id -> received values
+        'timestamps': {}  # session id -> timestamps of received values
+    }
+
+
+class Tracer:
+    """
+    Records a span for every call of a subscriber function: the topic of the message completing the call,
+    its publish and receive time, start and end of the call and all messages (topic, time, payload size)
+    published by the call. Spans are tagged with the dialog session, a running dialog number and the turn number.
+
+    Pass a tracer to a `DialogSystem` to trace all of its local services. Afterwards, export the spans with
+    `export_chrome_trace` (open in chrome://tracing or https://ui.perfetto.dev) or inspect the per-topic latencies
+    with `latency_histograms`.
+    """
+
+    def __init__(self, turn_topics: Iterable[str] = ('gen_user_utterance', 'user_utterance', 'user_acts')):
+        """
+        Args:
+            turn_topics (Iterable[str]): A message published to one of these topics starts a new turn,
+                                         unless the previous message of the dialog was published to one of them as well
+                                         (e.g. `gen_user_utterance` -> `user_utterance` -> `user_acts` is one turn).
+        """
+        self.turn_topics = tuple(turn_topics)
+        self.spans = []
+        self._lock = threading.Lock()
+        self._local = threading.local()  # span of the subscriber function running in the current thread
+        self._num_dialogs = 0
+        self._dialogs = {}  # session id -> [dialog number, turn number, last message published to a turn topic]
+
+    def start_dialog(self, session_id: Hashable = None):
+        """ Starts numbering the turns of a new dialog in the specified session """
+        with self._lock:
+            self._dialogs[session_id] = [self._num_dialogs, 0, False]
+            self._num_dialogs += 1
+
+    def begin_span(self, service: str, handler: str, topic: str, sent: float, received: float,
+                   session_id: Hashable = None) -> dict:
+        """ Starts the span of a subscriber function call in the current thread.
+
+        Args:
+            service (str): service name
+            handler (str): name of the subscriber function
+            topic (str): topic of the message completing the call
+            sent (float): time the message was published (POSIX timestamp)
+            received (float): time the message was received (POSIX timestamp)
+            session_id (Hashable): id of the dialog session the message belongs to
+
+        Returns:
+            The span (pass it to `end_span` after the call)
+        """
+        dialog, turn, _ = self._dialogs.get(session_id, (None, None, False))
+        span = {'service': service, 'handler': handler, 'session': session_id, 'dialog': dialog, 'turn': turn,
+                'topic': topic, 'sent': sent, 'received': received, 'start': time.time(), 'end': None,
+                'published': []}
+        self._local.span = span
+        return span
+
+    def end_span(self, span: dict):
+        """ Completes a span started by `begin_span` """
+        span['end'] = time.time()
+        self._local.span = None
+        with self._lock:
+            self.spans.append(span)
+
+    def record_publish(self, topic: str, session_id: Hashable = None) -> dict:
+        """ Records a message about to be published (for the span running in the current thread and for counting turns).
+            Call this *before* sending the message, so subscribers see the updated turn number.
+
+        Args:
+            topic (str): topic the message is published to
+            session_id (Hashable): id of the dialog session the message belongs to
+
+        Returns:
+            The record of the message - set its `size` entry to the payload size in bytes after sending
+        """
+        record = {'topic': topic, 'time': time.time(), 'size': None}
+        with self._lock:
+            dialog = self._dialogs.get(session_id)
+            if dialog is not None:
+                is_turn_topic = topic.startswith(self.turn_topics)
+                if is_turn_topic and not dialog[2]:
+                    dialog[1] += 1
+                dialog[2] = is_turn_topic
+        span = getattr(self._local, 'span', None)
+        if span is not None:
+            span['published'].append(record)
+        return record
+
+    def latencies(self) -> Dict[str, List[float]]:
+        """
+        Returns:
+            Mapping topic -> list of latencies (in seconds) from publishing a message to the start of the
+            subscriber function call it completed
+        """
+        latencies = {}
+        with self._lock:
+            for span in self.spans:
+                latencies.setdefault(span['topic'], []).append(span['start'] - span['sent'])
+        return latencies
+
+    def latency_histograms(self, bins: Union[int, Iterable[float]] = 10) -> Dict[str, Tuple[numpy.ndarray, numpy.ndarray]]:
+        """
+        Args:
+            bins (Union[int, Iterable[float]]): number of bins or bin edges (in milliseconds), see `numpy.histogram`
+
+        Returns:
+            Mapping topic -> (counts, bin edges in milliseconds) of the latencies returned by `latencies`
+        """
+        return {topic: numpy.histogram(numpy.array(latencies) * 1000.0, bins=bins)
+                for topic, latencies in self.latencies().items()}
+
+    def export_chrome_trace(self, path: str):
+        """ Writes all spans as Chrome trace-event JSON.
+            Each dialog session is shown as a process with one thread per service.
+            Subscriber function calls are shown as complete events, message transport as asynchronous events.
+
+        Args:
+            path (str): output file
+        """
+        events = []
+        pids = {}
+        tids = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span_id, span in enumerate(spans):
+            if span['session'] not in pids:
+                pids[span['session']] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pids[span['session']],
+                               'args': {'name': f"session {span['session']}"}})
+            pid = pids[span['session']]
+            if (pid, span['service']) not in tids:
+                tids[(pid, span['service'])] = len(tids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[(pid, span['service'])],
+                               'args': {'name': span['service']}})
+            tid = tids[(pid, span['service'])]
+            events.append({'name': f"{span['service']}.{span['handler']}", 'cat': 'handler', 'ph': 'X',
+                           'ts': span['start'] * 1e6, 'dur': (span['end'] - span['start']) * 1e6,
+                           'pid': pid, 'tid': tid,
+                           'args': {'topic': span['topic'], 'dialog': span['dialog'], 'turn': span['turn'],
+                                    'published': [{'topic': record['topic'], 'size': record['size']}
+                                                  for record in span['published']]}})
+            for phase, ts in (('b', span['sent']), ('e', span['received'])):
+                events.append({'name': span['topic'], 'cat': 'bus', 'ph': phase, 'id': span_id, 'ts': ts * 1e6,
+                               'pid': pid, 'tid': tid})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
 
 
 class RemoteService:
@@ -90,13 +640,42 @@ class RemoteService:
     * Now, when calling the constructor of `DialogSystem`, you should see messages informing you about the 
       successfull connection, or if the system is still trying to connect, it will block until connected to
       the remote service.
+
+    Replica groups: to scale expensive services (e.g. ASR, TTS), run several instances with the *SAME* identifier
+    (e.g. on different cores or nodes) and set `replicas` accordingly. Each dialog session is then assigned to exactly
+    one replica, which handles all messages of this session - the other replicas drop them after reading the message
+    header, without deserializing their content.
+
+    Compression: large payloads (e.g. belief states, speech features, audio) can be compressed on their way between the
+    nodes by listing their topics in `compression`. The algorithm is agreed on with the remote node on registration
+    (falling back to `zlib` if the remote node doesn't support the requested one) and applies to all publishers of
+    the topic, local and remote (all services receive the complete table before the first dialog starts).
+    Arrays in decompressed messages are read-only.
     """
-    def __init__(self, identifier: str):
+
+    ROUND_ROBIN = 'round_robin'
+    LEAST_LOADED = 'least_loaded'
+
+    def __init__(self, identifier: str, replicas: int = 1, balancing: str = LEAST_LOADED,
+                 compression: Dict[str, str] = {}, compression_threshold: int = 1024):
         """
         Args:
             identifier (str): the *UNIQUE* identifier to call the remote service instance
+            replicas (int): number of remote instances running under this identifier
+                            (the `DialogSystem` blocks until all of them are registered)
+            balancing (str): how sessions are assigned to replicas: `RemoteService.ROUND_ROBIN` or
+                             `RemoteService.LEAST_LOADED` (replica with the fewest running sessions)
+            compression (Dict[str, str]): topic (without domain) -> name of the compression algorithm
+                                          (`zlib`, `lz4` if installed or see `register_compressor`)
+            compression_threshold (int): messages smaller than this size in bytes are sent uncompressed
         """
+        assert replicas > 0, "a remote service needs at least one replica"
+        assert balancing in (RemoteService.ROUND_ROBIN, RemoteService.LEAST_LOADED), f"unknown balancing {balancing}"
         self.identifier = identifier
+        self.replicas = replicas
+        self.balancing = balancing
+        self.compression = compression
+        self.compression_threshold = compression_threshold
 
 
 class Service:
@@ -108,11 +687,19 @@ class Service:
 
     Note: A `Service` will only start listening to messages once it is added to a `DialogSystem` 
           (or calling `run_standalone()` in the remote case and adding a corresponding `RemoteService` to the `DialogSystem`).
+
+    Dialog-level state: list the names of all instance attributes holding state of a single dialog
+    in `session_attributes`. Each dialog session then gets its own (deep) copy of these attributes, so that one
+    service instance can serve many concurrent dialogs (see `DialogSystem.run_dialog`).
+    Reading or writing such an attribute always accesses the copy of the session the current thread is handling.
     """
 
+    session_attributes = ()
+
     def __init__(self, domain: Union[str, Domain] = "", sub_topic_domains: Dict[str, str] = {}, pub_topic_domains: Dict[str, str] = {},
                  ds_host_addr: str = "127.0.0.1", sub_port: int = 65533, pub_port: int = 65534, protocol: str = "tcp",
-                 debug_logger: DiasysLogger = None, identifier: str = None):
+                 debug_logger: DiasysLogger = None, identifier: str = None, ctrl_sub_port: int = 65531,
+                 ctrl_pub_port: int = 65532):
         """
         Create a new service instance *(call this super constructor from your inheriting classes!)*.
         
@@ -134,6 +721,8 @@ class Service:
                                          even if they are never forwarded (as expected) to your `Service`.
             identifier (str): Set this to a *UNIQUE* identifier per service to be run remotely.
                               See `RemoteService` for more details.
+            ctrl_sub_port (int): subscriber port of the control plane (dialog start / end, shutdown, ACK's)
+            ctrl_pub_port (int): publisher port of the control plane
         """
 
         self.is_training = False
@@ -150,6 +739,8 @@ class Service:
         self._host_addr = ds_host_addr
         self._sub_port = sub_port
         self._pub_port = pub_port
+        self._ctrl_sub_port = ctrl_sub_port
+        self._ctrl_pub_port = ctrl_pub_port
         self._protocol = protocol
         self._identifier = identifier
 
@@ -158,17 +749,58 @@ class Service:
         self._sub_topics = set()
         self._pub_topics = set()
         self._publish_sockets = dict()
+        self._compression = {}  # topic -> (compression name, threshold), agreed on with the dialog system
+
+        self._subscribers = []  # one entry per decorated subscriber function, all served by the receiver thread
+        self._tracer = None  # set by the `DialogSystem`
+        self._routes = {}  # received topic -> list of (subscriber entry, argument name), resolved on first use
+        self._state_streams = {}  # (session id, stateful topic) -> last published message, see `DeltaCodec`
+        self._state_mirrors = {}  # (session id, stateful topic) -> (sequence number, reconstructed content)
+
+        # NOTE: class name + random instance id make topic unique (required, e.g. for running mutliple instances of
+        # same module - also in different processes, where memory pointers may coincide!)
+        instance_id = uuid.uuid4().hex
+        self._start_topic = f"{type(self).__name__}/{instance_id}/START"
+        self._end_topic = f"{type(self).__name__}/{instance_id}/END"
+        self._terminate_topic = f"{type(self).__name__}/{instance_id}/TERMINATE"
+        self._train_topic = f"{type(self).__name__}/{instance_id}/TRAIN"
+        self._eval_topic = f"{type(self).__name__}/{instance_id}/EVAL"
+        self._ready_topic = f"{type(self).__name__}/{instance_id}/READY"
+        self._ready_channels = set()  # channels the readiness probe of the `DialogSystem` was received on
+
+    def _session_slot(self, session_id: Hashable = None, create: bool = True):
+        """ Returns the dictionary holding the `session_attributes` values of the specified session.
+            New sessions start with a deep copy of the default session's values, so they don't share
+            mutable values (e.g. lists or a user goal). """
+        slots = self.__dict__.setdefault('_session_slots', {None: {}})
+        if session_id not in slots and create:
+            slots[session_id] = copy.deepcopy(slots[None])
+        return slots.get(session_id)
+
+    def _close_session(self, session_id: Hashable):
+        """ Frees the dialog-level state of the specified session (the default session is kept) """
+        if session_id is not None:
+            self.__dict__.get('_session_slots', {}).pop(session_id, None)
+
+    def __getattr__(self, name):
+        # only called if regular attribute lookup fails - session attributes never live in __dict__
+        if name in type(self).session_attributes:
+            slot = self._session_slot(get_session_id())
+            if name in slot:
+                return slot[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def __setattr__(self, name, value):
+        if name in type(self).session_attributes:
+            self._session_slot(get_session_id())[name] = value
+        else:
+            object.__setattr__(self, name, value)
 
-        self._internal_start_topics = dict()
-        self._internal_end_topics = dict()
-        self._internal_terminate_topics = dict()
-
-        # NOTE: class name + memory pointer make topic unique (required, e.g. for running mutliple instances of same module!)
-        self._start_topic = f"{type(self).__name__}/{id(self)}/START"
-        self._end_topic = f"{type(self).__name__}/{id(self)}/END"
-        self._terminate_topic = f"{type(self).__name__}/{id(self)}/TERMINATE"
-        self._train_topic = f"{type(self).__name__}/{id(self)}/TRAIN"
-        self._eval_topic = f"{type(self).__name__}/{id(self)}/EVAL"
+    def __delattr__(self, name):
+        if name in type(self).session_attributes:
+            del self._session_slot(get_session_id())[name]
+        else:
+            object.__delattr__(self, name)
 
     def _init_pubsub(self): 
         """ Search for all functions decorated with the `PublishSubscribe` decorator and call the setup methods for them """
@@ -181,13 +813,14 @@ class Service:
                 self._setup_publishers(func_inst, getattr(func_inst, "pub_topics"))
 
     def _register_with_dialogsystem(self):
-        """ Start listening to dialog system control channel messages """
+        """ Start listening to dialog system control channel messages and to the subscribed topics """
         self._setup_dialog_ctrl_msg_listener()
-        Thread(target=self._control_channel_listener).start()
+        Thread(target=self._receiver_thread).start()
 
     def _setup_listener(self, func_instance, topics: List[str], queued_topics: List[str]):
         """
-        Starts a new subscription thread for a function decorated with `services.service.PublishSubscribe`.
+        Registers a function decorated with `services.service.PublishSubscribe` as receiver of the messages
+        for its subscribed topics. All subscriber functions of a service are served by one receiver thread.
         
         Args:
             func_instance (function): instance of the function that was decorated with `services.service.PublishSubscribe`.
@@ -200,37 +833,40 @@ class Service:
             # ensure that sub_topics and queued_sub_topics don't intersect (otherwise, both would set same function argument value)
         assert set(topics).isdisjoint(queued_topics), "sub_topics and queued_sub_topics have to be disjoint!"
 
-        # setup socket
-        ctx = Context.instance()
-        subscriber = ctx.socket(zmq.SUB)
-        # subscribe to all listed topics
-        for topic in topics + queued_topics:
-            topic_domain_str = f"{topic}/{self._domain_name}" if self._domain_name else topic
-            if topic in self._sub_topic_domains:
-                # overwrite domain for this specific topic and service instance
-                topic_domain_str = f"{topic}/{self._sub_topic_domains[topic]}" if self._sub_topic_domains[topic] else topic
-            subscriber.setsockopt(zmq.SUBSCRIBE, bytes(topic_domain_str, encoding="ascii"))
-        # subscribe to control channels
-        subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/START", encoding="ascii"))
-        subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/END", encoding="ascii"))
-        subscriber.setsockopt(zmq.SUBSCRIBE, bytes(f"{func_instance}/TERMINATE", encoding="ascii"))
-        subscriber.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
-        self._internal_start_topics[f"{str(func_instance)}/START"] = str(func_instance)
-        self._internal_end_topics[f"{str(func_instance)}/END"] = str(func_instance)
-        self._internal_terminate_topics[f"{str(func_instance)}/TERMINATE"] = str(func_instance)
-
-        # register and run listener thread
-        listener_thread = Thread(target=self._receiver_thread, args=(subscriber, func_instance,
-                                                                     topics, queued_topics,
-                                                                     f"{str(func_instance)}/START",
-                                                                     f"{str(func_instance)}/END",
-                                                                     f"{str(func_instance)}/TERMINATE"))
-        listener_thread.start()
+        self._subscribers.append(_new_subscriber(func_instance, topics, queued_topics,
+                                                 [self._get_sub_topic_domain_str(topic)
+                                                  for topic in topics + queued_topics]))
+        self._routes = {}
 
         # add to list of local topics
         # TODO maybe add topic_domain_str instead for more clarity?
         self._sub_topics.update(topics + queued_topics)
 
+    def _get_sub_topic_domain_str(self, topic: str) -> str:
+        """ Returns the topic prefix this service subscribes to for the given subscription topic
+            (i.e. the topic with the service's domain appended, unless overwritten by `sub_topic_domains`) """
+        topic_domain_str = f"{topic}/{self._domain_name}" if self._domain_name else topic
+        if topic in self._sub_topic_domains:
+            # overwrite domain for this specific topic and service instance
+            topic_domain_str = f"{topic}/{self._sub_topic_domains[topic]}" if self._sub_topic_domains[topic] else topic
+        return topic_domain_str
+
+    def _init_local_pubsub(self, dialog_system: 'InProcessDialogSystem'):
+        """ Search for all functions decorated with the `PublishSubscribe` decorator and register them with an
+            `InProcessDialogSystem` instead of setting up sockets and listener threads for them """
+        for func_name in dir(self):
+            func_inst = getattr(self, func_name)
+            if hasattr(func_inst, "pubsub"):
+                topics = getattr(func_inst, "sub_topics")
+                queued_topics = getattr(func_inst, 'queued_sub_topics')
+                if len(topics + queued_topics) > 0:
+                    assert set(topics).isdisjoint(queued_topics), "sub_topics and queued_sub_topics have to be disjoint!"
+                    dialog_system._register_local_subscriber(self, func_inst, topics, queued_topics)
+                    self._sub_topics.update(topics + queued_topics)
+                if len(getattr(func_inst, "pub_topics")) > 0:
+                    self._publish_sockets[func_inst] = dialog_system
+                    self._pub_topics.update(getattr(func_inst, "pub_topics"))
+
     def _setup_publishers(self, func_instance, topics):
         """ Creates a publish socket for a function decorated with `services.service.PublishSubscribe`. """
         if len(topics) == 0:
@@ -247,8 +883,11 @@ class Service:
         self._pub_topics.update(topics)
 
     def _setup_dialog_ctrl_msg_listener(self):
-        """ Setup a subscriber socket to receive `DialogSystem` control message """ 
-         
+        """ Setup subscriber sockets to receive `DialogSystem` control messages and messages for the subscribed topics.
+            Control messages use their own proxy (control plane), so they never queue up behind data messages.
+            Only readiness probes are also received via the data plane (see `_handle_ready_probe`).
+        """
+
         ctx = Context.instance()
 
         # setup receiver for dialog system control messages
@@ -258,72 +897,139 @@ class Service:
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._terminate_topic, encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._train_topic, encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._eval_topic, encoding="ascii"))
-        self._control_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
+        self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._ready_topic, encoding="ascii"))
+        for func_instance in self._publish_sockets:
+            # snapshot requests of receivers of stateful topics
+            for topic, codec in func_instance.codecs.items():
+                if isinstance(_codecs[codec], DeltaCodec):
+                    self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"RESYNC/{topic}", encoding="ascii"))
+        self._control_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._ctrl_sub_port}")
 
         # setup sender for dialog system control message acknowledgements 
         self._control_channel_pub = ctx.socket(zmq.PUB)
         self._control_channel_pub.sndhwm = 1100000
-        self._control_channel_pub.connect(f"{self._protocol}://{self._host_addr}:{self._pub_port}")
+        self._control_channel_pub.connect(f"{self._protocol}://{self._host_addr}:{self._ctrl_pub_port}")
+
+        # setup receiver for messages to all subscriber functions of this service
+        self._data_channel_sub = ctx.socket(zmq.SUB)
+        for subscriber in self._subscribers:
+            for prefix in subscriber['prefixes']:
+                self._data_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(prefix, encoding="ascii"))
+        self._data_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(self._ready_topic, encoding="ascii"))
+        self._data_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
 
-        # setup receiver for internal ACK messages
-        self._internal_control_channel_sub = ctx.socket(zmq.SUB)
-        for internal_ctrl_topic in list(self._internal_end_topics.keys()) + list(
-                self._internal_start_topics.keys()) + list(self._internal_terminate_topics.keys()):
-            self._internal_control_channel_sub.setsockopt(zmq.SUBSCRIBE,
-                                                          bytes(f"ACK/{internal_ctrl_topic}", encoding="ascii"))
-        self._internal_control_channel_sub.connect(f"{self._protocol}://{self._host_addr}:{self._sub_port}")
+    def _handle_control_msg(self, topic: str, session_id: Hashable, content: bool) -> bool:
+        """ Handles a control message from the `DialogSystem` and sends the acknowledgement.
 
-    def _control_channel_listener(self):
-        """ Using the control message subscription socket, listen to control messages from the `DialogSystem` in a loop.
-            Meant to be called in a thread.
+        Args:
+            topic (str): control message topic
+            session_id (Hashable): id of the dialog session the control message refers to
+            content (bool): control message flag
+
+        Returns:
+            `False` if the service was terminated, else `True`
         """
-        listen = True
-        while listen:
-            try:
-                # receive message for subscribed control topic
-                msg = self._control_channel_sub.recv_multipart(copy=True)
-                topic = msg[0].decode("ascii")
-                timestamp, content = pickle.loads(msg[1])
-
-                if topic == self._start_topic:
-                    # initialize dialog state
-                    self.dialog_start()
-                    # set all listeners of this service to listening mode (block until they are listening)
-                    for internal_start_topic in self._internal_start_topics:
-                        _send_msg(self._control_channel_pub, internal_start_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_start_topic)
-                    _send_ack(self._control_channel_pub, self._start_topic)
-                elif topic == self._end_topic:
-                    # stop all listeners of this service (block until they stopped)
-                    for internal_end_topic in self._internal_end_topics:
-                        _send_msg(self._control_channel_pub, internal_end_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_end_topic, True)
-                    self.dialog_end()
-                    _send_ack(self._control_channel_pub, self._end_topic)
-                elif topic == self._terminate_topic:
-                    # terminate all listeners of this service (block until they stopped)
-                    for internal_terminate_topic in self._internal_terminate_topics:
-                        _send_msg(self._control_channel_pub, internal_terminate_topic, True)
-                        _recv_ack(self._internal_control_channel_sub, internal_terminate_topic, True)
-                    self.dialog_exit()
-                    _send_ack(self._control_channel_pub, self._terminate_topic)
-                    listen = False
-                elif topic == self._train_topic:
-                    self.train()
-                    _send_ack(self._control_channel_pub, self._train_topic)
-                elif topic == self._eval_topic:
-                    self.eval()
-                    _send_ack(self._control_channel_pub, self._eval_topic)
-                else:
-                    if self.debug_logger:
-                        self.debug_logger.info("- (Service): received unknown control message from topic", topic,
-                                               " with content", content)
-            except KeyboardInterrupt:
-                break
-            except:
-                import traceback
-                print("ERROR in Service: _control_channel_listener")
-                traceback.print_exc()
+        _set_session_id(session_id)
+        if topic == self._start_topic:
+            # initialize dialog state and start listening to non-control messages of this session
+            self._session_slot(session_id)
+            self._drop_state_streams(session_id)
+            self.dialog_start()
+            for subscriber in self._subscribers:
+                subscriber['values'][session_id] = {}
+                subscriber['timestamps'][session_id] = {}
+            _send_ack(self._control_channel_pub, self._start_topic, session_id=session_id)
+        elif topic == self._end_topic:
+            # ignore all non-control messages of this session
+            for subscriber in self._subscribers:
+                subscriber['values'].pop(session_id, None)
+                subscriber['timestamps'].pop(session_id, None)
+            self.dialog_end()
+            self._close_session(session_id)
+            self._drop_state_streams(session_id)
+            _send_ack(self._control_channel_pub, self._end_topic, session_id=session_id)
+        elif topic == self._terminate_topic:
+            for subscriber in self._subscribers:
+                subscriber['values'] = {}
+                subscriber['timestamps'] = {}
+            self.dialog_exit()
+            _send_ack(self._control_channel_pub, self._terminate_topic, session_id=session_id)
+            return False
+        elif topic == self._train_topic:
+            self.train()
+            _send_ack(self._control_channel_pub, self._train_topic, session_id=session_id)
+        elif topic == self._eval_topic:
+            self.eval()
+            _send_ack(self._control_channel_pub, self._eval_topic, session_id=session_id)
+        elif topic == self._ready_topic:
+            self._handle_ready_probe(self._control_channel_sub)
+        elif topic.startswith("RESYNC/"):
+            self._resend_snapshot(topic[len("RESYNC/"):], session_id)
+        else:
+            if self.debug_logger:
+                self.debug_logger.info("- (Service): received unknown control message from topic", topic,
+                                       " with content", content)
+        return True
+
+    def _drop_state_streams(self, session_id: Hashable):
+        """ Forgets the messages published and the mirrors reconstructed for stateful topics in a session """
+        for streams in (self._state_streams, self._state_mirrors):
+            for key in [key for key in streams if key[0] == session_id]:
+                del streams[key]
+
+    def _publish_state(self, pub_channel: Socket, topic: str, content: Any, codec: str,
+                       compression: Tuple[str, int] = None):
+        """ Publishes a message of a stateful topic (see `DeltaCodec`) in the current session: the changes since
+            the previous message or, for the first message of the session, a snapshot.
+
+        Args:
+            pub_channel (Socket): publisher socket
+            topic (str): topic to publish to
+            content (Any): message content
+            codec (str): name of the `DeltaCodec`
+            compression (Tuple[str, int]): see `_send_msg`
+
+        Returns:
+            Size of the sent message in bytes
+        """
+        session_id = get_session_id()
+        delta_codec = _codecs[codec]
+        stream = self._state_streams.get((session_id, topic))
+        delta = None if stream is None else delta_codec.diff(stream['checkpoint'], content)
+        stream = {'seq': 0 if stream is None else stream['seq'] + 1, 'checkpoint': delta_codec.checkpoint(content),
+                  'content': content, 'channel': pub_channel, 'codec': codec, 'compression': compression}
+        self._state_streams[(session_id, topic)] = stream
+        msg = _StateMessage(stream['seq'], delta is None, content if delta is None else delta)
+        return _send_msg(pub_channel, topic, msg, session_id, codec, compression)
+
+    def _resend_snapshot(self, topic: str, session_id: Hashable):
+        """ Answers the snapshot request of a receiver of a stateful topic by publishing the current content """
+        stream = self._state_streams.get((session_id, topic))
+        if stream is not None:
+            _send_msg(stream['channel'], topic, _StateMessage(stream['seq'], True, stream['content']), session_id,
+                      stream['codec'], stream['compression'])
+
+    def _sync_state(self, topic: str, session_id: Hashable, msg: _StateMessage) -> Any:
+        """ Updates the mirror of a stateful topic with a received message.
+            Asks the publisher for a snapshot if the message is a delta which doesn't follow the mirror's state.
+
+        Returns:
+            The reconstructed content or `None` if there is nothing new to pass to the subscriber functions
+        """
+        key = (session_id, topic)
+        seq, mirror = self._state_mirrors.get(key, (None, None))
+        if msg.snapshot:
+            if seq is not None and seq >= msg.seq:
+                return None  # resent for another receiver
+            mirror = msg.payload
+        elif seq is not None and msg.seq == seq + 1:
+            mirror = msg.codec.patch(mirror, msg.payload)
+        else:
+            # joined in the middle of the dialog or missed a message
+            _send_ctrl(self._control_channel_pub, f"RESYNC/{topic}", session_id)
+            return None
+        self._state_mirrors[key] = (msg.seq, mirror)
+        return mirror
 
     def dialog_start(self):
         """ This function is called before the first message to a new dialog is published.
@@ -366,17 +1072,19 @@ class Service:
         sync_endpoint = ctx.socket(zmq.REQ)
         sync_endpoint.connect(f"tcp://{self._host_addr}:{host_reg_port}")
         data = pickle.dumps((self._domain_name, self._sub_topics, self._pub_topics, self._start_topic, self._end_topic,
-                             self._terminate_topic))
+                             self._terminate_topic, self._ready_topic, set(_compressors)))
         sync_endpoint.send_multipart((bytes(f"REGISTER_{self._identifier}", encoding="ascii"), data))
 
         # wait for registration confirmation
         registered = False
         while not registered:
-            msg = sync_endpoint.recv()
+            msg, data = sync_endpoint.recv_multipart()
             msg = msg.decode("utf-8")
             if msg.startswith("ACK_REGISTER_"):
                 remote_service_identifier = msg[len("ACK_REGISTER_"):]
                 if remote_service_identifier == self._identifier:
+                    # use the compression agreed on with the dialog system
+                    self._compression.update(pickle.loads(data))
                     self._register_with_dialogsystem()
                     sync_endpoint.send_multipart(
                         (bytes(f"CONF_REGISTER_{self._identifier}", encoding="ascii"), pickle.dumps(True)))
@@ -397,109 +1105,46 @@ class Service:
         """
         return copy.deepcopy(self._pub_topics)
 
-    def _receiver_thread(self, subscriber: Socket, func_instance,
-                         topics: Iterable[str], queued_topics: Iterable[str],
-                         start_topic: str, end_topic: str, terminate_topic: str):
+    def get_queue_stats(self):
+        """
+        Returns:
+            Message counters per subscriber function and subscribed topic: function name -> topic ->
+            {'coalesced': values replaced by a newer message before the function was called (`sub_topics`),
+             'skipped': messages left out by downsampling, 'dropped': messages dropped because the queue was full}
+        """
+        return {subscriber['func'].__name__: copy.deepcopy(subscriber['stats']) for subscriber in self._subscribers}
+
+    def _receiver_thread(self):
         """
         Loop for receiving messages.
-        Will continue until a message for `terminate_topic` is received.
+        Will continue until a message for the terminate control topic is received.
 
-        Handles waiting for messages, decoding, unpickling and subscription topic to  
-        service function keyword mapping.
+        Polls the control channel and the subscription channel of this service, so a single thread serves
+        all subscriber functions. Non-control messages are routed to the subscriber functions by `_handle_msg`.
 
         Meant to be run in a Thread!
-
-        Args:
-            subscriber (Socket): subscriber socket
-            func_instance (function instance): the decorated subscriber function instance to be called with the received messages
-            topics (Iterable[str]): all last-message-only topics the decorated `func_instance` subscribes to
-            queued_topics (Iterable[str]): all collect-all-messages-since-last-call topics the decorated `func_instance` subscribes to
-            start_topic (str): Control message topic to set this specific `function_instance` into listening mode (receive all non-control messages)
-            end_topic (str): Control message topic to set this specific `function_instance` into non-listening mode (ignore all non-control messages)
-            terminate_topic (str): Control message topic to end the listener loop for this specific `function_instance`. 
-                                   Also closes the socket before returning.
         """
+        poller = zmq.Poller()
+        poller.register(self._control_channel_sub, zmq.POLLIN)
+        poller.register(self._data_channel_sub, zmq.POLLIN)
 
-        ctx = Context.instance()
-        control_channel_pub = ctx.socket(zmq.PUB)
-        control_channel_pub.sndhwm = 1100000
-        control_channel_pub.connect(f"{self._protocol}://{self._host_addr}:{self._pub_port}")
-
-        values = {}
-        timestamps = {}
-        all_sub_topics = topics + queued_topics
-        num_topics = len(all_sub_topics)
-        active = False
-        terminating = False
-
-        while not terminating:
+        listen = True
+        while listen:
             try:
-                msg = subscriber.recv_multipart(copy=True)
-                topic = msg[0].decode("ascii")
-                # based on topic, decide what to do
-                if topic == start_topic:
-                    # reset values and start listening to non-control messages
-                    values = {}
-                    timestamps = {}
-                    active = True
-                    _send_ack(control_channel_pub, start_topic)
-                elif topic == end_topic:
-                    # ignore all non-control messages
-                    active = False
-                    _send_ack(control_channel_pub, end_topic)
-                elif topic == terminate_topic:
-                    # shutdown listener thread by exiting loop
-                    active = False
-                    _send_ack(control_channel_pub, terminate_topic)
-                    terminating = True
-                else:
-                    # non-control message
-                    if active:
-                        # process message
-                        timestamp, content = pickle.loads(msg[1])
-                        if self.debug_logger:
-                            self.debug_logger.info(
-                                f"- (DS): listener thread for function {func_instance}:\n   received for topic {topic}:\n   {content}")
-
-                        # simple synchronization mechanism: remember only newest values,
-                        # store them until there was at least 1 new value received per topic.
-                        # Then call callback function with complete set of values.
-                        # Reset values afterwards and start collecting again.
-
-                        # problem: routing based on prefixes -> function argument names may differ
-                        # solution: find longest common prefix of argument name and received topic
-                        common_prefix = ""
-                        for key in all_sub_topics:
-                            if topic.startswith(key) and len(topic) > len(common_prefix):
-                                common_prefix = key
-                        if common_prefix in topics:
-                            # store only latest value
-                            values[common_prefix] = content  # set value for received topic
-                            timestamps[common_prefix] = timestamp  # set timestamp for received value
-                        else:
-                            # topic is a queued_topic - queue all values and their timestamps
-                            if not common_prefix in values:
-                                values[common_prefix] = []
-                                timestamps[common_prefix] = []
-                            values[common_prefix].append(content)
-                            timestamps[common_prefix].append(timestamp)
-
-                        if len(values) == num_topics:
-                            # received a new value for each topic -> call callback function
-                            if func_instance.timestamp_enabled:
-                                # append timestamps, if required
-                                values['timestamps'] = timestamps
-                            if self.debug_logger:
-                                self.debug_logger.info(
-                                    f"- (DS): received all messages for function {func_instance}\n   -> CALLING function")
-                            if self.__class__ == Service:
-                                # NOTE workaround for publisher / subscriber without being an instance method
-                                func_instance(**values)
-                            else:
-                                func_instance(self, **values)
-                            # reset values
-                            values = {}
-                            timestamps = {}
+                events = dict(poller.poll())
+                if self._control_channel_sub in events:
+                    topic, session_id, content = _recv_ctrl(self._control_channel_sub)
+                    listen = self._handle_control_msg(topic, session_id, content)
+                if listen and self._data_channel_sub in events:
+                    msg = _recv_msg(self._data_channel_sub, self._accepts_msg)
+                    if msg is None:
+                        continue  # not listening to this session (e.g. assigned to another replica)
+                    topic, timestamp, session_id, content = msg
+                    if topic == self._ready_topic:
+                        self._compression.update(content)
+                        self._handle_ready_probe(self._data_channel_sub)
+                    else:
+                        self._handle_msg(topic, timestamp, session_id, content)
             except KeyboardInterrupt:
                 break
             except:
@@ -507,11 +1152,116 @@ class Service:
                 import traceback
                 traceback.print_exc()
         # shutdown
-        subscriber.close()
+        self._control_channel_sub.close()
+        self._data_channel_sub.close()
+
+    def _accepts_msg(self, topic: str, session_id: Hashable) -> bool:
+        """ Whether a received message has to be decoded: readiness probes and messages of the sessions
+            this service is listening to (checked on the header only, before the content is deserialized) """
+        return topic == self._ready_topic or any(session_id in subscriber['values']
+                                                 for subscriber in self._subscribers)
+
+    def _handle_ready_probe(self, channel: Socket):
+        """ Answers readiness probes of the `DialogSystem` once they arrived on both the control and the
+            subscription channel, i.e. once all subscriptions of this service are known to the message proxy """
+        self._ready_channels.add(channel)
+        if len(self._ready_channels) == 2:
+            _send_ack(self._control_channel_pub, self._ready_topic)
+
+    def _handle_msg(self, topic: str, timestamp: float, session_id: Hashable, content: Any):
+        """
+        Passes a received message to all subscriber functions of its topic.
+        Calls subscriber functions which received a value for each of their topics.
+
+        Args:
+            topic (str): topic the message was published to
+            timestamp (float): time of publishing
+            session_id (Hashable): id of the dialog session the message belongs to
+            content (Any): message content
+        """
+        received = time.time()
+        route = self._routes.get(topic)
+        if route is None:
+            route = self._routes[topic] = _route_topic(topic, self._subscribers)
+        if type(content) is _StateMessage:
+            if not any(session_id in subscriber['values'] for subscriber, _ in route):
+                return  # not listening to this session
+            content = self._sync_state(topic, session_id, content)
+            if content is None:
+                return
+        for subscriber, arg_name in route:
+            values = subscriber['values'].get(session_id)
+            if values is None:
+                continue  # not listening to this session
+            timestamps = subscriber['timestamps'][session_id]
+            func_instance = subscriber['func']
+            if self.debug_logger:
+                self.debug_logger.info(
+                    f"- (DS): listener thread for function {func_instance}:\n   received for topic {topic} (session {session_id}):\n   {content}")
+
+            # simple synchronization mechanism: remember only newest values,
+            # store them until there was at least 1 new value received per topic.
+            # Then call callback function with complete set of values.
+            # Reset values afterwards and start collecting again.
+            _store_value(subscriber, values, timestamps, arg_name, content, timestamp)
+
+            if len(values) == len(subscriber['all_topics']):
+                # received a new value for each topic -> call callback function
+                if func_instance.timestamp_enabled:
+                    # append timestamps, if required
+                    values['timestamps'] = timestamps
+                if self.debug_logger:
+                    self.debug_logger.info(
+                        f"- (DS): received all messages for function {func_instance}\n   -> CALLING function")
+                # reset values
+                subscriber['values'][session_id] = {}
+                subscriber['timestamps'][session_id] = {}
+                # make dialog-level state and published messages refer to the message's session
+                _set_session_id(session_id)
+                span = self._tracer.begin_span(type(self).__name__, func_instance.__name__, topic, timestamp,
+                                               received, session_id) if self._tracer else None
+                try:
+                    if self.__class__ == Service:
+                        # NOTE workaround for publisher / subscriber without being an instance method
+                        func_instance(**values)
+                    else:
+                        func_instance(self, **values)
+                except:
+                    print("THREAD ERROR")
+                    import traceback
+                    traceback.print_exc()
+                if span:
+                    self._tracer.end_span(span)
+
+
+def _route_topic(topic: str, subscribers: List[dict]) -> List[tuple]:
+    """ Find all subscriber functions (and the argument to fill) a message published to `topic` is delivered to.
+
+    Args:
+        topic (str): topic the message was published to
+        subscribers (List[dict]): subscriber entries, each providing the subscribed topic prefixes (`prefixes`)
+                                  and the subscribed topics / argument names (`all_topics`)
+
+    Returns:
+        List of (subscriber entry, argument name)
+    """
+    route = []
+    for subscriber in subscribers:
+        if any(topic.startswith(prefix) for prefix in subscriber['prefixes']):
+            # routing based on prefixes -> function argument names may differ
+            # find longest common prefix of argument name and received topic
+            common_prefix = ""
+            for key in subscriber['all_topics']:
+                if topic.startswith(key) and len(topic) > len(common_prefix):
+                    common_prefix = key
+            if common_prefix:
+                route.append((subscriber, common_prefix))
+    return route
 
 
 # Each decorated function should return a dictonary with the keys matching the pub_topics names
-def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], queued_sub_topics: List[str] = []):
+def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], queued_sub_topics: List[str] = [],
+                     codecs: Dict[str, str] = {}, queue_policies: Dict[str, QueuePolicy] = {}):
     """
     Decorator function for services.
     To be able to publish / subscribe to / from topics,
@@ -531,6 +1281,12 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
         queued_sub_topics(List[str or utils.topics.Topic]): The topics you want to get all messages from.
                                                             If multiple messages are received until your function is called,
                                                             you will receive all values since the previous function call as a list.
+        codecs(Dict[str, str]): Maps publish topics to the name of the codec used to serialize their messages
+                                (`pickle` (default), `msgpack`, `raw`, `delta` or any name passed to `register_codec`).
+                                Topics with a `DeltaCodec` (e.g. `delta`) are stateful: only the changes since the
+                                previous message of the dialog are sent.
+        queue_policies(Dict[str, QueuePolicy]): Maps queued_sub_topics to a `QueuePolicy` limiting the number of
+                                                messages queued until your function is called (default: unbounded).
 
     Notes:
         * Subscription topic names have to match your function keywords
@@ -542,6 +1298,8 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
     
     Technical notes:
         * Data will be automatically pickled / unpickled during send / receive to reduce meassage size.
+          Buffers of numpy arrays are sent as separate message frames without copying them,
+          so a publisher must not modify an array after returning it.
           However, some python objects are not serializable (e.g. database connections) for good reasons
           and will throw an error if you try to publish them.
         * The domain name of your service class will be appended to your publish topics.
@@ -549,6 +1307,9 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
           if you subscibe to 'topic'.
     """
 
+    assert set(codecs).issubset(pub_topics), "codecs can only be specified for pub_topics!"
+    assert set(queue_policies).issubset(queued_sub_topics), "queue_policies can only be specified for queued_sub_topics!"
+
     def wrapper(func):
         def delegate(self, *args, **kwargs):
             func_inst = getattr(self, func.__name__)
@@ -577,17 +1338,33 @@ def PublishSubscribe(sub_topics: List[str] = [], pub_topics: List[str] = [], que
                         topic_domain_str = f"{topic}/{domain}" if domain else topic
                         if topic in self._pub_topic_domains:
                             topic_domain_str = f"{topic}/{self._pub_topic_domains[topic]}" if self._pub_topic_domains[topic] else topic
-                        _send_msg(socket, topic_domain_str, result[topic])
+                        record = self._tracer.record_publish(topic_domain_str, get_session_id()) \
+                            if self._tracer else None
+                        if isinstance(socket, InProcessDialogSystem):
+                            # local dispatch: pass object reference, no serialization
+                            socket._publish(topic_domain_str, result[topic])
+                            size = None
+                        elif isinstance(_codecs[codecs.get(topic, 'pickle')], DeltaCodec):
+                            size = self._publish_state(socket, topic_domain_str, result[topic], codecs[topic],
+                                                       self._compression.get(topic))
+                        else:
+                            size = _send_msg(socket, topic_domain_str, result[topic], get_session_id(),
+                                             codecs.get(topic, 'pickle'), self._compression.get(topic))
+                        if record:
+                            record['size'] = size
                         if self.debug_logger:
                             self.debug_logger.info(
                                 f"- (DS): sent message from {func} to topic {topic_domain_str}:\n   {result[topic]}")
             return result
 
         # declare function as publish / subscribe functions and attach the respective topics
+        delegate.__name__ = func.__name__
         delegate.pubsub = True
         delegate.sub_topics = sub_topics
         delegate.queued_sub_topics = queued_sub_topics
         delegate.pub_topics = pub_topics
+        delegate.codecs = codecs
+        delegate.queue_policies = queue_policies
         # check arguments: is subsriber interested in timestamps?
         delegate.timestamp_enabled = 'timestamps' in inspect.getfullargspec(func)[0]
 
@@ -602,10 +1379,16 @@ class DialogSystem:
     It will also handle synchronization for initalization of services before dialog start / after dialog end / on system shutdown
     and lets you discover potential conflicts in you messaging pipeline.
     This class is also used to communicate / synchronize with services running on different nodes.
+
+    Multiple dialogs can run concurrently on the same services by calling `run_dialog` from different threads,
+    each with its own `session_id`. Every message carries the id of the session it belongs to, and services keep their
+    dialog-level state (see `Service.session_attributes`) separately for each session.
     """
 
     def __init__(self, services: List[Union[Service, RemoteService]], sub_port: int = 65533, pub_port: int = 65534,
-                 reg_port: int = 65535, protocol: str = 'tcp', debug_logger: DiasysLogger = None):
+                 reg_port: int = 65535, protocol: str = 'tcp', debug_logger: DiasysLogger = None,
+                 control_timeout: float = None, tracer: Tracer = None, ctrl_sub_port: int = 65531,
+                 ctrl_pub_port: int = 65532):
         """
         Args:
             services (List[Union[Service, RemoteService]]): List of all (remote) services to connect to.
@@ -620,13 +1403,21 @@ class DialogSystem:
             debug_logger (DiasysLogger): If not `None`, all messags are printed to the logger, including send/receive events.
                                 Can be useful for debugging because you can still see messages received by the `DialogSystem`
                                 even if they are never forwarded (as expected) to your `Service`
+            control_timeout (float): maximum time in seconds to wait for services to acknowledge control messages
+                                     (readiness, dialog start / end, shutdown) before raising a `TimeoutError`.
+                                     `None` waits forever.
+            tracer (Tracer): If not `None`, all calls of subscriber functions of local services are traced.
+            ctrl_sub_port (int): subscriber port of the control plane
+            ctrl_pub_port (int): publisher port of the control plane
         """
         # node-local topics
         self.debug_logger = debug_logger
+        self._tracer = tracer
         self.protocol = protocol
         self._sub_topics = {}
         self._pub_topics = {}
         self._remote_identifiers = set()
+        self._compression = {}  # topic -> (compression name, threshold) requested by remote services
         self._services = []  # collects names and instances of local services
         self._start_dialog_services = set()  # collects names of local services that subscribe to dialog_start
 
@@ -641,18 +1432,42 @@ class DialogSystem:
         self._sub_port = sub_port
         self._pub_port = pub_port
 
+        # start control plane proxy: control messages and ACK's don't share a queue with (large) data messages,
+        # so barrier latency does not depend on the data traffic
+        self._ctrl_proxy_dev = ProcessProxy(in_type=zmq.XSUB, out_type=zmq.XPUB)
+        self._ctrl_proxy_dev.bind_in(f"{protocol}://127.0.0.1:{ctrl_pub_port}")
+        self._ctrl_proxy_dev.bind_out(f"{protocol}://127.0.0.1:{ctrl_sub_port}")
+        self._ctrl_proxy_dev.start()
+        self._ctrl_sub_port = ctrl_sub_port
+        self._ctrl_pub_port = ctrl_pub_port
+
         # thread control
         self._start_topics = set()
         self._end_topics = set()
         self._terminate_topics = set()
+        self._ready_topics = set()
+        self._ready_topic = f"{type(self).__name__}/{id(self)}/READY"  # readiness probe for the dialog end listener
+        self._end_listener_ready = threading.Event()
+        self._control_timeout = control_timeout
+        self._replica_groups = {}  # remote service identifier -> list of (start topic, end topic) of its replicas
+        self._replica_balancing = {}  # remote service identifier -> balancing strategy
+        self._replica_round_robin = {}  # remote service identifier -> index of replica to assign next
+        self._replica_load = {}  # replica start topic -> number of assigned running sessions
+        self._session_replicas = {}  # session id -> list of (start topic, end topic) of the assigned replicas
         self._stopEvent = threading.Event()
+        self._session_end_events = {}  # session id -> event set on receiving Topic.DIALOG_END for this session
+        self._control_lock = threading.Lock()  # control channel sockets are shared by all sessions
 
         # control channels
         ctx = Context.instance()
         self._control_channel_pub = ctx.socket(zmq.PUB)
         self._control_channel_pub.sndhwm = 1100000
-        self._control_channel_pub.connect(f"{protocol}://127.0.0.1:{pub_port}")
+        self._control_channel_pub.connect(f"{protocol}://127.0.0.1:{ctrl_pub_port}")
         self._control_channel_sub = ctx.socket(zmq.SUB)
+        # data channel for start signals and readiness probes of the data plane
+        self._data_channel_pub = ctx.socket(zmq.PUB)
+        self._data_channel_pub.sndhwm = 1100000
+        self._data_channel_pub.connect(f"{protocol}://127.0.0.1:{pub_port}")
 
         # register services (local and remote)
         remote_services = {}
@@ -660,18 +1475,50 @@ class DialogSystem:
             if isinstance(service, Service):
                 # register local service
                 service_name = type(service).__name__ if service._identifier is None else service._identifier
+                service._tracer = tracer
+                service._compression = self._compression
                 service._init_pubsub()
                 self._add_service_info(service_name, service._domain_name, service._sub_topics, service._pub_topics,
-                                       service._start_topic, service._end_topic, service._terminate_topic)
+                                       service._start_topic, service._end_topic, service._terminate_topic,
+                                       service._ready_topic)
                 service._register_with_dialogsystem()
             elif isinstance(service, RemoteService):
                 remote_services[getattr(service, 'identifier')] = service
         self._register_remote_services(remote_services, reg_port)
 
-        self._control_channel_sub.connect(f"{protocol}://127.0.0.1:{sub_port}")
+        self._control_channel_sub.connect(f"{protocol}://127.0.0.1:{ctrl_sub_port}")
         self._setup_dialog_end_listener()
 
-        time.sleep(0.25)
+        self._wait_until_ready()
+
+    def _wait_until_ready(self, probe_interval: float = 0.01):
+        """ Readiness handshake: blocks until all subscriptions of the services and of this dialog system are known to
+            the message proxy, so that no control message or start signal is lost (zmq drops messages published before
+            a subscription arrived).
+            Sends readiness probes to all services and to the dialog end listener until each of them answered.
+            Services are probed via the control and the data plane, since both carry messages for them.
+
+        Args:
+            probe_interval (float): time in seconds to wait for answers before probing again
+        """
+        pending = set(f"ACK/{ready_topic}" for ready_topic in self._ready_topics)
+        deadline = None if self._control_timeout is None else time.time() + self._control_timeout
+        while pending or not self._end_listener_ready.is_set():
+            if deadline is not None and time.time() > deadline:
+                missing = sorted(topic[len("ACK/"):] for topic in pending)
+                raise TimeoutError(f"services not ready: {missing}")
+            for topic in pending:
+                _send_ctrl(self._control_channel_pub, topic[len("ACK/"):])
+                # the data plane probe carries the final compression table, see `_negotiate_compression`
+                _send_msg(self._data_channel_pub, topic[len("ACK/"):], self._compression)
+            if not self._end_listener_ready.is_set():
+                _send_msg(self._data_channel_pub, self._ready_topic, True)
+            # collect answers until there are no more within the probe interval
+            while self._control_channel_sub.poll(probe_interval * 1000):
+                recv_topic, _, _ = _recv_ctrl(self._control_channel_sub)
+                pending.discard(recv_topic)
+        if self.debug_logger:
+            self.debug_logger.info("- (DS): all services READY")
 
     def _register_pub_topic(self, publisher, topic: str):
         """ Map a publisher instance to a topic """
@@ -702,33 +1549,109 @@ class DialogSystem:
         reg_service = ctx.socket(zmq.REP)
         reg_service.bind(f'tcp://127.0.0.1:{reg_port}')
 
-        while len(remote_services) > 0:
+        # number of replicas still to register / to confirm their registration per identifier
+        open_registrations = {identifier: service.replicas for identifier, service in remote_services.items()}
+        open_confirmations = dict(open_registrations)
+        while len(open_confirmations) > 0:
             # call next remote service
             msg, data = reg_service.recv_multipart()
             msg = msg.decode("utf-8")
             if msg.startswith("REGISTER_"):
                 # make sure we have a register message
                 remote_service_identifier = msg[len("REGISTER_"):]
-                if remote_service_identifier in remote_services:
+                if open_registrations.get(remote_service_identifier, 0) > 0:
+                    open_registrations[remote_service_identifier] -= 1
                     print(f"registering service {remote_service_identifier}...")
                     # add remote service interface info
-                    domain_name, sub_topics, pub_topics, start_topic, end_topic, terminate_topic = pickle.loads(data)
+                    domain_name, sub_topics, pub_topics, start_topic, end_topic, terminate_topic, ready_topic, \
+                        compressors = pickle.loads(data)
                     self._add_service_info(remote_service_identifier, domain_name, sub_topics, pub_topics, start_topic,
-                                           end_topic, terminate_topic)
+                                           end_topic, terminate_topic, ready_topic)
+                    remote_service = remote_services[remote_service_identifier]
+                    if remote_service.replicas > 1:
+                        self._add_replica(remote_service_identifier, start_topic, end_topic, remote_service.balancing)
                     self._remote_identifiers.add(remote_service_identifier)
+                    self._negotiate_compression(remote_service, compressors)
                     # acknowledge service registration
-                    reg_service.send(bytes(f'ACK_REGISTER_{remote_service_identifier}', encoding="ascii"))
+                    reg_service.send_multipart((bytes(f'ACK_REGISTER_{remote_service_identifier}', encoding="ascii"),
+                                                pickle.dumps(self._compression)))
             elif msg.startswith("CONF_REGISTER_"):
                 # complete registration
                 remote_service_identifier = msg[len("CONF_REGISTER_"):]
-                if remote_service_identifier in remote_services:
-                    del remote_services[remote_service_identifier]
-                    print(f"successfully registered service {remote_service_identifier}")
+                if remote_service_identifier in open_confirmations:
+                    open_confirmations[remote_service_identifier] -= 1
+                    if open_confirmations[remote_service_identifier] == 0:
+                        del open_confirmations[remote_service_identifier]
+                        print(f"successfully registered service {remote_service_identifier}")
                 reg_service.send(bytes(f"", encoding="ascii"))
         print("########## Finished registering all remote services ##########")
 
+    def _negotiate_compression(self, remote_service: RemoteService, compressors: Iterable[str]):
+        """ Selects the compression of the topics requested by a remote service: the requested algorithm if both nodes
+            support it, else `zlib`. The result is shared with all local services and sent to the remote service.
+            Since remote services registered earlier don't know about it yet, the readiness probes (see
+            `_wait_until_ready`) send the complete table to all services again before the first dialog starts.
+
+        Args:
+            remote_service (RemoteService): remote service requesting compression
+            compressors (Iterable[str]): names of the compression algorithms supported by the remote node
+        """
+        for topic, name in remote_service.compression.items():
+            if name not in _compressors or name not in compressors:
+                if self.debug_logger:
+                    self.debug_logger.info(f"- (DS): compression {name} for topic {topic} not supported by both "
+                                           f"nodes, using zlib")
+                name = 'zlib'
+            self._compression[topic] = (name, remote_service.compression_threshold)
+
+    def _add_replica(self, identifier: str, start_topic: str, end_topic: str, balancing: str):
+        """ Adds a replica to the replica group of a remote service.
+            Replicas are not started for every dialog session, but only if a session is assigned to them.
+
+        Args:
+            identifier (str): identifier of the remote service
+            start_topic (str): control channel topic for setting the replica into `listening` mode
+            end_topic (str): control channel topic for setting the replica into `non-listening` mode
+            balancing (str): strategy for assigning sessions to the replicas of this group (see `RemoteService`)
+        """
+        self._start_topics.discard(start_topic)
+        self._end_topics.discard(end_topic)
+        self._replica_groups.setdefault(identifier, []).append((start_topic, end_topic))
+        self._replica_balancing[identifier] = balancing
+        self._replica_load[start_topic] = 0
+
+    def _assign_replicas(self, session_id: Hashable) -> List[tuple]:
+        """ Selects one replica per replica group to handle all messages of a dialog session
+
+        Returns:
+            List of (start topic, end topic) of the selected replicas
+        """
+        replicas = []
+        for identifier, group in self._replica_groups.items():
+            if self._replica_balancing[identifier] == RemoteService.ROUND_ROBIN:
+                index = self._replica_round_robin.get(identifier, 0)
+                self._replica_round_robin[identifier] = (index + 1) % len(group)
+                replica = group[index]
+            else:
+                replica = min(group, key=lambda replica: self._replica_load[replica[0]])
+            self._replica_load[replica[0]] += 1
+            replicas.append(replica)
+        self._session_replicas[session_id] = replicas
+        return replicas
+
+    def _release_replicas(self, session_id: Hashable) -> List[tuple]:
+        """ Removes the replica assignment of a dialog session
+
+        Returns:
+            List of (start topic, end topic) of the replicas which were assigned to the session
+        """
+        replicas = self._session_replicas.pop(session_id, [])
+        for start_topic, _ in replicas:
+            self._replica_load[start_topic] -= 1
+        return replicas
+
     def _add_service_info(self, service_name: str, domain_name: str, sub_topics: List[str], pub_topics: List[str], 
-                            start_topic: str, end_topic:str, terminate_topic: str):
+                            start_topic: str, end_topic:str, terminate_topic: str, ready_topic: str):
         """ Add all relevant info from a service (needed to construct dialog graph for debugging).
             Also, sets up all required control channels for this service based on the service's info.
             
@@ -741,6 +1664,7 @@ class DialogSystem:
             end_topic (str): control channel topic for setting given service into `non-listening` mode
             terminate_topic (str): control channel topic for stopping given service's listener loops and
                                    closing the listener sockets
+            ready_topic (str): control channel topic for probing whether the given service is ready to receive messages
         """
         self._domains.add(domain_name)
         for topic in sub_topics:
@@ -752,18 +1676,26 @@ class DialogSystem:
         self._start_topics.add(start_topic)
         self._end_topics.add(end_topic)
         self._terminate_topics.add(terminate_topic)
+        self._ready_topics.add(ready_topic)
+        self._subscribe_control_topics(start_topic, end_topic, terminate_topic, ready_topic)
 
+    def _subscribe_control_topics(self, start_topic: str, end_topic: str, terminate_topic: str, ready_topic: str):
+        """ Subscribe to the ACK's of a service's control channel topics """
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{start_topic}", encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{end_topic}", encoding="ascii"))
         self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{terminate_topic}", encoding="ascii"))
+        self._control_channel_sub.setsockopt(zmq.SUBSCRIBE, bytes(f"ACK/{ready_topic}", encoding="ascii"))
 
     def _setup_dialog_end_listener(self):
-        """ Creates socket for listening to Topic.DIALOG_END messages """
+        """ Creates socket for listening to Topic.DIALOG_END messages and starts a thread dispatching them
+            to the waiting sessions """
         ctx = Context.instance()
         self._end_socket = ctx.socket(zmq.SUB)
         # subscribe to dialog end from all domains
         self._end_socket.setsockopt(zmq.SUBSCRIBE, bytes(Topic.DIALOG_END, encoding="ascii"))
+        self._end_socket.setsockopt(zmq.SUBSCRIBE, bytes(self._ready_topic, encoding="ascii"))
         self._end_socket.connect(f"{self.protocol}://127.0.0.1:{self._sub_port}")
+        Thread(target=self._dialog_end_listener, daemon=True).start()
 
         # # add to list of local topics
         # if Topic.DIALOG_END not in self._local_sub_topics:
@@ -786,70 +1718,100 @@ class DialogSystem:
             Blocks until all services sent ACK's confirming they're stopped.
         """
         self._stopEvent.set()
-        for terminate_topic in self._terminate_topics:
-            _send_msg(self._control_channel_pub, terminate_topic, True)
-            _recv_ack(self._control_channel_sub, terminate_topic)
+        with self._control_lock:
+            _broadcast_and_gather(self._control_channel_pub, self._control_channel_sub, self._terminate_topics,
+                                  timeout=self._control_timeout)
 
-    def _end_dialog(self):
-        """ Block until all receivers stopped listening.
-            Then, calls `dialog_end` on all registered services. """
-
-        # listen for Topic.DIALOG_END messages
+    def _dialog_end_listener(self):
+        """ Listen for Topic.DIALOG_END messages and notify the session they belong to.
+            Meant to be run in a (daemon) thread. """
         while True:
             try:
-                msg = self._end_socket.recv_multipart(copy=True)
                 # receive message for subscribed topic
-                topic = msg[0].decode("ascii")
-                timestamp, content = pickle.loads(msg[1])
-                if content:
+                topic, timestamp, session_id, content = _recv_msg(self._end_socket)
+                if topic == self._ready_topic:
+                    self._end_listener_ready.set()
+                elif content and session_id in self._session_end_events:
                     if self.debug_logger:
-                        self.debug_logger.info(f"- (DS): received DIALOG_END message in _end_dialog from topic {topic}")
-                    self.stop()
-                    break
-            except KeyboardInterrupt:
+                        self.debug_logger.info(f"- (DS): received DIALOG_END message for session {session_id} from topic {topic}")
+                    self._session_end_events[session_id].set()
+            except zmq.ContextTerminated:
                 break
             except:
                 import traceback
                 traceback.print_exc()
-                print("ERROR in _end_dialog ")
+                print("ERROR in _dialog_end_listener")
+
+    def _end_dialog(self, session_id: Hashable = None):
+        """ Block until all receivers stopped listening.
+            Then, calls `dialog_end` on all registered services. """
+
+        # wait for a Topic.DIALOG_END message of this session
+        try:
+            self._session_end_events[session_id].wait()
+        except KeyboardInterrupt:
+            pass
+        del self._session_end_events[session_id]
+        if session_id is None:
+            self.stop()
 
         # stop receivers (blocking)
-        for end_topic in self._end_topics:
-            _send_msg(self._control_channel_pub, end_topic, True)
-            _recv_ack(self._control_channel_sub, end_topic)
+        with self._control_lock:
+            end_topics = self._end_topics.union(end_topic for _, end_topic in self._release_replicas(session_id))
+            _broadcast_and_gather(self._control_channel_pub, self._control_channel_sub, end_topics, session_id,
+                                  self._control_timeout)
         if self.debug_logger:
-            self.debug_logger.info(f"- (DS): all services STOPPED listening")
+            self.debug_logger.info(f"- (DS): all services STOPPED listening (session {session_id})")
 
-    def _start_dialog(self, start_signals: dict):
+    def _start_dialog(self, start_signals: dict, session_id: Hashable = None):
         """ Block until all receivers started listening.
             Then, call `dialog_start`on all registered services.
             Finally, publish all start signals given. """
-        self._stopEvent.clear()
+        assert session_id not in self._session_end_events, f"session {session_id} is already running"
+        if session_id is None:
+            self._stopEvent.clear()
+        self._session_end_events[session_id] = threading.Event()
+        if self._tracer:
+            self._tracer.start_dialog(session_id)
         # start receivers (blocking)
-        for start_topic in self._start_topics:
-            _send_msg(self._control_channel_pub, start_topic, True)
-            _recv_ack(self._control_channel_sub, start_topic)
-        if self.debug_logger:
-            self.debug_logger.info(f"- (DS): all services STARTED listening")
-        # publish first turn trigger
-        # for domain in self._domains:
-        # "wildcard" mechanism: publish start messages to all known domains
-        for topic in start_signals:
-            _send_msg(self._control_channel_pub, f"{topic}", start_signals[topic])
-
-    def run_dialog(self, start_signals: dict = {Topic.DIALOG_END: False}):
+        with self._control_lock:
+            start_topics = self._start_topics.union(start_topic for start_topic, _ in self._assign_replicas(session_id))
+            try:
+                _broadcast_and_gather(self._control_channel_pub, self._control_channel_sub, start_topics,
+                                      session_id, self._control_timeout)
+            except TimeoutError:
+                del self._session_end_events[session_id]
+                self._release_replicas(session_id)
+                raise
+            if self.debug_logger:
+                self.debug_logger.info(f"- (DS): all services STARTED listening (session {session_id})")
+            # publish first turn trigger
+            # for domain in self._domains:
+            # "wildcard" mechanism: publish start messages to all known domains
+            for topic in start_signals:
+                if self._tracer:
+                    self._tracer.record_publish(topic, session_id)
+                _send_msg(self._data_channel_pub, f"{topic}", start_signals[topic], session_id,
+                          compression=self._compression.get(topic.split("/")[0]))
+
+    def run_dialog(self, start_signals: dict = {Topic.DIALOG_END: False}, session_id: Hashable = None):
         """ Run a complete dialog (blocking).
             Dialog will be started via messages to the topics specified in `start_signals`.
             The dialog will end on receiving any `Topic.DIALOG_END` message with value 'True',
             so make sure at least one service in your dialog graph will publish this message eventually.
 
+            To run several dialogs at the same time, call this method from multiple threads with a different
+            `session_id` each.
+
         Args:
             start_signals (Dict[str, Any]): mapping from topic -> value
                                             Publishes the value given for each topic to the respective topic.
                                             Use this to trigger the start of your dialog system.
+            session_id (Hashable): unique (picklable) id of the dialog session, e.g. a user or connection id.
+                                   `None` selects the default session.
         """
-        self._start_dialog(start_signals)
-        self._end_dialog()
+        self._start_dialog(start_signals, session_id)
+        self._end_dialog(session_id)
 
     def list_published_topics(self):
         """ Get all declared publisher topics.
@@ -1015,3 +1977,165 @@ class DialogSystem:
             eventually publish to their respective topics.
         """
         return len(self.list_inconsistencies()[0]) == 0
+
+
+class InProcessDialogSystem(DialogSystem):
+    """
+    A `DialogSystem` for graphs where all services run in the same process (e.g. simulator training, unit tests or
+    single-box chat).
+
+    Instead of sending pickled messages through ZeroMQ sockets, published messages are put into a queue
+    of the publishing dialog session and delivered by calling the subscribed functions directly from the thread
+    running the dialog (`run_dialog`). Subscription semantics (`sub_topics`, `queued_sub_topics`, prefix matching of
+    topics, timestamps) are the same as for the `DialogSystem`.
+
+    Notes:
+        * Subscribers receive references to the published objects, not copies - don't modify received messages.
+        * `RemoteService`s are not supported.
+        * Services publishing from their own threads (e.g. recorders) will reach the dialog session
+          given by `services.service.get_session_id()` in that thread (default session if not set).
+    """
+
+    def __init__(self, services: List[Service], debug_logger: DiasysLogger = None, tracer: Tracer = None):
+        """
+        Args:
+            services (List[Service]): List of all services to connect to.
+            debug_logger (DiasysLogger): If not `None`, all messags are printed to the logger, including send/receive events.
+            tracer (Tracer): If not `None`, all calls of subscriber functions are traced.
+        """
+        self.debug_logger = debug_logger
+        self._tracer = tracer
+        self._sub_topics = {}
+        self._pub_topics = {}
+        self._remote_identifiers = set()
+        self._domains = set()
+        self._start_topics = set()
+        self._end_topics = set()
+        self._terminate_topics = set()
+        self._ready_topics = set()
+        self._stopEvent = threading.Event()
+
+        self._services = []
+        self._subscribers = []  # one entry per decorated subscriber function
+        self._routes = {}  # published topic -> list of (subscriber entry, argument name), resolved on first use
+        self._session_queues = {}  # session id -> queue of (topic, timestamp, content) to deliver
+
+        for service in services:
+            assert isinstance(service, Service), "InProcessDialogSystem supports local services only"
+            service_name = type(service).__name__ if service._identifier is None else service._identifier
+            service._tracer = tracer
+            service._init_local_pubsub(self)
+            self._add_service_info(service_name, service._domain_name, service._sub_topics, service._pub_topics,
+                                   service._start_topic, service._end_topic, service._terminate_topic,
+                                   service._ready_topic)
+            self._services.append(service)
+
+    def _subscribe_control_topics(self, start_topic: str, end_topic: str, terminate_topic: str, ready_topic: str):
+        """ There are no control channels: services are started and stopped by direct calls """
+        pass
+
+    def _register_local_subscriber(self, service: Service, func_instance, topics: List[str], queued_topics: List[str]):
+        """ Register a function decorated with `services.service.PublishSubscribe` as message receiver """
+        subscriber = _new_subscriber(func_instance, topics, queued_topics,
+                                     [service._get_sub_topic_domain_str(topic) for topic in topics + queued_topics])
+        subscriber['service'] = service
+        self._subscribers.append(subscriber)
+        service._subscribers.append(subscriber)  # message counters are reported by the service
+        self._routes = {}
+
+    def _publish(self, topic: str, content: Any):
+        """ Queue a message for delivery in the dialog session of the calling thread """
+        queue = self._session_queues.get(get_session_id())
+        if queue is not None:
+            queue.put((topic, datetime.datetime.now().timestamp(), content))
+
+    def _deliver(self, session_id: Hashable, topic: str, timestamp: float, content: Any):
+        """ Pass a message to all subscribers of its topic, calling subscriber functions which received
+            a value for each of their topics """
+        received = time.time()
+        route = self._routes.get(topic)
+        if route is None:
+            route = self._routes[topic] = _route_topic(topic, self._subscribers)
+        for subscriber, arg_name in route:
+            values = subscriber['values'].get(session_id)
+            if values is None:
+                continue  # not listening
+            timestamps = subscriber['timestamps'][session_id]
+            _store_value(subscriber, values, timestamps, arg_name, content, timestamp)
+
+            if len(values) == len(subscriber['all_topics']):
+                func_instance = subscriber['func']
+                if func_instance.timestamp_enabled:
+                    values['timestamps'] = timestamps
+                subscriber['values'][session_id] = {}
+                subscriber['timestamps'][session_id] = {}
+                if self.debug_logger:
+                    self.debug_logger.info(
+                        f"- (DS): received all messages for function {func_instance}\n   -> CALLING function")
+                service = subscriber['service']
+                span = self._tracer.begin_span(type(service).__name__, func_instance.__name__, topic, timestamp,
+                                               received, session_id) if self._tracer else None
+                try:
+                    if service.__class__ == Service:
+                        func_instance(**values)
+                    else:
+                        func_instance(service, **values)
+                except:
+                    print("THREAD ERROR")
+                    import traceback
+                    traceback.print_exc()
+                if span:
+                    self._tracer.end_span(span)
+
+    def _start_dialog(self, start_signals: dict, session_id: Hashable = None):
+        """ Call `dialog_start` on all registered services and set their subscribers to listening mode.
+            Then, publish all start signals given. """
+        assert session_id not in self._session_queues, f"session {session_id} is already running"
+        _set_session_id(session_id)
+        if session_id is None:
+            self._stopEvent.clear()
+        for service in self._services:
+            service._session_slot(session_id)
+            service.dialog_start()
+        for subscriber in self._subscribers:
+            subscriber['values'][session_id] = {}
+            subscriber['timestamps'][session_id] = {}
+        self._session_queues[session_id] = Queue()
+        if self._tracer:
+            self._tracer.start_dialog(session_id)
+        for topic in start_signals:
+            if self._tracer:
+                self._tracer.record_publish(topic, session_id)
+            self._publish(topic, start_signals[topic])
+
+    def _end_dialog(self, session_id: Hashable = None):
+        """ Deliver messages until a Topic.DIALOG_END message is received.
+            Then, stop all subscribers and call `dialog_end` on all registered services. """
+        queue = self._session_queues[session_id]
+        try:
+            while True:
+                topic, timestamp, content = queue.get()
+                self._deliver(session_id, topic, timestamp, content)
+                if topic.startswith(Topic.DIALOG_END) and content is True:
+                    if self.debug_logger:
+                        self.debug_logger.info(f"- (DS): received DIALOG_END message in _end_dialog from topic {topic}")
+                    break
+        except KeyboardInterrupt:
+            pass
+        if session_id is None:
+            self.stop()
+
+        del self._session_queues[session_id]
+        for subscriber in self._subscribers:
+            subscriber['values'].pop(session_id, None)
+            subscriber['timestamps'].pop(session_id, None)
+        for service in self._services:
+            service.dialog_end()
+            service._close_session(session_id)
+        _set_session_id(None)
+
+    def shutdown(self):
+        """ Shutdown dialog system: calls `dialog_exit` on all registered services. """
+        self._stopEvent.set()
+        for service in self._services:
+            service.dialog_exit()
@@ -40,6 +40,9 @@ class HandcraftedUserSimulator(Service):
         this domain to generate the goals.
     """
 
+    session_attributes = ('turn', 'dialog_patience', 'patience', 'last_user_actions', 'last_system_action',
+                          'excluded_venues', 'goal', 'agenda', 'num_actions_next_turn')
+
     def __init__(self, domain: Domain, logger: DiasysLogger = DiasysLogger()):
         super(HandcraftedUserSimulator, self).__init__(domain)
 
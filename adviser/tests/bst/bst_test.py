@@ -1,4 +1,5 @@
 import os
+import pickle
 import sys
 from copy import deepcopy
 
@@ -233,3 +234,88 @@ def test_handle_user_acts_for_user_request_alternatives(bst, primkey_constraint)
     user_acts = [UserAct(act_type=UserActionType.RequestAlternatives)]
     bst._handle_user_acts(user_acts)
     assert bst.domain.get_primary_key() not in bst.bs['informs']
+
+
+def test_new_turn_shares_unchanged_beliefs(bst):
+    """
+    Tests whether a new turn of the beliefstate shares unchanged informs with the previous turn
+    while changes to the new turn leave the previous turn untouched.
+
+    Args:
+        bst: BST Object (given in conftest.py)
+    """
+    bst.bs['informs']['foo'] = {'bar': 0.5}
+    bst.bs['informs']['baz'] = {'qux': 0.5}
+    bst.bs.start_new_turn()
+    assert dict.__getitem__(bst.bs[-1]['informs'], 'baz') is dict.__getitem__(bst.bs[-2]['informs'], 'baz')
+    bst.bs['informs']['foo']['bar'] = 1.0
+    bst.bs['requests']['foo'] = 1.0
+    assert bst.bs[-2]['informs'] == {'foo': {'bar': 0.5}, 'baz': {'qux': 0.5}}
+    assert bst.bs[-2]['requests'] == {}
+    assert bst.bs['informs']['foo'] == {'bar': 1.0}
+
+
+def test_beliefstate_history_window(domain):
+    """
+    Tests whether the beliefstate only keeps the given number of turns.
+
+    Args:
+        domain (JSONLookupDomain): domain (given in conftest.py)
+    """
+    bst = HandcraftedBST(domain=domain, history_window=2)
+    for turn in range(3):
+        bst.bs.start_new_turn()
+        bst.bs['num_matches'] = turn
+    assert len(bst.bs) == 2
+    assert bst.bs[-2]['num_matches'] == 1
+
+
+def test_beliefstate_delta_reconstructs_turn(bst):
+    """
+    Tests whether applying the published changes of a turn to a copy of the previous beliefstate
+    reconstructs the current turn.
+
+    Args:
+        bst: BST Object (given in conftest.py)
+    """
+    bst.bs['informs']['foo'] = {'bar': 0.5}
+    bst.bs['informs']['baz'] = {'qux': 0.5}
+    mirror = pickle.loads(pickle.dumps(bst.bs))
+    checkpoint = bst.bs.delta_checkpoint()
+    assert bst.bs.delta_since(checkpoint) is None
+    bst.bs.start_new_turn()
+    bst.bs['informs']['foo']['bar'] = 1.0
+    del bst.bs['informs']['baz']
+    bst.bs['requests']['foo'] = 1.0
+    bst.bs['num_matches'] = 3
+    delta = bst.bs.delta_since(checkpoint)
+    assert delta == ({'num_matches': 3}, {'informs': ({'foo': {'bar': 1.0}}, ['baz']),
+                                          'requests': ({'foo': 1.0}, [])}, [])
+    mirror.apply_delta(pickle.loads(pickle.dumps(delta)))
+    assert len(mirror) == len(bst.bs)
+    assert mirror[-1] == bst.bs[-1]
+    assert mirror[-2] == bst.bs[-2]
+
+
+def test_beliefstate_views_follow_changes(bst):
+    """
+    Tests whether the derived views of the beliefstate are kept while the informs don't change
+    and recomputed after they were accessed for modification.
+
+    Args:
+        bst: BST Object (given in conftest.py)
+    """
+    bst.bs['informs']['foo'] = {'bar': 0.5, 'baz': 0.8}
+    bst.bs['informs']['qux'] = {'dontcare': 1.0}
+    constraints = bst.bs.constraints()
+    assert constraints == {'foo': ['bar', 'baz']}
+    assert bst.bs.constraints() is constraints
+    assert bst.bs.dontcare_slots() == ['qux']
+    assert bst.bs.top_value('foo') == 'baz'
+    assert bst.bs.top_value('quux') is None
+    bst.bs['informs']['foo']['bar'] = 1.0
+    assert bst.bs.top_value('foo') == 'bar'
+    bst.bs.start_new_turn()
+    bst.bs['requests'] = {'foo': 1.0}
+    assert bst.bs.requested_slots() == ['foo']
+    assert bst.bs.constraints() == constraints
@@ -1,13 +1,19 @@
 import os
 import sys
 import argparse
+import json
+import pickle
+import shutil
+import sqlite3
 
 def get_root_dir():
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 sys.path.append(get_root_dir())
 import pytest
-from utils.domain.jsonlookupdomain import JSONLookupDomain
+from utils.domain.gazetteer import haversine
+from utils.domain.jsonlookupdomain import JSONLookupDomain, get_domain, NEAR_SLOT, OPEN_AT_SLOT, _WriteBehindJournal, \
+    WEEKDAYS, _replay_changes, _parse_opening_hours
 
 
 # Test case using pytest.fixture
@@ -41,3 +47,157 @@ def test_query_db(load_supehero_domain : JSONLookupDomain):
     # print(entities[0])
 
 
+
+
+def test_db_shared_between_instances(domain: JSONLookupDomain):
+    """
+        Test functionality: all domain objects of the same database file share one in-memory copy
+    """
+    other = JSONLookupDomain(domain.get_domain_name())
+
+    assert other.db is domain.db
+    assert set(other.load_times) == {'ontology', 'database'}
+
+
+def test_find_entities_uses_indexes(domain: JSONLookupDomain):
+    """
+        Test functionality: constraints on informable slots are looked up via indexes
+    """
+    for slot in domain.get_informable_slots():
+        domain.find_entities({slot: domain.get_possible_values(slot)[0]})
+
+    assert domain.find_unindexed_queries() == []
+
+
+def test_find_entities_cache(domain: JSONLookupDomain):
+    """
+        Test functionality: repeated lookups are served from the result cache until the db is modified
+    """
+    slot = list(domain.get_informable_slots())[0]
+    value = domain.get_possible_values(slot)[0]
+    entities = domain.find_entities({slot: value})
+    stats = domain.get_cache_stats()
+
+    assert domain.find_entities({slot: value.upper()}) == entities
+    assert domain.get_cache_stats()['hits'] == stats['hits'] + 1
+
+    domain.modify_db(f"UPDATE {domain.get_domain_name()} SET {slot}={slot} WHERE 0")
+    assert domain.find_entities({slot: value}) == entities
+    assert domain.get_cache_stats()['misses'] == stats['misses'] + 1
+
+
+def test_columnar_index_matches_db(domain: JSONLookupDomain):
+    """
+        Test functionality: count, distinct_values and discriminable answered by the columnar index
+        agree with the database
+    """
+    sql_domain = JSONLookupDomain(domain.get_domain_name(), columnar_index=False)
+    for slot in domain.get_informable_slots():
+        constraints = {slot: domain.get_possible_values(slot)[:2]}
+        assert domain.count(constraints) == len(sql_domain.find_entities(constraints))
+        for other_slot in domain.get_informable_slots():
+            assert domain.distinct_values(other_slot, constraints) == \
+                sql_domain.distinct_values(other_slot, constraints)
+        assert domain.discriminable(constraints) == sql_domain.discriminable(constraints)
+
+
+def test_write_behind_journal(domain: JSONLookupDomain, tmp_path):
+    """
+        Test functionality: journaled changes are written to the database file on flush and replayed
+        from a journal left behind by a crash
+    """
+    db_file = str(tmp_path / 'superhero.db')
+    shutil.copy(os.path.join(get_root_dir(), 'resources', 'databases', 'superhero.db'), db_file)
+    table = domain.get_domain_name()
+    key = domain.get_primary_key()
+    name = domain.query_db(f'SELECT {key} FROM {table}')[0][key]
+    update = f'UPDATE {table} SET loyalty=? WHERE {key}=?'
+
+    def loyalty():
+        db = sqlite3.connect(db_file)
+        value = db.execute(f'SELECT loyalty FROM {table} WHERE {key}=?', (name, )).fetchone()[0]
+        db.close()
+        return value
+
+    journal = _WriteBehindJournal(db_file, flush_interval=60)
+    journal.append(update, ('first', name))
+    journal.flush()
+    journal.close()
+    assert loyalty() == 'first'
+
+    # simulate a crash after writing the first change but before removing it from the journal
+    with open(db_file + '.changes', 'w') as journal_file:
+        journal_file.write(json.dumps([1, update, ['stale', name]]) + '\n')
+        journal_file.write(json.dumps([2, update, ['second', name]]) + '\n')
+        journal_file.write('[3, "UPDATE')
+    _replay_changes(db_file)
+    assert loyalty() == 'second'
+    assert not os.path.exists(db_file + '.changes')
+
+
+def test_distance_duration_offline():
+    """
+        Test functionality: distances are computed from the stored coordinates and the gazetteer
+    """
+    domain = JSONLookupDomain('restaurants_stuttgart')
+    name = 'Kwan Kao - Taste of Thailand'
+    start = domain._get_gazetteer().resolve('i am at the main station')
+    assert start is not None
+    coordinate = json.loads(domain.find_info_about_entity(name, ['coordinate'])[0]['coordinate'])
+    expected = haversine(start[0], start[1], coordinate[0], coordinate[1])
+
+    distance, duration = domain.distance_duration('hbf', name, 'by foot')
+    assert distance == f'{round(float(expected), 2)} km'
+    assert duration.endswith('minutes') or duration.endswith('hour')
+
+
+def test_find_entities_near():
+    """
+        Test functionality: radius and nearest-entity queries over the spatial index agree with a full scan
+    """
+    domain = JSONLookupDomain('restaurants_stuttgart')
+    lat, lon = domain._get_gazetteer().resolve('hbf')
+    constraints = {'price': domain.get_possible_values('price')[0]}
+    expected = []
+    for entity in domain.find_entities(constraints, ['coordinate']):
+        if entity['coordinate'] != 'None':
+            distance = float(haversine(lat, lon, *json.loads(entity['coordinate'])))
+            if distance <= 1.5:
+                expected.append((distance, entity['name']))
+
+    nearest = domain.find_entities_near(lat, lon, 1.5, constraints)
+    assert [entity['name'] for entity in nearest] == [name for _, name in sorted(expected)]
+    assert [entity['name'] for entity in domain.find_entities_near(lat, lon, 1.5, constraints, k=2)] == \
+        [entity['name'] for entity in nearest[:2]]
+    ranked = domain.find_entities({**constraints, NEAR_SLOT: 'hbf'})
+    assert [entity['name'] for entity in ranked[:len(nearest)]] == [entity['name'] for entity in nearest]
+
+
+def test_open_at():
+    """
+        Test functionality: opening hours are parsed into weekly intervals (split shifts, past midnight)
+        and entities can be filtered by the time they are open
+    """
+    assert _parse_opening_hours({'Tuesday': '12 to 2:30pm, 6pm to 2am', 'Sunday': '10pm to 1am'}) == \
+        [(2160, 2310), (2520, 3000), (0, 60), (9960, 10080)]
+
+    domain = JSONLookupDomain('restaurants_stuttgart')
+    name = 'Kwan Kao - Taste of Thailand'
+    hours = json.loads(domain.find_info_about_entity(name, ['opening_hours'])[0]['opening_hours'])
+    start, _ = _parse_opening_hours(hours)[0]
+    open_at = (WEEKDAYS[start // 1440], start % 1440)
+    open_entities = domain.find_entities({OPEN_AT_SLOT: open_at})
+    assert name in [entity['name'] for entity in open_entities]
+    assert name not in [entity['name'] for entity in domain.find_entities({OPEN_AT_SLOT: (open_at[0], start % 1440 - 1)})]
+    assert domain.count({OPEN_AT_SLOT: open_at}) == len(open_entities)
+
+
+def test_domain_pickled_by_handle(domain: JSONLookupDomain):
+    """
+        Test functionality: pickled domains are small handles resolved to the registered domain
+    """
+    data = pickle.dumps(domain)
+    assert len(data) < 500
+    # all domain objects with the same arguments resolve to the one created first
+    assert pickle.loads(data) is get_domain(domain.get_domain_name())
+    assert pickle.loads(data).ontology_json == domain.ontology_json
@@ -0,0 +1,402 @@
+import os
+import sys
+import threading
+
+import numpy
+import pytest
+
+def get_root_dir():
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+sys.path.append(get_root_dir())
+from services.bst import HandcraftedBST
+from services.policy import HandcraftedPolicy
+from services.service import Service, DialogSystem, InProcessDialogSystem, RemoteService, PublishSubscribe, Tracer, \
+    PickleCodec, register_codec, get_session_id, _set_session_id
+from services.simulator.simulator import HandcraftedUserSimulator
+from services.stats.evaluation import PolicyEvaluator
+from utils.beliefstate import BeliefState
+
+
+class SessionService(Service):
+    session_attributes = ('history',)
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+        self.history = []
+
+
+class RecordingSimulator(HandcraftedUserSimulator):
+    """ Remembers the goal of each session """
+
+    def __init__(self, domain):
+        HandcraftedUserSimulator.__init__(self, domain)
+        self.goals = {}
+
+    def dialog_end(self):
+        self.goals[get_session_id()] = self.goal
+
+
+class RecordingEvaluator(PolicyEvaluator):
+    """ Remembers the turn count and reward of each session """
+
+    def __init__(self, domain):
+        PolicyEvaluator.__init__(self, domain)
+        self.dialogs = {}
+
+    def dialog_end(self):
+        self.dialogs[get_session_id()] = (self.dialog_turns, self.dialog_reward)
+
+
+class SysActCounter(Service):
+    """ Counts the system acts of each session """
+
+    def __init__(self, domain):
+        Service.__init__(self, domain=domain)
+        self.counts = {}
+
+    @PublishSubscribe(sub_topics=["sys_act"])
+    def count(self, sys_act=None):
+        session_id = get_session_id()
+        self.counts[session_id] = self.counts.get(session_id, 0) + 1
+
+
+class FrameSource(Service):
+    """ Publishes a video frame on request """
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+
+    @PublishSubscribe(sub_topics=["next_frame"], pub_topics=["frame"])
+    def send_frame(self, next_frame=None):
+        return {'frame': numpy.arange(12, dtype=numpy.float32).reshape(3, 4)}
+
+
+class FrameSink(Service):
+    """ Receives video frames and ends the dialog """
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+        self.frames = []
+
+    @PublishSubscribe(sub_topics=["frame"], pub_topics=["dialog_end"])
+    def receive_frame(self, frame=None):
+        self.frames.append(frame)
+        return {'dialog_end': True}
+
+
+class BeliefStateSource(Service):
+    """ Publishes a belief state (stateful topic) and a copy of its informs (regular topic) """
+
+    def __init__(self, domain):
+        Service.__init__(self, domain="")
+        self.bs = BeliefState(domain)
+
+    @PublishSubscribe(sub_topics=["start"], pub_topics=["beliefstate", "informs"], codecs={"beliefstate": "delta"})
+    def send_beliefstate(self, start=None):
+        return {'beliefstate': self.bs, 'informs': dict(self.bs['informs'])}
+
+
+class BeliefStateSink(Service):
+    """ Receives a belief state and ends the dialog """
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+        self.beliefstates = []
+
+    @PublishSubscribe(sub_topics=["beliefstate", "informs"], pub_topics=["dialog_end"])
+    def receive_beliefstate(self, beliefstate=None, informs=None):
+        self.beliefstates.append(beliefstate)
+        return {'dialog_end': True}
+
+
+class CountingCodec(PickleCodec):
+    """ Counts the messages it decoded """
+
+    def __init__(self):
+        self.decoded = 0
+
+    def decode(self, frames):
+        self.decoded += 1
+        return PickleCodec.decode(self, frames)
+
+
+class Echo(Service):
+    """ Remote service answering pings with its name """
+
+    def __init__(self, name):
+        Service.__init__(self, domain="", identifier="echo")
+        self.name = name
+        self.sessions = set()
+
+    @PublishSubscribe(sub_topics=["ping"], pub_topics=["pong"])
+    def on_ping(self, ping=None):
+        self.sessions.add(get_session_id())
+        return {'pong': self.name}
+
+
+class PingDriver(Service):
+    """ Pings the echo service three times per dialog and remembers who answered """
+
+    session_attributes = ('pings',)
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+        self.answers = {}
+
+    def dialog_start(self):
+        self.pings = 0
+
+    @PublishSubscribe(sub_topics=["pong"], pub_topics=["ping", "dialog_end"], codecs={"ping": "counting"})
+    def on_pong(self, pong=None):
+        self.answers.setdefault(get_session_id(), []).append(pong)
+        self.pings += 1
+        if self.pings == 3:
+            return {'dialog_end': True}
+        return {'ping': self.pings}
+
+
+class FeatureExtractor(Service):
+    """ Remote service publishing speech features """
+
+    def __init__(self):
+        Service.__init__(self, domain="", identifier="features")
+
+    @PublishSubscribe(sub_topics=["speech_in"], pub_topics=["speech_features"])
+    def extract(self, speech_in=None):
+        return {'speech_features': numpy.zeros((100, 40), dtype=numpy.float32)}
+
+
+class Recognizer(Service):
+    """ Remote service receiving speech features, requesting their compression """
+
+    def __init__(self):
+        Service.__init__(self, domain="", identifier="asr")
+        self.features = []
+
+    @PublishSubscribe(sub_topics=["speech_features"], pub_topics=["dialog_end"])
+    def recognize(self, speech_features=None):
+        self.features.append(speech_features)
+        return {'dialog_end': True}
+
+
+def test_sessions_get_own_copy_of_default_values():
+    """
+    Tests whether a new session starts with its own copy of the default session's mutable values.
+    """
+    service = SessionService()
+    try:
+        _set_session_id('a')
+        service.history.append('a')
+        _set_session_id('b')
+        assert service.history == []
+    finally:
+        _set_session_id(None)
+    assert service.history == []
+
+
+@pytest.mark.parametrize('dialog_system_cls', [DialogSystem, InProcessDialogSystem])
+def test_concurrent_simulated_sessions(domain, dialog_system_cls):
+    """
+    Tests whether concurrent dialogs between the user simulator, BST, policy and evaluator all come to an
+    end and are independent of each other, i.e. each session has its own goal and turn / reward counts.
+
+    Args:
+        domain (JSONLookupDomain): domain (given in conftest.py)
+        dialog_system_cls (type): the dialog system implementation
+    """
+    simulator = RecordingSimulator(domain)
+    evaluator = RecordingEvaluator(domain)
+    counter = SysActCounter(domain)
+    ds = dialog_system_cls([simulator, HandcraftedBST(domain), HandcraftedPolicy(domain), evaluator, counter])
+    try:
+        evaluator.eval()
+        errors = []
+
+        def run_dialog(session_id):
+            try:
+                ds.run_dialog(start_signals={f'user_acts/{domain.get_domain_name()}': []}, session_id=session_id)
+            except Exception as error:
+                errors.append(error)
+
+        session_ids = list(range(4))
+        threads = [threading.Thread(target=run_dialog, args=(session_id,), daemon=True) for session_id in session_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(60)
+        assert not any(thread.is_alive() for thread in threads)
+        assert not errors
+        assert evaluator.total_eval_dialogs == len(session_ids)
+        assert len(evaluator.eval_success) == len(session_ids)
+
+        # every session simulated its own user goal ...
+        assert set(simulator.goals) == set(session_ids)
+        assert len({id(goal) for goal in simulator.goals.values()}) == len(session_ids)
+        # ... and was evaluated on its own turns only
+        assert set(evaluator.dialogs) == set(session_ids)
+        for session_id in session_ids:
+            assert evaluator.dialogs[session_id][0] == counter.counts[session_id]
+        assert sorted(reward for _, reward in evaluator.dialogs.values()) == sorted(evaluator.eval_rewards)
+    finally:
+        ds.shutdown()
+
+
+@pytest.mark.parametrize('dialog_system_cls', [DialogSystem, InProcessDialogSystem])
+def test_array_messages(dialog_system_cls):
+    """
+    Tests whether numpy arrays are delivered as message content and don't interfere with ending the dialog.
+
+    Args:
+        dialog_system_cls (type): the dialog system implementation
+    """
+    sink = FrameSink()
+    ds = dialog_system_cls([FrameSource(), sink])
+    try:
+        ds.run_dialog(start_signals={'next_frame': True})
+        assert len(sink.frames) == 1
+        assert numpy.array_equal(sink.frames[0], numpy.arange(12, dtype=numpy.float32).reshape(3, 4))
+    finally:
+        ds.shutdown()
+
+
+def test_tracer_records_payload_sizes(domain):
+    """
+    Tests whether the tracer records the size of published messages, for stateful (delta) topics as well.
+
+    Args:
+        domain (JSONLookupDomain): domain (given in conftest.py)
+    """
+    tracer = Tracer()
+    sink = BeliefStateSink()
+    ds = DialogSystem([BeliefStateSource(domain), sink], tracer=tracer)
+    try:
+        ds.run_dialog(start_signals={'start': True})
+    finally:
+        ds.shutdown()
+    assert len(sink.beliefstates) == 1
+    published = {record['topic']: record['size'] for span in tracer.spans for record in span['published']}
+    assert set(published) == {'beliefstate', 'informs', 'dialog_end'}
+    assert all(size > 0 for size in published.values())
+
+
+def test_replicas_handle_disjoint_sessions():
+    """
+    Tests whether each session is handled by exactly one replica of a remote service and whether the other
+    replicas drop the session's messages without decoding them.
+    """
+    codec = CountingCodec()
+    register_codec('counting', codec)
+    replicas = [Echo('a'), Echo('b')]
+    for replica in replicas:
+        threading.Thread(target=replica.run_standalone, daemon=True).start()
+    driver = PingDriver()
+    ds = DialogSystem([driver, RemoteService('echo', replicas=2, balancing=RemoteService.ROUND_ROBIN)])
+    try:
+        threads = [threading.Thread(target=ds.run_dialog, kwargs={'start_signals': {'ping': 0}, 'session_id': i},
+                                    daemon=True) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        assert not any(thread.is_alive() for thread in threads)
+    finally:
+        ds.shutdown()
+    # every session talked to a single replica, both replicas were used
+    assert set(driver.answers) == set(range(4))
+    assert all(len(answers) == 3 and len(set(answers)) == 1 for answers in driver.answers.values())
+    assert replicas[0].sessions and replicas[1].sessions
+    assert not replicas[0].sessions & replicas[1].sessions
+    # pings (the start signals are published by the dialog system with the default codec) were decoded once
+    assert codec.decoded == 4 * 2
+
+
+def test_compression_applies_to_remote_services_registered_earlier():
+    """
+    Tests whether a remote service learns about the compression of a topic requested by a remote service
+    registering after it, and whether compressed messages arrive unchanged.
+    """
+    extractor = FeatureExtractor()
+    recognizer = Recognizer()
+    threading.Thread(target=extractor.run_standalone, daemon=True).start()
+    # the recognizer registers last
+    threading.Timer(0.5, recognizer.run_standalone).start()
+    ds = DialogSystem([RemoteService('features'),
+                       RemoteService('asr', compression={'speech_features': 'zlib'}, compression_threshold=0)])
+    try:
+        assert extractor._compression == {'speech_features': ('zlib', 0)}
+        ds.run_dialog(start_signals={'speech_in': True})
+    finally:
+        ds.shutdown()
+    assert len(recognizer.features) == 1
+    assert numpy.array_equal(recognizer.features[0], numpy.zeros((100, 40), dtype=numpy.float32))
+
+
+class Ticker(Service):
+    """ Publishes the values 0 ... n - 1 (one per tick), then signals that it is done """
+
+    def __init__(self, n=5):
+        Service.__init__(self, domain="")
+        self.n = n
+
+    @PublishSubscribe(sub_topics=["tick"], pub_topics=["tick", "value", "latest/a", "done"])
+    def on_tick(self, tick=None):
+        if tick < self.n:
+            return {'value': tick, 'latest/a': tick, 'tick': tick + 1}
+        return {'done': True}
+
+
+class Collector(Service):
+    """ Collects the ticker's values (queued) and its latest value (prefix subscription) """
+
+    def __init__(self):
+        Service.__init__(self, domain="")
+        self.calls = []
+
+    @PublishSubscribe(sub_topics=["done", "latest"], queued_sub_topics=["value"], pub_topics=["dialog_end"])
+    def collect(self, done=None, latest=None, value=None, timestamps=None):
+        self.calls.append((latest, value, timestamps))
+        return {'dialog_end': True}
+
+
+@pytest.mark.parametrize('dialog_system_cls', [DialogSystem, InProcessDialogSystem])
+def test_subscription_semantics(dialog_system_cls):
+    """
+    Tests whether both dialog systems deliver the latest value of `sub_topics` (also for prefix subscriptions),
+    all values of `queued_sub_topics` and their timestamps.
+
+    Args:
+        dialog_system_cls (type): the dialog system implementation
+    """
+    collector = Collector()
+    ds = dialog_system_cls([Ticker(), collector])
+    try:
+        ds.run_dialog(start_signals={'tick': 0})
+    finally:
+        ds.shutdown()
+    assert len(collector.calls) == 1
+    latest, value, timestamps = collector.calls[0]
+    assert latest == 4
+    assert value == [0, 1, 2, 3, 4]
+    assert set(timestamps) == {'done', 'latest', 'value'}
+    assert len(timestamps['value']) == 5
+    assert timestamps['value'] == sorted(timestamps['value']) and timestamps['value'][-1] <= timestamps['done']
+
+
+def test_in_process_passes_references():
+    """
+    Tests whether the in-process dialog system passes published objects without copying them.
+    """
+    source = FrameSource()
+    sink = FrameSink()
+    frames = []
+    source.send_frame = PublishSubscribe(sub_topics=["next_frame"], pub_topics=["frame"])(
+        lambda self, next_frame=None: {'frame': frames[-1]})
+    frames.append(numpy.zeros(3))
+    ds = InProcessDialogSystem([source, sink])
+    try:
+        ds.run_dialog(start_signals={'next_frame': True})
+    finally:
+        ds.shutdown()
+    assert sink.frames[0] is frames[0]
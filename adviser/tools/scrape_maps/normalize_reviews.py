@@ -0,0 +1,62 @@
+import argparse
+import ast
+import json
+import os
+import sqlite3
+
+
+def parse_reviews(blob):
+    """ Parses a reviews blob: a JSON list as written by the scraper or a python list literal
+        as written by earlier versions of `JSONLookupDomain.enter_review` """
+    if not blob or blob == 'None':
+        return []
+    try:
+        return json.loads(blob)
+    except json.JSONDecodeError:
+        return ast.literal_eval(blob)
+
+
+def normalize_reviews(db_file, table):
+    """ Moves the reviews of a restaurant database from the `reviews` column (one list per restaurant)
+        to a `reviews` table (one row per review) and adds the rating aggregates `rating_sum` and
+        `rating_count` (initialized from `rating` and `num_reviews`) which `JSONLookupDomain.enter_rating`
+        maintains. Databases which were converted already are left unchanged.
+
+    Args:
+        db_file (str): path to the database file
+        table (str): name of the restaurant table
+    """
+    conn = sqlite3.connect(db_file)
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if 'reviews' not in columns:
+        print(f'{db_file}: reviews are normalized already')
+        conn.close()
+        return
+    with conn:
+        conn.execute('DROP TABLE IF EXISTS reviews')
+        conn.execute('CREATE TABLE reviews (review_id INTEGER PRIMARY KEY, name TEXT NOT NULL, review TEXT NOT NULL)')
+        conn.execute('CREATE INDEX idx_reviews_name ON reviews (name)')
+        num_reviews = 0
+        for name, blob in conn.execute(f'SELECT name, reviews FROM {table}').fetchall():
+            reviews = parse_reviews(blob)
+            conn.executemany('INSERT INTO reviews (name, review) VALUES (?, ?)', [(name, review) for review in reviews])
+            num_reviews += len(reviews)
+        conn.execute(f'ALTER TABLE {table} DROP COLUMN reviews')
+        if 'rating_count' not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN rating_sum REAL NOT NULL DEFAULT 0')
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0')
+            conn.execute(f"UPDATE {table} SET rating_count=CAST(REPLACE(num_reviews, ',', '') AS INTEGER)")
+            conn.execute(f'UPDATE {table} SET rating_sum=CAST(rating AS REAL)*rating_count')
+    conn.execute('VACUUM')
+    conn.close()
+    print(f'{db_file}: moved {num_reviews} reviews to the reviews table')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', type=str, help='path to the database file',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'resources',
+                                             'databases', 'restaurants_stuttgart.db'))
+    parser.add_argument('--table', type=str, default='restaurants_stuttgart', help='name of the restaurant table')
+    args = parser.parse_args()
+    normalize_reviews(args.db, args.table)
@@ -19,11 +19,86 @@
 
 """ This module provides the BeliefState class. """
 
-import copy
+from typing import Iterable
 
 from utils.domain.jsonlookupdomain import JSONLookupDomain
 
 
+def _is_mutable(value) -> bool:
+    return isinstance(value, (dict, set, list))
+
+
+def _read(mapping: dict, key):
+    """ Reads a value of a turn's belief state without copying it (see `_TurnDict`); the value must not
+        be modified """
+    return dict.__getitem__(mapping, key)
+
+
+def _copy_on_access(value):
+    """ Returns a copy of a value shared with the previous turn: dicts are copied shallowly and keep
+        sharing their values until they are accessed, sets and lists are copied """
+    if isinstance(value, dict):
+        return _TurnDict(value, shared=[key for key, item in value.items() if _is_mutable(item)])
+    if isinstance(value, (set, list)):
+        return type(value)(value)
+    return value
+
+
+class _TurnDict(dict):
+    """ A dictionary of a turn's belief state which shares its mutable values (e.g. the informs of a
+        slot) with the previous turn until they are accessed by key; then they are copied, so that
+        changes to the current turn never affect the previous ones.
+        Iterating over items or values doesn't copy, so values must only be modified after
+        accessing them by key (e.g. `bs['informs'][slot][value] = score`).
+    """
+
+    def __init__(self, items=(), shared: Iterable = ()):
+        super().__init__(items)
+        self._shared = set(shared)  # keys whose values are shared with the previous turn
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if key in self._shared:
+            value = _copy_on_access(value)
+            dict.__setitem__(self, key, value)
+            self._shared.discard(key)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        self._shared.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._shared.discard(key)
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._shared.discard(key)
+        return dict.pop(self, key, *default)
+
+    def __reduce__(self):
+        return _TurnDict, (dict(self), self._shared)
+
+
+def _restore_beliefstate(domain, history: list, history_window: int):
+    """ Unpickles a `BeliefState` (see `BeliefState.__reduce__`) """
+    beliefstate = BeliefState.__new__(BeliefState)
+    beliefstate.domain = domain
+    beliefstate.history_window = history_window
+    beliefstate._history = history
+    beliefstate._db_results = {}
+    beliefstate._views = {}
+    return beliefstate
+
+
 class BeliefState:
     """
     A representation of the belief state, can be accessed like a dictionary.
@@ -35,21 +110,42 @@ class BeliefState:
         * number of db matches for given constraints
         * if the db matches can further be split
 
+    Turns share the parts of the belief state which didn't change with the previous turn.
+    Views derived from the informs and requests of the current turn (see `constraints`, `dontcare_slots`,
+    `top_value` and `requested_slots`) are computed once and kept until the informs or requests are
+    accessed for modification (by key or by turn) or replaced, or a new turn starts.
+
     """
-    def __init__(self, domain: JSONLookupDomain):
+    def __init__(self, domain: JSONLookupDomain, history_window: int = None):
+        """
+        Args:
+            domain (JSONLookupDomain): the domain
+            history_window (int): number of turns to keep (default: all turns of the dialog)
+        """
         self.domain = domain
-        self._history = [self._init_beliefstate()]
+        self.history_window = history_window
+        self._history = [_TurnDict(self._init_beliefstate())]
+        self._db_results = {}  # constraint fingerprint -> database entities of the current turn
+        self._views = {}  # 'informs' / 'requests' -> view name -> view of the current turn
+
+    def __reduce__(self):
+        # the history keeps its shared parts, results of database lookups are not pickled
+        return _restore_beliefstate, (self.domain, self._history, self.history_window)
     
     def dialog_start(self):
-        self._history = [self._init_beliefstate()]
+        self._history = [_TurnDict(self._init_beliefstate())]
+        self._db_results = {}
+        self._views = {}
 
     def __getitem__(self, val):  # for indexing
         # if used with numbers: int (e.g. state[-2]) or slice (e.g. state[3:6])
         if isinstance(val, int) or isinstance(val, slice):
+            self._views = {}  # the turns may be modified
             return self._history[val]  # interpret the number as turn
         # if used with strings (e.g. state['beliefs'])
         elif isinstance(val, str):
-            # take the current turn's belief state
+            # take the current turn's belief state, which may be modified
+            self._views.pop(val, None)
             return self._history[-1][val]
 
     def __iter__(self):
@@ -57,6 +153,7 @@ class BeliefState:
 
     def __setitem__(self, key, val):
         # e.g. state['beliefs']['area']['west'] = 1.0
+        self._views.pop(key, None)
         self._history[-1][key] = val
 
     def __len__(self):
@@ -71,9 +168,9 @@ class BeliefState:
         string = ""
         if isinstance(sub_dict, dict):
             string += '{'
-            for key in sub_dict:
+            for key, value in sub_dict.items():
                 string += "'" + str(key) + "': "
-                string += self._recursive_repr(sub_dict[key], indent + 2)
+                string += self._recursive_repr(value, indent + 2)
             string += '}\n' + ' ' * indent
         else:
             string += str(sub_dict) + ' '
@@ -91,8 +188,68 @@ class BeliefState:
         to ensure the correct history can be accessed correctly by other modules
         """
 
-        # copy last turn's dict
-        self._history.append(copy.deepcopy(self._history[-1]))
+        # share last turn's values until they are accessed
+        last_turn = self._history[-1]
+        self._history.append(_TurnDict(last_turn, shared=[key for key in last_turn
+                                                          if _is_mutable(dict.__getitem__(last_turn, key))]))
+        if self.history_window is not None and len(self._history) > self.history_window:
+            del self._history[:len(self._history) - self.history_window]
+        self._db_results = {}
+        self._views = {}
+
+    def delta_checkpoint(self):
+        """ Returns what the changes of the next published belief state are computed from (see `delta_since` and
+            `services.service.DeltaCodec`): the current turn, which doesn't change once the next turn started """
+        return self, self._history[-1]
+
+    def delta_since(self, checkpoint):
+        """ Returns the changes of the current turn since the turn of the checkpoint (see `delta_checkpoint`)
+
+        Args:
+            checkpoint (tuple): the belief state and its turn when it was published last
+
+        Returns:
+            (set values, changed entries of dict values (slot -> (new or changed entries, removed keys)),
+            removed keys) or `None` if the checkpoint is not the previous turn of this belief state
+        """
+        beliefstate, last_turn = checkpoint
+        if beliefstate is not self or len(self._history) < 2 or self._history[-2] is not last_turn:
+            return None
+        turn = self._history[-1]
+        values, entries = {}, {}
+        for key, value in dict.items(turn):
+            previous = dict.get(last_turn, key)
+            if value is previous:
+                continue  # still shared with the last turn
+            if isinstance(value, dict) and isinstance(previous, dict):
+                changed = {entry: item for entry, item in dict.items(value)
+                           if entry not in previous or _read(previous, entry) != item}
+                removed = [entry for entry in previous if entry not in value]
+                if changed or removed:
+                    entries[key] = (changed, removed)
+            elif key not in last_turn or value != previous:
+                values[key] = value
+        return values, entries, [key for key in last_turn if key not in turn]
+
+    def apply_delta(self, delta):
+        """ Starts a new turn with the changes published by the belief state tracker (see `delta_since`)
+
+        Args:
+            delta (tuple): the changes since the current turn
+        """
+        values, entries, removed = delta
+        self.start_new_turn()
+        turn = self._history[-1]
+        for key in removed:
+            del turn[key]
+        for key, value in values.items():
+            turn[key] = value
+        for key, (changed, removed_entries) in entries.items():
+            mapping = turn[key]
+            for entry in removed_entries:
+                del mapping[entry]
+            for entry, item in changed.items():
+                mapping[entry] = item
 
     def _init_beliefstate(self):
         """Initializes the belief state based on the currently active domain
@@ -118,6 +275,57 @@ class BeliefState:
 
         return belief_state
 
+    def _view(self, source: str, name: str, compute):
+        """ Returns a view of the current turn's `source` entry, computing it on first use """
+        views = self._views.setdefault(source, {})
+        if name not in views:
+            views[name] = compute(_read(self._history[-1], source))
+        return views[name]
+
+    def _sorted_informs(self, turn_idx: int = -1) -> dict:
+        """ Returns the informed values of each slot as (value, probability) pairs, most probable first """
+        def sort(informs):
+            return {slot: sorted(_read(informs, slot).items(), key=lambda kv: kv[1], reverse=True)
+                    for slot in informs}
+        if turn_idx == -1 or turn_idx == len(self._history) - 1:
+            return self._view('informs', 'sorted', sort)
+        return sort(_read(self._history[turn_idx], 'informs'))
+
+    def constraints(self) -> dict:
+        """ Returns the constraints of the current turn: the informed values of each slot the user
+            doesn't set to dontcare. The returned dictionary must not be modified.
+
+        Returns:
+            (dict): slot -> list of values
+        """
+        def constraints(informs):
+            dontcare = self.dontcare_slots()
+            return {slot: list(values) for slot, values in informs.items() if values and slot not in dontcare}
+        return self._view('informs', 'constraints', constraints)
+
+    def dontcare_slots(self) -> list:
+        """ Returns the slots of the current turn the user doesn't care about.
+            The returned list must not be modified. """
+        return self._view('informs', 'dontcare',
+                          lambda informs: [slot for slot, values in informs.items() if 'dontcare' in values])
+
+    def top_value(self, slot: str):
+        """ Returns the most probable informed value of a slot in the current turn
+
+        Args:
+            slot (str): the slot
+
+        Returns:
+            the value or `None` if no value was informed for the slot
+        """
+        values = self._sorted_informs().get(slot)
+        return values[0][0] if values else None
+
+    def requested_slots(self) -> list:
+        """ Returns the slots requested by the user in the current turn.
+            The returned list must not be modified. """
+        return self._view('requests', 'requested', list)
+
     def get_most_probable_slot_beliefs(self, slot: str, consider_NONE: bool = True,
                                        threshold: float = 0.7,
                                        max_results: int = 1000, turn_idx: int = -1):
@@ -143,10 +351,10 @@ class BeliefState:
             threshold.
         """
 
-        informs = self._history[turn_idx]["informs"]
+        sorted_informs = self._sorted_informs(turn_idx)
         candidates = []
-        if slot in informs:
-            sorted_slot_cands = sorted(informs[slot].items(), key=lambda kv: kv[1], reverse=True)
+        if slot in sorted_informs:
+            sorted_slot_cands = sorted_informs[slot]
             # restrict result count to specified maximum
             filtered_slot_cands = sorted_slot_cands[:max_results]
             # threshold by probabilities
@@ -179,10 +387,7 @@ class BeliefState:
         """
 
         candidates = {}
-        informs = self._history[turn_idx]["informs"]
-        for slot in informs:
-            # sort by belief
-            sorted_slot_cands = sorted(informs[slot].items(), key=lambda kv: kv[1], reverse=True)
+        for slot, sorted_slot_cands in self._sorted_informs(turn_idx).items():
             # restrict result count to specified maximum
             filtered_slot_cands = sorted_slot_cands[:max_results]
             # threshold by probabilities
@@ -205,10 +410,9 @@ class BeliefState:
             turn_idx: index for accessing the belief state history (default = -1: use last turn)
         """
 
-        candidates = []
-        for req_slot in self._history[turn_idx]['requests']:
-            candidates.append(req_slot)
-        return candidates
+        if turn_idx == -1 or turn_idx == len(self._history) - 1:
+            return list(self.requested_slots())
+        return list(_read(self._history[turn_idx], 'requests'))
 
     def _remove_dontcare_slots(self, slot_value_dict: dict):
         """ Returns a new dictionary without the slots set to dontcare """
@@ -216,6 +420,33 @@ class BeliefState:
         return {slot: value for slot, value in slot_value_dict.items()
                 if value != 'dontcare'}
 
+    def _constraint_fingerprint(self, constraints: dict, requested_slots: Iterable):
+        """ Returns a hashable key identifying a database query: the constrained slots with their
+            (sorted) values, ignoring `None` and dontcare values, and the requested slots """
+        slot_values = []
+        for slot in sorted(constraints):
+            values = constraints[slot] if isinstance(constraints[slot], list) else [constraints[slot]]
+            values = sorted({str(value) for value in values
+                             if value is not None and str(value).lower() != 'dontcare'})
+            if values:
+                slot_values.append((slot, tuple(values)))
+        return tuple(slot_values), frozenset(requested_slots)
+
+    def find_entities(self, constraints: dict, requested_slots: Iterable = ()):
+        """ Returns the database entities meeting the constraints (see `domain.find_entities`).
+            Results are kept for the current turn, keyed by the constraint fingerprint, so all
+            services handling this belief state (e.g. BST and policy) share one database lookup
+            per query and turn. The returned entities must not be modified.
+
+        Args:
+            constraints (dict): slot-value mapping of constraints
+            requested_slots (Iterable): slots to return in addition to the default ones
+        """
+        key = self._constraint_fingerprint(constraints, requested_slots)
+        if key not in self._db_results:
+            self._db_results[key] = self.domain.find_entities(constraints, requested_slots)
+        return self._db_results[key]
+
     def get_num_dbmatches(self):
         """ Updates the belief state's entry for the number of database matches given the
             constraints in the current turn.
@@ -225,24 +456,14 @@ class BeliefState:
         candidates = self.get_most_probable_inf_beliefs(consider_NONE=True, threshold=0.7,
                                                         max_results=1000)
         constraints = self._remove_dontcare_slots(candidates)
-        db_matches = self.domain.find_entities(constraints, self.domain.get_informable_slots())
-        num_matches = len(db_matches)
+        num_matches = self.domain.count(constraints)
 
         # check if matching db entities could be discriminated by more
         # information from user
         discriminable = False
-        if len(db_matches) > 1:
+        if num_matches > 1:
             dontcare_slots = set(candidates.keys()) - set(constraints.keys())
             informable_slots = set(self.domain.get_informable_slots()) - set(self.domain.get_primary_key())
-            for informable_slot in informable_slots:
-                if informable_slot not in dontcare_slots:
-                    # this slot could be used to gather more information
-                    db_values_for_slot = set()
-                    for db_match in db_matches:
-                        db_values_for_slot.add(db_match[informable_slot])
-                    if len(db_values_for_slot) > 1:
-                        # at least 2 different values for slot
-                        # ->can use this slot to differentiate between entities
-                        discriminable = True
-                        break
+            # slots with at least 2 different values among the matches could be used to gather more information
+            discriminable = self.domain.discriminable(constraints, informable_slots - dontcare_slots)
         return num_matches, discriminable
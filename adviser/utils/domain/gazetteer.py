@@ -0,0 +1,142 @@
+###############################################################################
+#
+# Copyright 2020, University of Stuttgart: Institute for Natural Language Processing (IMS)
+#
+# This file is part of Adviser.
+# Adviser is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3.
+#
+# Adviser is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Adviser.  If not, see <https://www.gnu.org/licenses/>.
+#
+###############################################################################
+
+import csv
+import json
+import os
+import re
+import threading
+from typing import Optional, Tuple
+
+import numpy
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(lat: float, lon: float, lats: numpy.ndarray, lons: numpy.ndarray) -> numpy.ndarray:
+    """ Computes the great-circle distances between one point and an array of points
+
+    Args:
+        lat (float): latitude of the point in degrees
+        lon (float): longitude of the point in degrees
+        lats (numpy.ndarray): latitudes of the other points in degrees
+        lons (numpy.ndarray): longitudes of the other points in degrees
+
+    Returns:
+        the distances in km (NaN for points with unknown coordinates)
+    """
+    lat, lon = numpy.radians(lat), numpy.radians(lon)
+    lats, lons = numpy.radians(lats), numpy.radians(lons)
+    a = numpy.sin((lats - lat) / 2) ** 2 + numpy.cos(lat) * numpy.cos(lats) * numpy.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(a))
+
+
+def _normalize(place: str) -> str:
+    return " ".join(place.lower().split())
+
+
+class Gazetteer:
+    """ Resolves place names and addresses to coordinates, as far as possible without network access:
+
+        1. landmarks of the gazetteer file, matched by regular expressions (e.g. "i am at the uni")
+        2. places (streets, points of interest, addresses) of the gazetteer file or imported via `import_places`
+        3. a persistent cache of geocoding results
+        4. geocoding with Nominatim (OpenStreetMap), if enabled; the result is added to the cache
+    """
+
+    def __init__(self, gazetteer_file: str, cache_file: str = None, geocode: bool = True):
+        """
+        Args:
+            gazetteer_file (str): path to a JSON file with `landmarks` (`name`, `pattern`, `coordinate`)
+                                  and `places` (name -> coordinate)
+            cache_file (str): path to the geocoding cache (default: the gazetteer file with suffix `.cache.json`)
+            geocode (bool): if `False`, places which are not in the gazetteer or the cache are not resolved
+        """
+        with open(gazetteer_file, encoding='utf-8') as f:
+            gazetteer = json.load(f)
+        self.landmarks = [(re.compile(landmark['pattern']), tuple(landmark['coordinate']))
+                          for landmark in gazetteer.get('landmarks', [])]
+        self.places = {_normalize(place): tuple(coordinate)
+                       for place, coordinate in gazetteer.get('places', {}).items()}
+        self.cache_file = cache_file or os.path.splitext(gazetteer_file)[0] + '.cache.json'
+        self.cache = {}
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, encoding='utf-8') as f:
+                self.cache = {place: tuple(coordinate) if coordinate else None
+                              for place, coordinate in json.load(f).items()}
+        self.geocode = geocode
+        self._geolocator = None
+        self._lock = threading.Lock()
+
+    def import_places(self, csv_file: str):
+        """ Adds the places of a CSV file with the columns `name`, `latitude` and `longitude`
+            (e.g. streets or points of interest exported from OpenStreetMap)
+
+        Args:
+            csv_file (str): path to the CSV file
+        """
+        with open(csv_file, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                self.places[_normalize(row['name'])] = (float(row['latitude']), float(row['longitude']))
+
+    def resolve(self, place: str) -> Optional[Tuple[float, float]]:
+        """ Returns the coordinates of a place
+
+        Args:
+            place (str): place name or address
+
+        Returns:
+            (latitude, longitude) or `None` if the place is unknown
+        """
+        place = _normalize(place)
+        for pattern, coordinate in self.landmarks:
+            if pattern.match(place):
+                return coordinate
+        if place in self.places:
+            return self.places[place]
+        with self._lock:
+            if place in self.cache:
+                return self.cache[place]
+        if not self.geocode:
+            return None
+        coordinate = self._geocode(place)
+        if coordinate is not False:
+            with self._lock:
+                self.cache[place] = coordinate
+                self._save_cache()
+        return coordinate if coordinate else None
+
+    def _geocode(self, place: str):
+        """ Geocodes a place with Nominatim; returns `None` if the place is unknown and `False` if
+            geocoding failed (e.g. without network access), so that the place is not cached """
+        from geopy.exc import GeopyError
+        from geopy.geocoders import Nominatim
+        if self._geolocator is None:
+            self._geolocator = Nominatim(user_agent="myGeocoder")
+        try:
+            location = self._geolocator.geocode(place)
+        except GeopyError:
+            return False
+        return (location.latitude, location.longitude) if location else None
+
+    def _save_cache(self):
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.cache, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_file, self.cache_file)
@@ -18,18 +18,524 @@
 ###############################################################################
 
 
+import atexit
+import datetime
+import functools
+import inspect
 import re
+from collections import Counter, OrderedDict
 import json
 import math
 import os
+import pathlib
 import sqlite3
-from io import StringIO
-from typing import List, Iterable
+import string
+import threading
+import time
+from typing import List, Iterable, Tuple, Set
+
+import numpy
 
 from utils.domain import Domain
+from utils.domain.gazetteer import EARTH_RADIUS_KM, Gazetteer, haversine
+
+
+# one in-memory copy (and result cache) per database file and process, shared by all domain objects (and threads)
+_memory_dbs = {}
+_result_caches = {}
+_memory_dbs_lock = threading.Lock()
+# write-behind journals persisting the changes to the in-memory copies, per database file
+_journals = {}
+# gazetteers (with their geocoding caches) per gazetteer file
+_gazetteers = {}
+# domain objects per (class, name, ontology file, database file), see `get_domain`
+_domains = {}
+
+NEAR_SLOT = 'near'  # pseudo-slot ranking the entities by distance to a place or (latitude, longitude)
+OPEN_AT_SLOT = 'open_at'  # pseudo-slot keeping the entities open at (day, time) or 'now'
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+_MINUTES_PER_DAY = 24 * 60
+_MINUTES_PER_WEEK = 7 * _MINUTES_PER_DAY
+_TIME = re.compile(r'(\d{1,2})(?::(\d\d))?\s*([ap]m)?$')
+
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)  # case folding of sqlite's NOCASE collation
+
+
+def _nocase(value: str) -> str:
+    """ Normalizes a string such that it equals all strings sqlite considers equal under the NOCASE collation """
+    return value.translate(_NOCASE)
+
+
+class _ResultCache:
+    """ LRU cache for the results of `find_entities` on one database.
+        Has to be cleared whenever the database is modified. """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0  # incremented on every invalidation
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        """ Returns the cached rows for the key (`None` if not cached) and the current generation """
+        with self._lock:
+            rows = self._results.get(key)
+            if rows is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._results.move_to_end(key)
+            return rows, self.generation
+
+    def put(self, key: tuple, rows: list, generation: int):
+        """ Caches the rows of a query unless the database was modified since the query started """
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._results[key] = rows
+            self._results.move_to_end(key)
+            if len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.generation += 1
+
+
+def _journal_path(db_file_path: str) -> str:
+    """ Returns the path of the file journaling the changes to a database file """
+    return db_file_path + '.changes'
+
+
+def _last_applied_change(db: sqlite3.Connection) -> int:
+    """ Returns the sequence number of the last journaled change written to a database file (0 if none) """
+    db.execute('CREATE TABLE IF NOT EXISTS journal_position (id INTEGER PRIMARY KEY CHECK (id = 0), seq INTEGER NOT NULL)')
+    row = db.execute('SELECT seq FROM journal_position').fetchone()
+    return row[0] if row else 0
+
+
+def _apply_changes(db_file_path: str, changes: List[Tuple[int, str, list]]):
+    """ Writes changes to a database file in a single transaction (in WAL mode).
+        The sequence number of the last change is stored in the same transaction and changes which
+        were already written are skipped, so that replaying a journal never applies a change twice.
+
+    Args:
+        db_file_path (str): absolute path to database file
+        changes (List[Tuple[int, str, list]]): (sequence number, sqlite3 statement,
+                                                values bound to its placeholders)
+    """
+    db = sqlite3.connect(db_file_path)
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+        with db:
+            last_applied = _last_applied_change(db)
+            for seq, statement, params in changes:
+                if seq > last_applied:
+                    db.execute(statement, params)
+            db.execute('INSERT OR REPLACE INTO journal_position VALUES (0, ?)',
+                       (max(last_applied, changes[-1][0]), ))
+    finally:
+        db.close()
+
+
+def _replay_changes(db_file_path: str):
+    """ Writes the changes of a journal left behind by a crashed process to the database file and
+        removes the journal. A partially written last entry is skipped.
+
+    Args:
+        db_file_path (str): absolute path to database file
+    """
+    journal_path = _journal_path(db_file_path)
+    if not os.path.exists(journal_path):
+        return
+    changes = []
+    with open(journal_path, encoding='utf-8') as journal:
+        for line in journal:
+            try:
+                changes.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    if changes:
+        _apply_changes(db_file_path, changes)
+    os.remove(journal_path)
+
+
+class _WriteBehindJournal:
+    """ Write-behind persistence of the changes made to the in-memory copy of a database file:
+        changes are appended to a journal next to the database file and written to the database file in
+        batched transactions by a background thread, so that no disk sync happens on the dialog's hot path.
+        Journaled changes are replayed at startup after a crash (see `_replay_changes`); changes are
+        numbered so that none is written twice.
+    """
+
+    def __init__(self, db_file_path: str, flush_interval: float = 1.0):
+        """
+        Args:
+            db_file_path (str): absolute path to database file
+            flush_interval (float): seconds to collect changes before writing them as one batch
+        """
+        self.db_file_path = db_file_path
+        self.flush_interval = flush_interval
+        self._pending = []  # journaled changes not yet written to the database file
+        db = sqlite3.connect(db_file_path)
+        self._seq = _last_applied_change(db)  # sequence number of the last journaled change
+        db.close()
+        self._lock = threading.Lock()  # guards the journal and the pending changes
+        self._flush_lock = threading.Lock()  # serializes flushes
+        self._changed = threading.Event()
+        self._closed = threading.Event()
+        self._journal = open(_journal_path(db_file_path), 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, statement: str, params: Iterable = ()):
+        """ Journals a change (already applied to the in-memory copy) for writing it to the database file
+
+        Args:
+            statement (str): sqlite3 statement, may contain `?` placeholders
+            params (Iterable): values bound to the placeholders (have to be JSON-serializable)
+        """
+        params = list(params)
+        with self._lock:
+            self._seq += 1
+            change = (self._seq, statement, params)
+            self._journal.write(json.dumps(change) + '\n')
+            self._journal.flush()
+            self._pending.append(change)
+        self._changed.set()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._changed.wait()
+            self._closed.wait(self.flush_interval)  # collect further changes into the same batch
+            self._changed.clear()
+            self.flush()
+
+    def flush(self):
+        """ Writes all pending changes to the database file and removes them from the journal """
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return
+            _apply_changes(self.db_file_path, batch)
+            with self._lock:
+                del self._pending[:len(batch)]
+                # rewrite the journal with the changes made while writing the batch
+                self._journal.close()
+                self._journal = open(_journal_path(self.db_file_path), 'w', encoding='utf-8')
+                for change in self._pending:
+                    self._journal.write(json.dumps(change) + '\n')
+                self._journal.flush()
+
+    def close(self):
+        """ Stops the background thread and writes the remaining changes to the database file """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._changed.set()
+        self._thread.join()
+        self.flush()
+        with self._lock:
+            self._journal.close()
+        if os.path.exists(_journal_path(self.db_file_path)):
+            os.remove(_journal_path(self.db_file_path))
+
+
+@functools.lru_cache(maxsize=256)
+def _select_sql(table: str, columns: Tuple[str, ...], predicates: Tuple[Tuple[str, int], ...]) -> str:
+    """ Builds a SELECT statement with `?` placeholders from the shape of a query only, so that the same
+        SQL text (and thus the prepared statement cached by the sqlite3 connection) is reused for all
+        queries of this shape.
 
-from geopy.geocoders import Nominatim
-import geopy.distance
+    Args:
+        table (str): table name
+        columns (Tuple[str, ...]): selected columns
+        predicates (Tuple[Tuple[str, int], ...]): (slot, number of values) per constrained slot;
+                                                  a slot matches any of its values (case-insensitive)
+
+    Returns:
+        the SQL statement
+    """
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if predicates:
+        query += " WHERE " + " AND ".join("(" + " OR ".join([f"{slot}=? COLLATE NOCASE"] * count) + ")"
+                                          for slot, count in predicates)
+    return query
+
+
+class _ColumnarIndex:
+    """ Columnar in-memory index of (text) slots of a domain for matching constraints without creating rows.
+        Holds one bitset (packed boolean numpy array over all rows) per (slot, value): constraints are matched
+        by OR-ing the bitsets of the values of a slot and AND-ing the results of all slots, like `find_entities`.
+        Bitsets are created when a value is first looked up.
+    """
+
+    def __init__(self, rows: List[dict], slots: Iterable[str], generation: int):
+        """
+        Args:
+            rows (List[dict]): all rows of the table with (at least) the values of `slots`
+            slots (Iterable[str]): slots to index
+            generation (int): generation of the result cache of the database when the rows were read
+        """
+        self.size = len(rows)
+        self.generation = generation
+        self._values = {}  # slot -> distinct values (position = value id)
+        self._ids = {}  # slot -> normalized value -> ids of the values matching it
+        self._codes = {}  # slot -> value id per row
+        self._bitsets = {}  # (slot, normalized value) -> bitset
+        self._all = numpy.packbits(numpy.ones(self.size, dtype=bool))
+        for slot in slots:
+            ids = {}
+            self._codes[slot] = numpy.fromiter((ids.setdefault(row[slot], len(ids)) for row in rows),
+                                               dtype=numpy.int64, count=self.size)
+            self._values[slot] = list(ids)
+            self._ids[slot] = {}
+            for value, value_id in ids.items():
+                if value is not None:  # NULL matches nothing
+                    self._ids[slot].setdefault(_nocase(str(value)), []).append(value_id)
+
+    def covers(self, slots: Iterable[str]) -> bool:
+        """ Returns `True` if all slots are indexed """
+        return all(slot in self._codes for slot in slots)
+
+    def _bitset(self, slot: str, value: str):
+        key = (slot, value)
+        if key not in self._bitsets:
+            self._bitsets[key] = numpy.packbits(numpy.isin(self._codes[slot], self._ids[slot].get(value, [])))
+        return self._bitsets[key]
+
+    def match(self, constraints: List[Tuple[str, List[str]]]):
+        """ Returns the bitset of the rows matching the constraints (NOCASE-normalized values per slot) """
+        matches = self._all
+        for slot, values in constraints:
+            values = iter(values)
+            slot_matches = self._bitset(slot, next(values))
+            for value in values:
+                slot_matches = slot_matches | self._bitset(slot, value)
+            matches = matches & slot_matches
+        return matches
+
+    def count(self, matches) -> int:
+        """ Returns the number of rows in the bitset """
+        return int(numpy.count_nonzero(numpy.unpackbits(matches)))
+
+    def distinct_values(self, slot: str, matches) -> Set:
+        """ Returns the values of a slot in the rows of the bitset """
+        rows = numpy.unpackbits(matches, count=self.size).astype(bool)
+        return {self._values[slot][value_id] for value_id in numpy.unique(self._codes[slot][rows])}
+
+    def discriminable(self, slots: Iterable[str], matches) -> bool:
+        """ Returns `True` if any of the slots has different values in the rows of the bitset """
+        rows = numpy.unpackbits(matches, count=self.size).astype(bool)
+        for slot in slots:
+            codes = self._codes[slot][rows]
+            if codes.size > 0 and (codes != codes[0]).any():
+                return True
+        return False
+
+
+class _SpatialIndex:
+    """ Uniform grid over the coordinates of the entities for radius and nearest-entity queries.
+        Coordinates are projected to a plane (equirectangular around their mean latitude) only to select
+        the grid cells to search, distances are great-circle distances.
+        Entities without coordinates are not indexed. """
+
+    def __init__(self, coordinates: numpy.ndarray, cell_km: float = 1.0):
+        """
+        Args:
+            coordinates (numpy.ndarray): (latitude, longitude) per entity, NaN where unknown
+            cell_km (float): edge length of the grid cells
+        """
+        self.coordinates = coordinates
+        self.cell_km = cell_km
+        self.located = numpy.flatnonzero(~numpy.isnan(coordinates[:, 0]))
+        self._cos_lat = math.cos(math.radians(numpy.mean(coordinates[self.located, 0]))) if len(self.located) else 1.0
+        self.cells = {}
+        for position, cell in zip(self.located, self._cell(coordinates[self.located, 0], coordinates[self.located, 1]).T):
+            self.cells.setdefault(tuple(cell), []).append(position)
+        self.cells = {cell: numpy.array(positions) for cell, positions in self.cells.items()}
+
+    def _cell(self, lat, lon) -> numpy.ndarray:
+        """ Returns the grid cell(s) (column, row) of coordinates """
+        x = EARTH_RADIUS_KM * numpy.radians(lon) * self._cos_lat
+        y = EARTH_RADIUS_KM * numpy.radians(lat)
+        return numpy.floor(numpy.array([x, y]) / self.cell_km).astype(int)
+
+    def near(self, lat: float, lon: float, radius_km: float = None) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """ Returns the positions of the entities within a radius around a point, nearest first
+
+        Args:
+            lat (float): latitude of the point
+            lon (float): longitude of the point
+            radius_km (float): search radius (`None` for all entities)
+
+        Returns:
+            positions, distances in km
+        """
+        positions = self.located
+        if radius_km is not None:
+            # some slack for the projection error
+            reach = int(math.ceil(1.01 * radius_km / self.cell_km))
+            col, row = self._cell(lat, lon)
+            if (2 * reach + 1) ** 2 < len(self.cells):
+                cells = [self.cells.get((c, r)) for c in range(col - reach, col + reach + 1)
+                         for r in range(row - reach, row + reach + 1)]
+                cells = [cell for cell in cells if cell is not None]
+                positions = numpy.concatenate(cells) if cells else numpy.array([], dtype=int)
+        distances = haversine(lat, lon, self.coordinates[positions, 0], self.coordinates[positions, 1])
+        if radius_km is not None:
+            within = distances <= radius_km
+            positions, distances = positions[within], distances[within]
+        order = numpy.argsort(distances, kind='stable')
+        return positions[order], distances[order]
+
+
+def _parse_time(time: str, meridiem: str = None) -> int:
+    """ Parses a time of day ("7pm", "6:30am", "12", "18:30") into minutes since midnight
+
+    Args:
+        time (str): time of day
+        meridiem (str): 'am' or 'pm' if the time doesn't say (e.g. the start of "5 to 11pm");
+                        without am/pm, times are read as 24-hour clock times
+
+    Returns:
+        minutes since midnight (`None` if the time can't be parsed)
+    """
+    match = _TIME.match(time.strip().lower())
+    if match is None:
+        return None
+    hours, minutes = int(match.group(1)) % 12 if (match.group(3) or meridiem) else int(match.group(1)), \
+        int(match.group(2) or 0)
+    if (match.group(3) or meridiem) == 'pm':
+        hours += 12
+    return hours * 60 + minutes
+
+
+def _parse_opening_hours(opening_hours: dict) -> List[Tuple[int, int]]:
+    """ Parses opening hours (day -> e.g. "11:30am to 2:30pm, 5 to 11pm", "Open 24 hours" or "Closed")
+        into intervals [start, end) of minutes since Monday 0:00. Intervals past midnight are continued on the
+        next day (and intervals past Sunday midnight on Monday). Unparsable hours are skipped.
+
+    Args:
+        opening_hours (dict): opening hours per weekday
+
+    Returns:
+        the intervals
+    """
+    intervals = []
+    for day, hours in opening_hours.items():
+        if day not in WEEKDAYS:
+            continue
+        day_start = WEEKDAYS.index(day) * _MINUTES_PER_DAY
+        if hours.strip().lower() == 'open 24 hours':
+            intervals.append((day_start, day_start + _MINUTES_PER_DAY))
+            continue
+        for shift in hours.split(','):
+            times = re.split(r'\s*(?:to|–|-)\s*', shift.strip())
+            if len(times) != 2:
+                continue
+            end = _parse_time(times[1])
+            end_meridiem = _TIME.match(times[1].strip().lower())
+            start = _parse_time(times[0], end_meridiem.group(3) if end_meridiem else None)
+            if start is None or end is None:
+                continue
+            if end <= start:
+                end += _MINUTES_PER_DAY  # e.g. "5pm to 2am"
+            start, end = day_start + start, day_start + end
+            if end > _MINUTES_PER_WEEK:
+                intervals.append((0, end - _MINUTES_PER_WEEK))
+                end = _MINUTES_PER_WEEK
+            intervals.append((start, end))
+    return intervals
+
+
+class _OpeningHoursIndex:
+    """ Opening hours of all entities, parsed once into intervals of minutes since Monday 0:00,
+        for finding the entities open at a given time. Entities without opening hours are never open. """
+
+    def __init__(self, rows: List[dict], key: str):
+        """
+        Args:
+            rows (List[dict]): primary key and `opening_hours` (JSON) per entity
+            key (str): name of the primary key
+        """
+        self.opening_hours = {}  # primary key -> opening hours per day (as stored)
+        starts, ends, owners = [], [], []
+        for row in rows:
+            if not row['opening_hours'] or row['opening_hours'] == 'None':
+                continue
+            self.opening_hours[row[key]] = json.loads(row['opening_hours'])
+            for start, end in _parse_opening_hours(self.opening_hours[row[key]]):
+                starts.append(start)
+                ends.append(end)
+                owners.append(row[key])
+        self.starts = numpy.array(starts, dtype=int)
+        self.ends = numpy.array(ends, dtype=int)
+        self.owners = numpy.array(owners, dtype=object)
+
+    def open_at(self, day: str, minutes: int) -> Set:
+        """ Returns the primary keys of the entities open at the given time
+
+        Args:
+            day (str): weekday
+            minutes (int): minutes since midnight
+        """
+        time = WEEKDAYS.index(day) * _MINUTES_PER_DAY + minutes
+        return set(self.owners[(self.starts <= time) & (time < self.ends)])
+
+
+def _domain_key(cls: type, init_args: dict) -> tuple:
+    """ Returns the key of a domain in the domain registry: its class, name, resource files and other arguments """
+    root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    arguments = inspect.signature(JSONLookupDomain.__init__).bind(None, **init_args)
+    arguments.apply_defaults()
+    init_args = dict(arguments.arguments)
+    del init_args['self']
+    name = init_args['name']
+    json_ontology_file = init_args.get('json_ontology_file') or os.path.join('resources', 'ontologies', name + '.json')
+    sqllite_db_file = init_args.get('sqllite_db_file') or os.path.join('resources', 'databases', name + '.db')
+    others = tuple(sorted((arg, value) for arg, value in init_args.items()
+                          if arg not in ('name', 'json_ontology_file', 'sqllite_db_file')))
+    return (cls, name, os.path.realpath(root_dir + '/' + json_ontology_file),
+            os.path.realpath(root_dir + '/' + sqllite_db_file)) + others
+
+
+def get_domain(name: str, json_ontology_file: str = None, sqllite_db_file: str = None, **kwargs):
+    """ Returns the domain created first in this process with the given name, resource files and
+        arguments, or creates it. Unpickled domains are resolved the same way, so that all services of a process
+        share one domain object per domain.
+
+    Args:
+        name (str): the domain's name
+        json_ontology_file (str): relative path to the ontology file (see `JSONLookupDomain`)
+        sqllite_db_file (str): relative path to the database file (see `JSONLookupDomain`)
+        **kwargs: further arguments of `JSONLookupDomain`, used if the domain is created
+
+    Returns:
+        JSONLookupDomain
+    """
+    return _resolve_domain(JSONLookupDomain, dict(name=name, json_ontology_file=json_ontology_file,
+                                                  sqllite_db_file=sqllite_db_file, **kwargs))
+
+
+def _resolve_domain(cls: type, init_args: dict):
+    """ Returns the registered domain for a domain handle (see `JSONLookupDomain.__reduce__`) or creates it.
+        Domains of subclasses are created with the arguments of `JSONLookupDomain` only. """
+    key = _domain_key(cls, init_args)
+    with _memory_dbs_lock:
+        domain = _domains.get(key)
+    if domain is None:
+        domain = cls.__new__(cls)
+        JSONLookupDomain.__init__(domain, **init_args)
+        with _memory_dbs_lock:
+            domain = _domains.setdefault(key, domain)
+    return domain
 
 
 class JSONLookupDomain(Domain):
@@ -38,7 +544,7 @@ class JSONLookupDomain(Domain):
     """
 
     def __init__(self, name: str, json_ontology_file: str = None, sqllite_db_file: str = None, \
-                 display_name: str = None):
+                 display_name: str = None, columnar_index: bool = True, persist_changes: bool = False):
         """ Loads the ontology from a json file and the data from a sqllite
             database.
 
@@ -54,35 +560,70 @@ class JSONLookupDomain(Domain):
                                 (from the top-level adviser directory, e.g. resources/databases)
             display_name (str): the domain's name as it appears on the screen
                                 (e.g. containing whitespaces)
+            columnar_index (bool): if `True`, `count`, `distinct_values` and `discriminable` use a columnar
+                                   in-memory index of the informable slots instead of querying the database
+            persist_changes (bool): if `True`, changes made via `modify_db` (e.g. ratings and reviews) are
+                                    also written to the database file (asynchronously, see `flush_changes`);
+                                    otherwise they only last as long as the process
         """
         super(JSONLookupDomain, self).__init__(name)
 
         root_dir = self._get_root_dir()
         self.sqllite_db_file = sqllite_db_file
+        self.json_ontology_file = json_ontology_file
+        self.columnar_index = columnar_index
+        self.persist_changes = persist_changes
         # make sure to set default values in case of None
         json_ontology_file = json_ontology_file or os.path.join('resources', 'ontologies',
                                                                 name + '.json')
         sqllite_db_file = sqllite_db_file or os.path.join('resources', 'databases',
                                                           name + '.db')
 
+        # arguments identifying this domain when it is pickled (see `__reduce__`)
+        self._init_args = {'name': name, 'json_ontology_file': self.json_ontology_file,
+                           'sqllite_db_file': self.sqllite_db_file,
+                           'display_name': display_name, 'columnar_index': columnar_index,
+                           'persist_changes': persist_changes}
+
+        start = time.perf_counter()
         self.ontology_json = json.load(open(root_dir + '/' + json_ontology_file))
+        ontology_time = time.perf_counter()
         # load database
         self.db = self._load_db_to_memory(root_dir + '/' + sqllite_db_file)
+        self._query_counts = Counter()  # (columns, predicates) -> number of calls of find_entities
+        # startup timings in seconds (the database is only loaded by the first domain object using it)
+        self.load_times = {'ontology': ontology_time - start, 'database': time.perf_counter() - ontology_time}
+        if self._has_coordinates:
+            self._get_spatial_index()
+        if self._has_opening_hours:
+            self._get_opening_hours_index()
 
         self.display_name = display_name if display_name is not None else name
+        with _memory_dbs_lock:
+            _domains.setdefault(_domain_key(type(self), self._init_args), self)
+
+    def __reduce__(self):
+        # pickle a handle instead of the ontology and indexes; it is resolved against the domains
+        # registered in the receiving process (see `get_domain`)
+        return _resolve_domain, (type(self), self._init_args)
 
     def __getstate__(self):
-        # remove sql connection from state dict so that pickling works
+        # remove sql connection (and the result cache shared with it) from state dict so that pickling works
         state = self.__dict__.copy()
-        if 'db' in state:
-            del state['db']
+        state.pop('db', None)
+        state.pop('_result_cache', None)
+        state.pop('_index', None)
+        state.pop('_coordinates', None)
+        state.pop('_spatial_index', None)
+        state.pop('_opening_hours_index', None)
         return state
 
     def _get_root_dir(self):
         """ Returns the path to the root directory """
         return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    def _sqllite_dict_factory(self, cursor, row):
+    @staticmethod
+    def _sqllite_dict_factory(cursor, row):
         """ Convert sqllite row into a dictionary """
         row_dict = {}
         for col_idx, col in enumerate(cursor.description):
@@ -92,7 +633,12 @@ class JSONLookupDomain(Domain):
 
     def _load_db_to_memory(self, db_file_path : str):
         """ Loads a sqllite3 database from file to memory in order to save
-            I/O operations
+            I/O operations.
+            The database file is only copied once per process (using the sqlite backup API);
+            all domain objects loading the same file share the in-memory copy, including changes
+            made via `modify_db`.
+            Changes journaled but not yet written to the file by a previous (crashed) process are
+            written to the file first.
 
         Args:
             db_file_path (str): absolute path to database file
@@ -100,27 +646,82 @@ class JSONLookupDomain(Domain):
         Returns:
             A sqllite3 connection
         """
+        db_file_path = os.path.realpath(db_file_path)
+        self._db_file_path = db_file_path
+        with _memory_dbs_lock:
+            if db_file_path not in _memory_dbs:
+                _replay_changes(db_file_path)
+                # copy db file page by page into a database in memory
+                file_db = sqlite3.connect(pathlib.Path(db_file_path).as_uri() + '?mode=ro', uri=True)
+                db = sqlite3.connect(':memory:', check_same_thread=False, cached_statements=256)
+                file_db.backup(db)
+                file_db.close()
+                db.row_factory = self._sqllite_dict_factory
+                _memory_dbs[db_file_path] = db
+                _result_caches[db_file_path] = _ResultCache()
+            self._result_cache = _result_caches[db_file_path]
+            self._create_indexes(_memory_dbs[db_file_path])
+            self._has_review_table = _memory_dbs[db_file_path].execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='reviews'").fetchone() is not None
+            columns = {row['name'] for row in _memory_dbs[db_file_path].execute(
+                f'PRAGMA table_info({self.get_domain_name()})')}
+            self._has_coordinates = 'coordinate' in columns
+            self._has_opening_hours = 'opening_hours' in columns
+            return _memory_dbs[db_file_path]
 
-        # open and read db file to temporary file
-        file_db = sqlite3.connect(db_file_path, check_same_thread=False)
-        tempfile = StringIO()
-        for line in file_db.iterdump():
-            tempfile.write('%s\n' % line)
-        file_db.close()
-        tempfile.seek(0)
-        # Create a database in memory and import from temporary file
-        db = sqlite3.connect(':memory:', check_same_thread=False)
-        db.row_factory = self._sqllite_dict_factory
-        db.cursor().executescript(tempfile.read())
-        db.commit()
-        # file_db.backup(databases[domain]) # works only in python >= 3.7
+    def _column_sql(self, slot: str) -> str:
+        """ Returns the SQL expression selecting the value of a slot. If the database stores reviews in a
+            separate `reviews` table (see tools/scrape_maps/normalize_reviews.py), the `reviews` slot is
+            the JSON list of an entity's reviews (oldest first, the order of the index on `reviews.name`).
 
-        return db
+        Args:
+            slot (str): slot name
+
+        Returns:
+            a column name or an expression for the SELECT clause
+        """
+        if slot == 'reviews' and self._has_review_table:
+            table = self.get_domain_name()
+            return f'(SELECT json_group_array(review) FROM reviews ' \
+                   f'WHERE reviews.name = {table}.{self.get_primary_key()}) AS reviews'
+        return slot
+
+    def _create_indexes(self, db: sqlite3.Connection):
+        """ Creates the indexes used by the lookups of this domain (if they don't exist yet):
+            a case-insensitive index per informable slot (for `find_entities`), an index on the primary key
+            (for lookups by entity) and a case-insensitive composite index for each list of slots in the
+            optional ontology entry `composite_indexes` (for slots frequently constrained together).
+            Slots without a column in the database table are skipped.
+
+        Args:
+            db (sqlite3.Connection): database connection
+        """
+        table = self.get_domain_name()
+        columns = {row['name'] for row in db.execute(f'PRAGMA table_info({table})')}
+        indexes = {f'idx_{table}_key': (self.get_primary_key(), )}
+        for slots in [[slot] for slot in self.get_informable_slots()] + self.ontology_json.get('composite_indexes', []):
+            indexes[f'idx_{table}_{"_".join(slots)}_nocase'] = tuple(f'{slot} COLLATE NOCASE' for slot in slots)
+        for index, index_columns in indexes.items():
+            if all(column.split()[0] in columns for column in index_columns):
+                db.execute(f'CREATE INDEX IF NOT EXISTS {index} ON {table} ({", ".join(index_columns)})')
+
+    def _connect(self):
+        """ Reconnects to the in-memory database if the connection was removed by pickling """
+        if "db" not in self.__dict__:
+            root_dir = self._get_root_dir()
+            sqllite_db_file = self.sqllite_db_file or os.path.join(
+                'resources', 'databases', self.name + '.db')
+            self.db = self._load_db_to_memory(root_dir + '/' + sqllite_db_file)
 
     def find_entities(self, constraints: dict, requested_slots: Iterable = iter(())):
         """ Returns all entities from the data backend that meet the constraints, with values for
             the primary key and the system requestable slots (and optional slots, specifyable
             via requested_slots).
+            Results are cached per (normalized) constraints and requested slots until the database
+            is modified.
+            The pseudo-slot `NEAR_SLOT` ranks the results by their distance to a place (nearest first)
+            instead of filtering them, the pseudo-slot `OPEN_AT_SLOT` keeps the entities open at
+            a time: (weekday, time of day) or 'now'.
 
         Args:
             constraints (dict): Slot-value mapping of constraints.
@@ -129,31 +730,153 @@ class JSONLookupDomain(Domain):
                                         system requestable slots and the primary key
 
         """
+        if NEAR_SLOT in constraints:
+            constraints = dict(constraints)
+            place = constraints.pop(NEAR_SLOT)
+            return self._sort_by_distance(self.find_entities(constraints, requested_slots), place)
+        if OPEN_AT_SLOT in constraints:
+            constraints = dict(constraints)
+            open_entities = self._open_at(constraints.pop(OPEN_AT_SLOT))
+            return [entity for entity in self.find_entities(constraints, requested_slots)
+                    if entity[self.get_primary_key()] in open_entities]
         # values for name and all system requestable slots
-        select_clause = ", ".join(set([self.get_primary_key()]) |
-                                  set(self.get_system_requestable_slots()) |
-                                  set(requested_slots))
-        query = "SELECT {} FROM {}".format(select_clause, self.get_domain_name())
-        try:
-            constraints = {slot: value.replace("'", "''") for slot, value in constraints.items()
-                        if value is not None and str(value).lower() != 'dontcare'}
-        except AttributeError:
-            constraints = {slot: [value.replace("'", "''") for value in values if value is not None and str(value).lower() != 'dontcare'] for slot, values in constraints.items()}
-        if constraints:
-            if all(isinstance(v, list) for v in constraints.values()):
-                for i, (key, vals) in enumerate(constraints.items()):
-                    if len(vals) == 0:
-                        continue
-                    if not 'WHERE' in query:
-                        query += ' WHERE ('
-                    else:
-                        query += ') AND ('
-                    query += ' OR '.join("{}='{}' COLLATE NOCASE".format(key, str(val)) for val in vals)
-                query += ')'
-            else:
-                query += ' WHERE ' + ' AND '.join("{}='{}' COLLATE NOCASE".format(key, str(val))
-                                              for key, val in constraints.items())
-        return self.query_db(query)
+        columns = tuple(self._column_sql(slot) for slot in sorted(set([self.get_primary_key()]) |
+                                                                  set(self.get_system_requestable_slots()) |
+                                                                  set(requested_slots)))
+        predicates = []
+        params = []
+        for slot, values in self._get_constraint_values(constraints):
+            predicates.append((slot, len(values)))
+            params.extend(values)
+        predicates = tuple(predicates)
+        # matching is case-insensitive and ignores the order of values
+        key = (self.get_domain_name(), columns,
+               tuple((slot, tuple(sorted(values))) for slot, values in self._normalize_constraints(constraints)))
+        self._connect()
+        rows, generation = self._result_cache.get(key)
+        if rows is None:
+            self._query_counts[(columns, predicates)] += 1
+            rows = self.query_db(_select_sql(self.get_domain_name(), columns, predicates), params)
+            self._result_cache.put(key, rows, generation)
+        # rows are dictionaries, so hand out copies to keep the cached ones unchanged
+        return [dict(row) for row in rows]
+
+    def _get_constraint_values(self, constraints: dict) -> List[Tuple[str, List[str]]]:
+        """ Returns the values per constrained slot (sorted by slot); a slot can be constrained to a single value
+            or to a list of alternative values. `None` and dontcare values and the pseudo-slots `NEAR_SLOT` and `OPEN_AT_SLOT` are ignored. """
+        slot_values = []
+        for slot in sorted(constraints):
+            if slot in (NEAR_SLOT, OPEN_AT_SLOT):
+                continue  # not stored in a column
+            values = constraints[slot] if isinstance(constraints[slot], list) else [constraints[slot]]
+            values = [str(value) for value in values
+                      if value is not None and str(value).lower() != 'dontcare']
+            if values:
+                slot_values.append((slot, values))
+        return slot_values
+
+    def _normalize_constraints(self, constraints: dict) -> List[Tuple[str, Set[str]]]:
+        """ Like `_get_constraint_values`, but with values normalized for case-insensitive (NOCASE) matching """
+        return [(slot, {_nocase(value) for value in values})
+                for slot, values in self._get_constraint_values(constraints)]
+
+    def _get_index(self, slots: Iterable[str]):
+        """ Returns the columnar index if it is enabled and covers all slots, else `None`.
+            The index is (re)built on first use and after the database was modified. """
+        if not self.columnar_index:
+            return None
+        self._connect()
+        index = self.__dict__.get('_index')
+        generation = self._result_cache.generation
+        if index is None or index.generation != generation:
+            # index text columns of informable slots only, other types are compared differently by sqlite
+            table = self.get_domain_name()
+            text_columns = {row['name'] for row in self.query_db(f'PRAGMA table_info({table})')
+                            if any(text_type in row['type'].upper() for text_type in ('CHAR', 'CLOB', 'TEXT'))}
+            index_slots = [slot for slot in self.get_informable_slots() if slot in text_columns]
+            rows = self.query_db(f'SELECT {", ".join(index_slots)} FROM {table}') if index_slots else []
+            index = _ColumnarIndex(rows, index_slots, generation)
+            self._index = index
+        return index if index.covers(slots) else None
+
+    def count(self, constraints: dict) -> int:
+        """ Returns the number of entities meeting the constraints (see `find_entities`)
+
+        Args:
+            constraints (dict): Slot-value mapping of constraints
+        """
+        normalized = self._normalize_constraints(constraints)
+        index = self._get_index(slot for slot, _ in normalized) if OPEN_AT_SLOT not in constraints else None
+        if index is None:
+            return len(self.find_entities(constraints))
+        return index.count(index.match(normalized))
+
+    def distinct_values(self, slot: str, constraints: dict) -> Set:
+        """ Returns the distinct values of a slot among the entities meeting the constraints
+
+        Args:
+            slot (str): slot to collect the values of
+            constraints (dict): Slot-value mapping of constraints
+        """
+        normalized = self._normalize_constraints(constraints)
+        index = self._get_index([slot] + [constrained_slot for constrained_slot, _ in normalized]) \
+            if OPEN_AT_SLOT not in constraints else None
+        if index is None:
+            return {entity[slot] for entity in self.find_entities(constraints, [slot])}
+        return index.distinct_values(slot, index.match(normalized))
+
+    def discriminable(self, constraints: dict, slots: Iterable[str] = None) -> bool:
+        """ Returns `True` if the entities meeting the constraints could be told apart by more information
+            from the user, i.e. at least one of the slots has different values among them.
+
+        Args:
+            constraints (dict): Slot-value mapping of constraints
+            slots (Iterable[str]): slots to check (default: all informable slots except the primary key)
+        """
+        if slots is None:
+            slots = set(self.get_informable_slots()) - {self.get_primary_key()}
+        slots = list(slots)
+        normalized = self._normalize_constraints(constraints)
+        index = self._get_index(slots + [slot for slot, _ in normalized]) if OPEN_AT_SLOT not in constraints else None
+        if index is None:
+            entities = self.find_entities(constraints, slots)
+            return any(len({entity[slot] for entity in entities}) > 1 for slot in slots)
+        return index.discriminable(slots, index.match(normalized))
+
+    def get_cache_stats(self):
+        """
+        Returns:
+            Statistics of the `find_entities` result cache (shared by all domain objects using the same database):
+            {'hits': number of results served from the cache, 'misses': number of database queries,
+             'size': number of cached results}
+        """
+        self._connect()
+        cache = self._result_cache
+        return {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache._results)}
+
+    def find_unindexed_queries(self, min_count: int = 1) -> List[Tuple[str, int, str]]:
+        """ Checks the query plans (`EXPLAIN QUERY PLAN`) of all constrained queries `find_entities` ran so far
+            and reports those which have to scan the whole table because no index matches their constraints
+            (see `composite_indexes` in the ontology).
+
+        Args:
+            min_count (int): only check queries which were run at least this many times
+
+        Returns:
+            List of (SQL statement, number of calls, query plan) of the un-indexed queries, most frequent first
+        """
+        unindexed = []
+        for (columns, predicates), count in self._query_counts.most_common():
+            if count < min_count:
+                break
+            if not predicates:
+                continue  # no constraints: nothing to look up
+            query = _select_sql(self.get_domain_name(), columns, predicates)
+            params = [''] * sum(num_values for _, num_values in predicates)
+            plan = [row['detail'] for row in self.query_db(f'EXPLAIN QUERY PLAN {query}', params)]
+            if any(step.startswith('SCAN') and 'INDEX' not in step for step in plan):
+                unindexed.append((query, count, '; '.join(plan)))
+        return unindexed
 
     def find_info_about_entity(self, entity_id, requested_slots: Iterable):
         """ Returns the values (stored in the data backend) of the specified slots for the
@@ -165,30 +888,29 @@ class JSONLookupDomain(Domain):
 
         """
         if requested_slots:
-            select_clause = ", ".join(sorted(requested_slots))
+            select_clause = ", ".join(self._column_sql(slot) for slot in sorted(requested_slots))
         # If the user hasn't specified any slots we don't know what they want so we give everything
         else:
             select_clause = "*"
-        query = 'SELECT {} FROM {} WHERE {}="{}";'.format(
-            select_clause, self.get_domain_name(), self.get_primary_key(), entity_id)
-        return self.query_db(query)
+            if self._has_review_table:
+                select_clause += ", " + self._column_sql('reviews')
+        query = 'SELECT {} FROM {} WHERE {}=?;'.format(
+            select_clause, self.get_domain_name(), self.get_primary_key())
+        return self.query_db(query, (entity_id,))
 
-    def query_db(self, query_str):
+    def query_db(self, query_str, params: Iterable = ()):
         """ Function for querying the sqlite3 db
 
         Args:
-            query_str (string): sqlite3 query style string
+            query_str (string): sqlite3 query style string, may contain `?` placeholders
+            params (Iterable): values bound to the placeholders
 
         Return:
             (iterable): rows of the query response set
         """
-        if "db" not in self.__dict__:
-            root_dir = self._get_root_dir()
-            sqllite_db_file = self.sqllite_db_file or os.path.join(
-                'resources', 'databases', self.name + '.db')
-            self.db = self._load_db_to_memory(root_dir + '/' + sqllite_db_file)
+        self._connect()
         cursor = self.db.cursor()
-        cursor.execute(query_str)
+        cursor.execute(query_str, tuple(params))
         res = cursor.fetchall()
         return res
     
@@ -202,8 +924,7 @@ class JSONLookupDomain(Domain):
         Returns:
             str: opening information
         """
-        opening_hours = self.query_db(f'SELECT opening_hours FROM {self.get_domain_name()} WHERE name="{name}"')[0]['opening_hours']
-        opening_hours = json.loads(opening_hours)
+        opening_hours = self._get_opening_hours_index().opening_hours[name]
         opening_info = opening_hours[req_openingday]
         if opening_info == 'Closed':
             opening_info = 'is closed'
@@ -221,7 +942,7 @@ class JSONLookupDomain(Domain):
         Returns:
             str: manner information
         """
-        manner = self.query_db(f'SELECT manner FROM {self.get_domain_name()} WHERE name="{name}"')[0]['manner']
+        manner = self.query_db(f'SELECT manner FROM {self.get_domain_name()} WHERE name=?', (name,))[0]['manner']
         manner = json.loads(manner)
         manner_info = 'Sorry, this information is not available for'
         for m in manner:
@@ -234,58 +955,182 @@ class JSONLookupDomain(Domain):
                 manner_info = f'Yes, {req_manner} is offered by'
         return manner_info
     
-    def modify_db(self, modify_str: str):
+    def modify_db(self, modify_str: str, params: Iterable = ()):
         """Function for mofiying a sqlite3 db
 
         Args:
-            modify_str (str): sqlite3 update style string
+            modify_str (str): sqlite3 update style string, may contain `?` placeholders
+            params (Iterable): values bound to the placeholders
         """
-        if "db" not in self.__dict__:
-            root_dir = self._get_root_dir()
-            sqllite_db_file = self.sqllite_db_file or os.path.join(
-                'resources', 'databases', self.name + '.db')
-            self.db = self._load_db_to_memory(root_dir + '/' + sqllite_db_file)
+        self._connect()
         cursor = self.db.cursor()
-        cursor.execute(modify_str)
+        cursor.execute(modify_str, tuple(params))
+        self._result_cache.clear()
+        if self.persist_changes:
+            self._get_journal().append(modify_str, params)
+
+    def _get_journal(self) -> _WriteBehindJournal:
+        """ Returns the journal of changes to this domain's database file (created on first use) """
+        with _memory_dbs_lock:
+            if self._db_file_path not in _journals:
+                _journals[self._db_file_path] = _WriteBehindJournal(self._db_file_path)
+            return _journals[self._db_file_path]
+
+    def flush_changes(self):
+        """ Blocks until all changes made via `modify_db` are written to the database file
+            (only relevant if `persist_changes` is set) """
+        if self._db_file_path in _journals:
+            _journals[self._db_file_path].flush()
 
     def enter_rating(self, given_rating: float, name: str):
-        """Compute the nwe rating given the current rating, number of reviews and the given rating and update the db
+        """Add the given rating to the aggregated ratings of a restaurant/bar (`rating_sum`, `rating_count`)
+           and update its average `rating` and `num_reviews` accordingly
 
         Args:
             given_rating (float): rating given by the user
             name (str): name of the restaurant/bar
         """
-        rating_num = self.query_db(f'SELECT rating, num_reviews FROM {self.get_domain_name()} WHERE name="{name}"')[0]
-        current_rating = float(rating_num['rating'])
-        num_reviews = int((rating_num['num_reviews']).replace(',', ''))
-        #num_reviews = int((rating_num['num_reviews']))
-        #print("(jslookup) rating_num:", rating_num, "current_rating:", current_rating, "num_reviews:", num_reviews)
-
-        new_rating = ((current_rating * num_reviews) + given_rating) / (num_reviews + 1)
-        new_rating = str(round(new_rating, 1))
-        #print("(jslookup) new_rating:", new_rating)
-        modify_str = f'UPDATE {self.get_domain_name()} SET rating="{new_rating}" WHERE name="{name}"'
-        self.modify_db(modify_str)
+        # the right-hand sides refer to the values before the update
+        modify_str = f"UPDATE {self.get_domain_name()} SET rating_sum=rating_sum+?1, rating_count=rating_count+1, " \
+                     f"rating=printf('%.1f', (rating_sum+?1)/(rating_count+1)), " \
+                     f"num_reviews=printf('%,d', rating_count+1) WHERE name=?2"
+        self.modify_db(modify_str, (given_rating, name))
 
     def enter_review(self, review: str, name: str):
-        """Add new review to the existing reviews and update the db
+        """Add a new review of a restaurant/bar to the `reviews` table
 
         Args:
             review (str): the given review
             name (str): name of the restaurant/bar
         """
-        reviews = self.query_db(f'SELECT reviews FROM {self.get_domain_name()} WHERE name="{name}"')[0]['reviews']
-        reviews = reviews.replace("'s", "’s")
-        reviews = reviews.replace("'", "\"")
-        #reviews = reviews.replace("'", "’")
-        reviews = json.loads(reviews)
-        reviews.append(review)
-        reviews = str(reviews)
-        modify_str = f'UPDATE {self.get_domain_name()} SET reviews="{reviews}" WHERE name="{name}"'
-        self.modify_db(modify_str)
+        self.modify_db('INSERT INTO reviews (name, review) VALUES (?, ?)', (name, review))
     
+    def _get_opening_hours_index(self) -> _OpeningHoursIndex:
+        """ Returns the index of the opening hours of the entities (built on first use) """
+        if '_opening_hours_index' not in self.__dict__:
+            key = self.get_primary_key()
+            self._connect()
+            rows = self.query_db(f'SELECT {key}, {"opening_hours" if self._has_opening_hours else "NULL"} '
+                                 f'AS opening_hours FROM {self.get_domain_name()}')
+            self._opening_hours_index = _OpeningHoursIndex(rows, key)
+        return self._opening_hours_index
+
+    def _open_at(self, time) -> Set:
+        """ Returns the primary keys of the entities open at a time
+
+        Args:
+            time: (weekday, time of day) with the time of day as minutes since midnight or as string
+                  (e.g. "18:30" or "6:30pm"), or 'now'
+        """
+        if time == 'now':
+            now = datetime.datetime.now()
+            day, minutes = WEEKDAYS[now.weekday()], now.hour * 60 + now.minute
+        else:
+            day, minutes = time
+            if isinstance(minutes, str):
+                minutes = _parse_time(minutes)
+        return self._get_opening_hours_index().open_at(day, minutes)
+
+    def _get_gazetteer(self) -> Gazetteer:
+        """ Returns the gazetteer selected by the ontology entry `gazetteer` (`None` if there is none) """
+        if 'gazetteer' not in self.ontology_json:
+            return None
+        gazetteer_file = os.path.join(self._get_root_dir(), 'resources', 'gazetteers',
+                                      self.ontology_json['gazetteer'] + '.json')
+        with _memory_dbs_lock:
+            if gazetteer_file not in _gazetteers:
+                _gazetteers[gazetteer_file] = Gazetteer(gazetteer_file)
+            return _gazetteers[gazetteer_file]
+
+    def _get_coordinates(self):
+        """ Returns the positions of the entities (primary key -> row) and their coordinates as an array
+            of (latitude, longitude), parsed once from the `coordinate` column (NaN where unknown) """
+        if '_coordinates' not in self.__dict__:
+            table = self.get_domain_name()
+            key = self.get_primary_key()
+            self._connect()
+            rows = self.query_db(f'SELECT {key}, {"coordinate" if self._has_coordinates else "NULL"} '
+                                 f'AS coordinate FROM {table}')
+            coordinates = numpy.full((len(rows), 2), numpy.nan)
+            for i, row in enumerate(rows):
+                if row['coordinate'] and row['coordinate'] != 'None':
+                    coordinates[i] = json.loads(row['coordinate'])
+            self._coordinates = ({row[key]: i for i, row in enumerate(rows)}, coordinates)
+        return self._coordinates
+
+    def _get_spatial_index(self) -> _SpatialIndex:
+        """ Returns the spatial index over the stored coordinates of the entities (built on first use) """
+        if '_spatial_index' not in self.__dict__:
+            self._spatial_index = _SpatialIndex(self._get_coordinates()[1].copy())
+        return self._spatial_index
+
+    def find_entities_near(self, lat: float, lon: float, radius_km: float = None, constraints: dict = None,
+                           k: int = None, requested_slots: Iterable = iter(())) -> List[dict]:
+        """ Returns the entities meeting the constraints nearest to a point, nearest first, with their
+            distance to the point (in km) as additional value `distance`.
+            Entities without stored coordinates are omitted.
+
+        Args:
+            lat (float): latitude of the point
+            lon (float): longitude of the point
+            radius_km (float): maximum distance (`None` for no limit)
+            constraints (dict): slot-value mapping of constraints (see `find_entities`)
+            k (int): maximum number of entities (`None` for no limit)
+            requested_slots (Iterable): slots returned in addition to the system requestable slots
+                                        and the primary key (see `find_entities`)
+
+        Returns:
+            List of entities
+        """
+        positions, distances = self._get_spatial_index().near(lat, lon, radius_km)
+        key = self.get_primary_key()
+        entities = {entity[key]: entity for entity in self.find_entities(constraints or {}, requested_slots)}
+        keys = list(self._get_coordinates()[0])
+        nearest = []
+        for position, distance in zip(positions, distances):
+            if k is not None and len(nearest) >= k:
+                break
+            entity = entities.get(keys[position])
+            if entity is not None:
+                entity['distance'] = float(distance)
+                nearest.append(entity)
+        return nearest
+
+    def _sort_by_distance(self, entities: List[dict], place) -> List[dict]:
+        """ Sorts entities by their distance to a place (name, address or (latitude, longitude)),
+            entities without coordinates last; unknown places leave the order unchanged """
+        if isinstance(place, str):
+            gazetteer = self._get_gazetteer()
+            place = gazetteer.resolve(place) if gazetteer else None
+        if place is None or not entities:
+            return entities
+        positions, coordinates = self._get_coordinates()
+        rows = numpy.array([positions.get(entity[self.get_primary_key()], -1) for entity in entities])
+        located = coordinates[rows] if len(coordinates) else numpy.full((len(rows), 2), numpy.nan)
+        located[rows < 0] = numpy.nan
+        distances = haversine(place[0], place[1], located[:, 0], located[:, 1])
+        return [entities[i] for i in numpy.argsort(distances, kind='stable')]
+
+    def _get_entity_coordinates(self, entity_id: str):
+        """ Returns the coordinates (latitude, longitude) of an entity; entities without stored coordinates
+            are resolved by their address via the gazetteer (`None` if they can't be resolved) """
+        positions, coordinates = self._get_coordinates()
+        if entity_id not in positions:
+            return None
+        position = positions[entity_id]
+        if numpy.isnan(coordinates[position, 0]):
+            gazetteer = self._get_gazetteer()
+            address = self.find_info_about_entity(entity_id, ['address'])[0]['address']
+            coordinate = gazetteer.resolve(address) if gazetteer and address else None
+            if coordinate is None:
+                return None
+            coordinates[position] = coordinate
+        return tuple(coordinates[position])
+
     def distance_duration(self, start_point: str, name: str, distance_manner: str):
-        """Calcualtes the distance and approximates the duration by bike between the start point and the address of the restaurant
+        """Calcualtes the distance and approximates the duration by bike between the start point and the address of the restaurant.
+           The start point is resolved via the domain's gazetteer and the distance is the great-circle distance,
+           so no network access is needed for known places.
 
         Args:
             start_point (str): given start point
@@ -294,31 +1139,12 @@ class JSONLookupDomain(Domain):
         Returns:
             str, str: distance, duration
         """
-        uni_pattern = re.compile("((i am )?at (the )?)?(uni|school|university|uni stuttgart|university of stuttgart)$")
-        schwabstr_pattern = re.compile("((i am )?at (the )?)?(schwabstr|schwabstraße|schwabstrasse)$")
-        hbf_pattern = re.compile("((i am )?at (the )?)?(stuttgart )?(hauptbahnhof|main station|central station|hbf|haupt( )?bf)$")
-
-        address = self.query_db(f'SELECT address FROM {self.get_domain_name()} WHERE name="{name}"')[0]['address']
-        if (uni_pattern.match(start_point)==None)==False:
-            start_point = 'Pfaffenwaldring 5, 70569 Stuttgart'
-        if (hbf_pattern.match(start_point)==None)==False:
-            start_point = 'Arnulf-Klett-Platz 2, 70173 Stuttgart'
-        if (schwabstr_pattern.match(start_point)==None)==False:
-            start_point = 'Schwabstraße 43, 70197 Stuttgart'
-        locator = Nominatim(user_agent="myGeocoder")
-        address_loc = locator.geocode(address)
-        try:
-            address_coordinates = (address_loc.latitude, address_loc.longitude)
-        except AttributeError:
-            address_coordinates = None
-        start_point_loc = locator.geocode(start_point)
-        try:
-            start_point_coordinates = (start_point_loc.latitude, start_point_loc.longitude)
-        except AttributeError:
-            start_point_coordinates = None
+        gazetteer = self._get_gazetteer()
+        start_point_coordinates = gazetteer.resolve(start_point) if gazetteer else None
+        address_coordinates = self._get_entity_coordinates(name)
         if address_coordinates is None or start_point_coordinates is None:
             return None, None
-        distance = geopy.distance.geodesic(start_point_coordinates, address_coordinates).km
+        distance = float(haversine(*start_point_coordinates, *address_coordinates))
         if distance_manner == 'by foot':
             # assumed by foot with average speed 6 km/h
             duration = math.ceil(10*distance)
@@ -17,7 +17,7 @@
 #
 ###############################################################################
 
-from typing import List, Iterable
+from typing import List, Iterable, Set
 from utils.domain.domain import Domain
 
 class LookupDomain(Domain):
@@ -40,6 +40,38 @@ class LookupDomain(Domain):
         """
         raise NotImplementedError
 
+    def count(self, constraints: dict) -> int:
+        """ Returns the number of entities meeting the constraints.
+            Override this function if the data backend can count without retrieving the entities.
+
+        Args:
+            constraints (dict): slot-value mapping of constraints
+        """
+        return len(self.find_entities(constraints))
+
+    def distinct_values(self, slot: str, constraints: dict) -> Set:
+        """ Returns the distinct values of a slot among the entities meeting the constraints.
+
+        Args:
+            slot (str): slot to collect the values of
+            constraints (dict): slot-value mapping of constraints
+        """
+        return {entity[slot] for entity in self.find_entities(constraints, [slot])}
+
+    def discriminable(self, constraints: dict, slots: Iterable[str] = None) -> bool:
+        """ Returns `True` if at least one of the slots has different values among the entities
+            meeting the constraints.
+
+        Args:
+            constraints (dict): slot-value mapping of constraints
+            slots (Iterable[str]): slots to check (default: all informable slots except the primary key)
+        """
+        if slots is None:
+            slots = set(self.get_informable_slots()) - {self.get_primary_key()}
+        slots = list(slots)
+        entities = self.find_entities(constraints, slots)
+        return any(len({entity[slot] for entity in entities}) > 1 for slot in slots)
+
     def find_info_about_entity(self, entity_id, requested_slots: Iterable):
         """ Returns the values (stored in the data backend) of the specified slots for the
             specified entity.